@@ -0,0 +1,141 @@
+import argparse
+import json
+import logging
+import random
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from src.minio.imaging import (estimate_image_tokens, load_image_rgb,
+                               transcode_image)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Benchmark")
+
+IMAGE_EXTENSIONS = ['*.png', '*.jpg', '*.jpeg', '*.webp', '*.bmp', '*.tiff']
+
+
+def synthetic_document(width: int = 4032, height: int = 3024, seed: int = 0) -> bytes:
+    """Phone-photo-sized JPEG of a text document with sensor-like noise"""
+    rng = random.Random(seed)
+    page = Image.new('RGB', (width, height), (244, 242, 236))
+    draw = ImageDraw.Draw(page)
+    draw.rectangle([width // 12, height // 16, width - width // 12, height // 7], fill=(30, 60, 120))
+    y = height // 5
+    while y < height - height // 8:
+        x = width // 10
+        while x < width - width // 10:
+            word = rng.randint(width // 60, width // 18)
+            draw.rectangle([x, y, x + word, y + height // 90], fill=(40, 40, 40))
+            x += word + width // 80
+        y += height // 30
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    page = Image.blend(page, noise, 0.12)
+    buffer = BytesIO()
+    page.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def benchmark_image(name: str, file_data: bytes) -> dict:
+    width, height = load_image_rgb(file_data).size
+    convert = not name.lower().endswith('.webp')
+    original, derivative = transcode_image(file_data, convert=convert, derivative=True)
+    original = original or file_data
+    derivative_size = Image.open(BytesIO(derivative)).size
+
+    original_tokens = estimate_image_tokens(width, height)
+    derivative_tokens = estimate_image_tokens(*derivative_size)
+    # Images travel base64-encoded inside the request body
+    original_b64 = 4 * ((len(original) + 2) // 3)
+    derivative_b64 = 4 * ((len(derivative) + 2) // 3)
+
+    return {
+        "image": name,
+        "upload_bytes": len(file_data),
+        "original_dimensions": [width, height],
+        "original_webp_bytes": len(original),
+        "derivative_dimensions": list(derivative_size),
+        "derivative_bytes": len(derivative),
+        "request_bytes_saved": original_b64 - derivative_b64,
+        "original_estimated_tokens": original_tokens,
+        "derivative_estimated_tokens": derivative_tokens,
+        "estimated_tokens_saved": original_tokens - derivative_tokens,
+    }
+
+
+def collect_images(dataset_path: str, synthetic: int):
+    images = []
+    dataset_dir = Path(dataset_path)
+    if dataset_dir.exists():
+        for ext in IMAGE_EXTENSIONS:
+            for path in sorted(dataset_dir.rglob(ext)):
+                images.append((str(path), path.read_bytes()))
+    for i in range(synthetic):
+        images.append((f"synthetic_{i}.jpg", synthetic_document(seed=i)))
+    return images
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Benchmarks the vision analysis image derivative")
+    parser.add_argument(
+        "-d", "--dataset",
+        type=str,
+        default="takehome-test-data",
+        help="Directory searched recursively for claim images"
+    )
+    parser.add_argument(
+        "-s", "--synthetic",
+        type=int,
+        default=3,
+        help="Number of synthetic 12 MP document photos to add"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="Optional path of a JSON report"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    images = collect_images(args.dataset, args.synthetic)
+    if not images:
+        logger.error("No images to benchmark")
+        return
+
+    results = []
+    for name, file_data in images:
+        result = benchmark_image(name, file_data)
+        results.append(result)
+        logger.info(
+            f"{name}: {result['original_dimensions']} -> {result['derivative_dimensions']}, "
+            f"{result['original_webp_bytes']} -> {result['derivative_bytes']} bytes, "
+            f"~{result['original_estimated_tokens']} -> ~{result['derivative_estimated_tokens']} tokens"
+        )
+
+    count = len(results)
+    summary = {
+        "images": count,
+        "average_request_bytes_saved": round(sum(r["request_bytes_saved"] for r in results) / count),
+        "average_estimated_tokens_saved": round(sum(r["estimated_tokens_saved"] for r in results) / count, 1),
+        "total_original_webp_bytes": sum(r["original_webp_bytes"] for r in results),
+        "total_derivative_bytes": sum(r["derivative_bytes"] for r in results),
+    }
+    logger.info(f"Average per image: {summary['average_request_bytes_saved']} request bytes and "
+                f"~{summary['average_estimated_tokens_saved']} image tokens saved ({count} images)")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({"summary": summary, "images": results}, f, indent=2)
+        logger.info(f"Results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import logging
+import random
+import re
+import timeit
+
+from src.agent.security_filter import (DEFAULT_DANGEROUS_PATTERNS,
+                                       DEFAULT_FUZZY_PATTERNS,
+                                       PromptInjectionFilter)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Benchmark")
+
+VOCABULARY = (
+    "i was admitted to the hospital on the morning of my flight with severe abdominal pain and "
+    "the doctor advised me not to travel please find attached the medical certificate signed by "
+    "the physician together with the booking confirmation my wife and daughter were also affected "
+    "we had to cancel the whole trip and would like to claim the full amount paid for the tickets"
+).split()
+
+
+class LegacyPromptInjectionFilter:
+    """Previous word x pattern implementation, kept here as the baseline"""
+
+    def __init__(self):
+        self.dangerous_patterns = [re.compile(p, re.IGNORECASE) for p in DEFAULT_DANGEROUS_PATTERNS]
+        self.fuzzy_patterns = list(DEFAULT_FUZZY_PATTERNS)
+
+    def detect_injection(self, text: str) -> bool:
+        if any(pattern.search(text) for pattern in self.dangerous_patterns):
+            return True
+        words = re.findall(r'\b\w+\b', text.lower())
+        for word in words:
+            for pattern in self.fuzzy_patterns:
+                if self._is_similar_word(word, pattern):
+                    return True
+        return False
+
+    def _is_similar_word(self, word: str, target: str) -> bool:
+        if len(word) != len(target) or len(word) < 3:
+            return False
+        return (word[0] == target[0] and
+                word[-1] == target[-1] and
+                sorted(word[1:-1]) == sorted(target[1:-1]))
+
+
+def claim_text(size_bytes: int, seed: int, injected: str = None) -> str:
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size_bytes:
+        word = rng.choice(VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    if injected:
+        words.insert(len(words) - 1, injected)
+    return " ".join(words)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Microbenchmark of the prompt injection filter")
+    parser.add_argument(
+        "-s", "--sizes",
+        type=int,
+        nargs="+",
+        default=[2_000, 8_000, 32_000, 128_000],
+        help="Claim text sizes in bytes"
+    )
+    parser.add_argument(
+        "-n", "--number",
+        type=int,
+        default=20,
+        help="Timed runs per text"
+    )
+    parser.add_argument(
+        "-p", "--extra-patterns",
+        type=int,
+        default=0,
+        help="Synthetic fuzzy patterns added to both filters, to show scaling with the pattern set"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    legacy = LegacyPromptInjectionFilter()
+    extra = [f"zq{i:04d}x" for i in range(args.extra_patterns)]
+    legacy.fuzzy_patterns += extra
+    compiled = PromptInjectionFilter(fuzzy_patterns=DEFAULT_FUZZY_PATTERNS + extra)
+
+    for size in args.sizes:
+        # Clean text is the worst case: every word has to be checked
+        for label, text in [("clean", claim_text(size, size)), ("misspelled", claim_text(size, size, "bpyass"))]:
+            assert legacy.detect_injection(text) == compiled.detect_injection(text)
+            legacy_s = timeit.timeit(lambda: legacy.detect_injection(text), number=args.number) / args.number
+            compiled_s = timeit.timeit(lambda: compiled.detect_injection(text), number=args.number) / args.number
+            logger.info(
+                f"{size:>7} bytes {label:<10}: legacy {legacy_s * 1e3:8.3f} ms, "
+                f"compiled {compiled_s * 1e3:8.3f} ms ({legacy_s / compiled_s:5.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image, ImageDraw
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Benchmark")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+VOCABULARY = (
+    "my flight was cancelled because i was admitted to hospital the doctor signed a certificate "
+    "and i am asking for a refund of the booking including taxes and the hotel nights"
+).split()
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies, errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1e3, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1e3, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1e3, 1) if latencies else None,
+        "max_ms": round(max(latencies) * 1e3, 1) if latencies else None,
+    }
+
+
+def synthetic_text(size_bytes: int, rng: random.Random) -> bytes:
+    words = []
+    length = 0
+    while length < size_bytes:
+        word = rng.choice(VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).encode("utf-8")[:size_bytes]
+
+
+def synthetic_image(width: int, height: int, rng: random.Random) -> bytes:
+    page = Image.new('RGB', (width, height), (244, 242, 236))
+    draw = ImageDraw.Draw(page)
+    for y in range(height // 8, height - height // 8, max(1, height // 30)):
+        draw.rectangle([width // 10, y, width // 10 + rng.randint(width // 4, width * 3 // 4), y + max(1, height // 90)], fill=(40, 40, 40))
+    buffer = BytesIO()
+    page.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def make_claims(count: int, text_bytes: int, metadata_bytes: int, image_size, image_ratio: float, seed: int):
+    rng = random.Random(seed)
+    # A few distinct images are enough, encoding one per claim would dominate the setup
+    images = [synthetic_image(*image_size, rng) for _ in range(4)] if image_size[0] > 0 else []
+    claims = []
+    for i in range(count):
+        files = {
+            "claim_message": ("description.txt", synthetic_text(text_bytes, rng), "text/plain"),
+            "claim_metadata": ("metadata.md", synthetic_text(metadata_bytes, rng), "text/markdown"),
+        }
+        if images and rng.random() < image_ratio:
+            files["claim_image"] = ("scan.jpg", images[i % len(images)], "image/jpeg")
+        claims.append(files)
+    return claims
+
+
+def _process_tree(pid: int):
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return pids
+
+
+def _usage(pid: int):
+    """(CPU seconds, RSS bytes) of a process and its children, e.g. the image transcoder workers"""
+    cpu = 0.0
+    rss = 0
+    for child in _process_tree(pid):
+        try:
+            with open(f"/proc/{child}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except FileNotFoundError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_SIZE
+    return cpu, rss
+
+
+class ResourceSampler:
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, _usage(self.pid)[1])
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_rss = 0
+        self._cpu_start, _ = _usage(self.pid)
+        self._wall_start = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        cpu, rss = _usage(self.pid)
+        wall = time.perf_counter() - self._wall_start
+        return {
+            "cpu_seconds": round(cpu - self._cpu_start, 2),
+            "cpu_percent": round(100 * (cpu - self._cpu_start) / wall, 1) if wall else None,
+            "peak_rss_mb": round(max(self.peak_rss, rss) / 1024 / 1024, 1),
+        }
+
+
+async def submit_claims(client: httpx.AsyncClient, claims, concurrency: int, wait: bool):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    submitted = []
+
+    async def submit(files):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/claims", files=files, params={"wait": "true"} if wait else None)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+                submitted.append((response.json()["claim_id"], start))
+            except Exception as e:
+                errors += 1
+                logger.debug(f"POST /claims failed: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(submit(files) for files in claims))
+    return submitted, latency_summary(latencies, errors, time.perf_counter() - start)
+
+
+async def wait_for_claims(client: httpx.AsyncClient, submitted, poll_interval: float, timeout: float):
+    """Poll GET /claims/{id} until every claim is DONE or FAILED; also measures the poll latency"""
+    poll_latencies = []
+    end_to_end = []
+    errors = 0
+    failed = 0
+
+    async def wait(claim_id, submitted_at):
+        nonlocal errors, failed
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(f"/claims/{claim_id}")
+                response.raise_for_status()
+            except Exception:
+                errors += 1
+                await asyncio.sleep(poll_interval)
+                continue
+            poll_latencies.append(time.perf_counter() - start)
+            status = response.json()["status"]
+            if status in ("DONE", "FAILED"):
+                failed += status == "FAILED"
+                end_to_end.append(time.perf_counter() - submitted_at)
+                return
+            await asyncio.sleep(poll_interval)
+        errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(wait(claim_id, submitted_at) for claim_id, submitted_at in submitted))
+    elapsed = time.perf_counter() - start
+    return latency_summary(poll_latencies, errors, elapsed), {**latency_summary(end_to_end, 0, elapsed), "failed": failed}
+
+
+async def read_claims(client: httpx.AsyncClient, claim_ids, requests: int, concurrency: int, seed: int):
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {"GET /claims/{id}": ([], 0), "GET /claims": ([], 0)}
+
+    async def read(path, name):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                response.raise_for_status()
+                results[name][0].append(time.perf_counter() - start)
+            except Exception:
+                results[name] = (results[name][0], results[name][1] + 1)
+
+    reads = []
+    for i in range(requests):
+        if i % 10 == 0:
+            reads.append(read("/claims?limit=100", "GET /claims"))
+        else:
+            reads.append(read(f"/claims/{rng.choice(claim_ids)}", "GET /claims/{id}"))
+    start = time.perf_counter()
+    await asyncio.gather(*reads)
+    elapsed = time.perf_counter() - start
+    return {name: latency_summary(latencies, errors, elapsed) for name, (latencies, errors) in results.items()}
+
+
+async def run_level(api_url: str, api_pid, claims, concurrency: int, args) -> dict:
+    sampler = ResourceSampler(api_pid) if api_pid else None
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout, limits=limits) as client:
+        if sampler:
+            sampler.start()
+        start = time.perf_counter()
+        submitted, post = await submit_claims(client, claims, concurrency, args.wait)
+        polls, end_to_end = await wait_for_claims(client, submitted, args.poll_interval, args.timeout) if not args.wait else ({}, {})
+        elapsed = time.perf_counter() - start
+        reads = await read_claims(client, [c for c, _ in submitted], args.reads, concurrency, args.seed) if submitted else {}
+        resources = await sampler.stop() if sampler else {}
+        # Server-side per-stage histograms, cumulative since the API started
+        stages = (await client.get("/metrics/summary")).json().get("stage_duration_seconds", {})
+
+    return {
+        "concurrency": concurrency,
+        "claims": len(claims),
+        "claims_per_second": round(len(submitted) / elapsed, 2) if elapsed else None,
+        "POST /claims": post,
+        "end_to_end": end_to_end,
+        "GET /claims/{id} (polling)": polls,
+        **reads,
+        "resources": resources,
+        "stages": stages,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_http(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up in {timeout}s")
+
+
+def start_services(args):
+    processes = []
+    stub_port = _free_port()
+    stub = subprocess.Popen([
+        sys.executable, "-m", "scripts.openai_stub",
+        "--port", str(stub_port),
+        "--latency", str(args.model_latency),
+        "--per-token-latency", str(args.per_token_latency),
+        "--completion-tokens", str(args.completion_tokens),
+        *(["--no-vision"] if args.no_vision else []),
+    ])
+    processes.append(stub)
+    _wait_for_http(f"http://127.0.0.1:{stub_port}/docs", stub)
+
+    api_port = _free_port()
+    env = {
+        **os.environ,
+        "HOST": "127.0.0.1",
+        "PORT": str(api_port),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENAI_API_KEY": "stub",
+        "OBJECT_STORE_BACKEND": args.object_store,
+        "VISION_CACHE_ENABLED": "false",
+        "LLM_CASSETTE_MODE": "off",
+        "LANGSMITH_TRACING": "false",
+    }
+    api = subprocess.Popen([sys.executable, "-m", "scripts.serve"], env=env, stdout=subprocess.DEVNULL)
+    processes.append(api)
+    _wait_for_http(f"http://127.0.0.1:{api_port}/", api)
+    return f"http://127.0.0.1:{api_port}", api.pid, processes
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Load test of the claims API against a local OpenAI stub, object store and Postgres")
+    parser.add_argument("-n", "--claims", type=int, default=100, help="Claims submitted per concurrency level")
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent clients")
+    parser.add_argument("--text-bytes", type=int, default=2_000, help="Size of each claim message")
+    parser.add_argument("--metadata-bytes", type=int, default=8_000, help="Size of each metadata file")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[2000, 1500], help="Width and height of the claim images, 0 0 for none")
+    parser.add_argument("--image-ratio", type=float, default=0.8, help="Fraction of claims with an image")
+    parser.add_argument("--reads", type=int, default=500, help="Read requests after each level (1 in 10 lists claims)")
+    parser.add_argument("--wait", action="store_true", help="Submit with ?wait=true instead of polling")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Stub seconds per model call")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="Stub extra seconds per completion token")
+    parser.add_argument("--completion-tokens", type=int, default=60, help="Stub completion tokens per answer")
+    parser.add_argument("--no-vision", action="store_true", help="Stub agent decides without calling analyze_document")
+    parser.add_argument("--object-store", type=str, default="memory", choices=["memory", "minio"], help="Object store of the started API")
+    parser.add_argument("--api-url", type=str, default=None, help="Benchmark an already running API instead of starting one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", type=str, default=None, help="Optional path of a JSON report")
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    claims = make_claims(args.claims, args.text_bytes, args.metadata_bytes, args.image_size, args.image_ratio, args.seed)
+    logger.info(f"Generated {len(claims)} synthetic claims ({sum('claim_image' in c for c in claims)} with image)")
+
+    processes = []
+    try:
+        if args.api_url:
+            api_url, api_pid = args.api_url, None
+        else:
+            api_url, api_pid, processes = start_services(args)
+            logger.info(f"API started at {api_url} (pid {api_pid}), Postgres from POSTGRES_* settings")
+
+        results = []
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_level(api_url, api_pid, claims, concurrency, args))
+            results.append(result)
+            post = result["POST /claims"]
+            end_to_end = result["end_to_end"]
+            logger.info(
+                f"concurrency {concurrency}: {result['claims_per_second']} claims/s, "
+                f"POST p50/p95/p99 {post['p50_ms']}/{post['p95_ms']}/{post['p99_ms']} ms ({post['errors']} errors)"
+                + (f", end-to-end p50/p99 {end_to_end['p50_ms']}/{end_to_end['p99_ms']} ms" if end_to_end else "")
+                + (f", CPU {result['resources']['cpu_percent']}%, peak RSS {result['resources']['peak_rss_mb']} MB" if result["resources"] else "")
+            )
+            for name in ("GET /claims/{id}", "GET /claims"):
+                if name in result:
+                    logger.info(f"  {name}: {result[name]['throughput_rps']} req/s, p50/p95/p99 "
+                                f"{result[name]['p50_ms']}/{result[name]['p95_ms']}/{result[name]['p99_ms']} ms")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        logger.info(f"Results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from openai import AsyncOpenAI
+
+from src.utils.rate_limiter import (ModelRateLimiter, model_lane,
+                                    rate_limited_async_http_client)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Benchmark")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("openai").setLevel(logging.WARNING)
+logging.getLogger("src.utils.rate_limiter").setLevel(logging.ERROR)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+def start_stub(args) -> tuple:
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "scripts.openai_stub",
+        "--port", str(port),
+        "--latency", str(args.model_latency),
+        "--rpm", str(args.stub_rpm),
+        "--max-concurrency", str(args.stub_max_concurrency),
+        "--throttle-rate", str(args.stub_throttle_rate),
+    ])
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{url}/stats", timeout=1)
+            return url, process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise TimeoutError("OpenAI stub did not come up")
+
+
+async def _call(client: AsyncOpenAI, lane: str, results: list):
+    start = time.perf_counter()
+    with model_lane(lane):
+        try:
+            await client.responses.create(model="gpt-5-mini", input="Summarize the claim in one sentence.")
+            ok = True
+        except Exception:
+            ok = False
+    results.append((lane, ok, time.perf_counter() - start))
+
+
+async def run_mode(mode: str, args, stub_url: str) -> dict:
+    """A burst of batch calls, with interactive calls arriving at a steady pace while it drains"""
+    limiter = None
+    if mode == "limiter":
+        limiter = ModelRateLimiter(
+            rpm=args.limiter_rpm, initial_concurrency=args.initial_concurrency, max_concurrency=args.max_concurrency, enabled=True
+        )
+        client = AsyncOpenAI(base_url=f"{stub_url}/v1", api_key="stub", http_client=rate_limited_async_http_client(limiter), max_retries=0)
+    else:
+        client = AsyncOpenAI(base_url=f"{stub_url}/v1", api_key="stub")
+
+    before = httpx.get(f"{stub_url}/stats").json()
+    results = []
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(_call(client, "batch", results)) for _ in range(args.batch)]
+    for _ in range(args.interactive):
+        await asyncio.sleep(args.interactive_interval)
+        tasks.append(asyncio.create_task(_call(client, "interactive", results)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    after = httpx.get(f"{stub_url}/stats").json()
+    await client.close()
+
+    report = {"mode": mode, "seconds": round(elapsed, 2), "stub_429s": after["throttled"] - before["throttled"]}
+    for lane in ("interactive", "batch"):
+        latencies = [latency for l, ok, latency in results if l == lane and ok]
+        report[lane] = {
+            "calls": sum(1 for l, _, _ in results if l == lane),
+            "failed": sum(1 for l, ok, _ in results if l == lane and not ok),
+            "p50_s": _percentile(latencies, 0.5),
+            "p95_s": _percentile(latencies, 0.95),
+            "max_s": _percentile(latencies, 1.0),
+        }
+    if limiter is not None:
+        report["limiter"] = limiter.stats()
+    return report
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Model calls against an OpenAI stub that answers 429s, with the SDK retries or the shared rate limiter")
+    parser.add_argument("--batch", type=int, default=200, help="Batch lane calls started at once")
+    parser.add_argument("--interactive", type=int, default=20, help="Interactive lane calls arriving while the batch drains")
+    parser.add_argument("--interactive-interval", type=float, default=0.25, help="Seconds between interactive calls")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Stub seconds per call")
+    parser.add_argument("--stub-rpm", type=int, default=0, help="Stub requests per minute before 429s")
+    parser.add_argument("--stub-max-concurrency", type=int, default=16, help="Stub requests in flight before 429s")
+    parser.add_argument("--stub-throttle-rate", type=float, default=0.0, help="Fraction of stub answers that are random 429s")
+    parser.add_argument("--limiter-rpm", type=int, default=0, help="Requests per minute configured in the limiter")
+    parser.add_argument("--initial-concurrency", type=int, default=16)
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--modes", nargs="+", choices=["sdk", "limiter"], default=["sdk", "limiter"])
+    parser.add_argument("-o", "--output", type=str, default=None, help="Write the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    stub_url, stub = start_stub(args)
+    try:
+        reports = []
+        for mode in args.modes:
+            report = asyncio.run(run_mode(mode, args, stub_url))
+            reports.append(report)
+            logger.info(
+                f"{mode}: {report['seconds']}s, {report['stub_429s']} 429s from the stub | "
+                + " | ".join(
+                    f"{lane} p50 {report[lane]['p50_s']}s p95 {report[lane]['p95_s']}s, {report[lane]['failed']}/{report[lane]['calls']} failed"
+                    for lane in ("interactive", "batch")
+                )
+            )
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({"settings": vars(args), "runs": reports}, f, indent=2)
+        logger.info(f"Results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
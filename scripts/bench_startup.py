@@ -0,0 +1,147 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Benchmark")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import src.api.app; print(time.perf_counter() - start)"
+READY_LINE = "Application startup complete"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _summary(samples: list) -> dict:
+    return {
+        "runs": len(samples),
+        "median_s": round(statistics.median(samples), 3),
+        "min_s": round(min(samples), 3),
+        "max_s": round(max(samples), 3),
+    }
+
+
+def measure_import(runs: int, env: dict) -> dict:
+    """Seconds to import the app in a fresh interpreter, which is what every spawned worker pays"""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True)
+        samples.append(float(output.stdout.strip().splitlines()[-1]))
+    return _summary(samples)
+
+
+def _read_lines(stream, lines: queue.Queue):
+    for line in stream:
+        lines.put((time.perf_counter(), line))
+    lines.put((time.perf_counter(), None))
+
+
+def measure_serve(serve_module: str, workers: int, spawn: bool, env: dict, timeout: float) -> dict:
+    """Seconds from launching the server until the first request is answered and until every worker is up"""
+    port = _free_port()
+    command = [sys.executable, "-m", serve_module, "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+    if spawn:
+        command.append("--spawn")
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    lines = queue.Queue()
+    threading.Thread(target=_read_lines, args=(process.stdout, lines), daemon=True).start()
+
+    first_response = None
+    ready = []
+    try:
+        deadline = start + timeout
+        while len(ready) < workers or first_response is None:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"{workers} workers did not come up in {timeout}s")
+            if process.poll() is not None and lines.empty():
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                at, line = lines.get(timeout=0.05)
+                if line is not None and READY_LINE in line:
+                    ready.append(at - start)
+            except queue.Empty:
+                pass
+            if first_response is None:
+                try:
+                    httpx.get(f"http://127.0.0.1:{port}/", timeout=0.5)
+                    first_response = time.perf_counter() - start
+                except httpx.HTTPError:
+                    pass
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    return {
+        "workers": workers,
+        "mode": "spawn" if spawn else ("fork" if workers > 1 else "single"),
+        "first_response_s": round(first_response, 3),
+        "all_workers_ready_s": round(max(ready), 3),
+    }
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Startup time of the claims API: app import and time until all workers serve")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-interpreter imports to time")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1], help="Worker counts to start")
+    parser.add_argument("--modes", nargs="+", choices=["fork", "spawn"], default=["fork", "spawn"], help="How multi-worker servers are started")
+    parser.add_argument("--serve-module", type=str, default="scripts.serve", help="Module started with -m as the server")
+    parser.add_argument("--object-store", choices=["memory", "minio"], default="memory")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    env = {
+        **os.environ,
+        "OBJECT_STORE_BACKEND": args.object_store,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "unused"),
+        "LANGSMITH_TRACING": "false",
+    }
+
+    imports = measure_import(args.runs, env)
+    logger.info(f"import src.api.app: median {imports['median_s']}s (min {imports['min_s']}s, max {imports['max_s']}s over {imports['runs']} runs)")
+
+    servers = []
+    for workers in args.workers:
+        for mode in (["fork"] if workers == 1 else args.modes):
+            result = measure_serve(args.serve_module, workers, mode == "spawn", env, args.timeout)
+            servers.append(result)
+            logger.info(
+                f"{workers} worker(s), {result['mode']}: first response after {result['first_response_s']}s, "
+                f"all workers ready after {result['all_workers_ready_s']}s"
+            )
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({"settings": vars(args), "import": imports, "servers": servers}, f, indent=2)
+        logger.info(f"Results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+from PIL import Image
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Benchmark")
+
+# Same in-memory threshold Starlette uses before rolling an upload to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def write_fixtures(directory: Path, text_mb: float, image_width: int, image_height: int):
+    text_path = directory / "metadata.md"
+    with open(text_path, "wb") as f:
+        line = b"| booking | 2024-01-01 | 1234.56 EUR | passenger |\n"
+        for _ in range(int(text_mb * 1024 * 1024 / len(line))):
+            f.write(line)
+    image_path = directory / "scan.tiff"
+    Image.effect_noise((image_width, image_height), 40).convert("RGB").save(image_path, format="TIFF")
+    return text_path, image_path
+
+
+def _spooled_upload(path: Path, filename: str, content_type: str):
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, spool)
+    size = spool.tell()
+    spool.seek(0)
+    return UploadFile(spool, size=size, filename=filename, headers=Headers({"content-type": content_type}))
+
+
+async def run_uploads(concurrency: int, text_path: Path, image_path: Path) -> dict:
+    from src.minio.minio import delete_claim_files, upload_file_to_minio
+    from src.minio.transcoder import image_transcoder
+
+    await image_transcoder.start()
+    baseline = _peak_rss_mb(resource.RUSAGE_SELF)
+    claim_ids = [f"bench-{uuid.uuid4()}" for _ in range(concurrency)]
+    uploads = []
+    for claim_id in claim_ids:
+        uploads.append(upload_file_to_minio(_spooled_upload(text_path, "metadata.md", "text/markdown"), claim_id, "metadata.md"))
+        uploads.append(upload_file_to_minio(_spooled_upload(image_path, "scan.tiff", "image/tiff"), claim_id, "image.tiff"))
+    try:
+        await asyncio.gather(*uploads)
+        peak = _peak_rss_mb(resource.RUSAGE_SELF)
+    finally:
+        await asyncio.gather(*(delete_claim_files(claim_id) for claim_id in claim_ids))
+        # Wait for the pool so the worker processes are reaped and counted in RUSAGE_CHILDREN
+        await image_transcoder.stop(wait=True)
+    return {
+        "concurrency": concurrency,
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_rss_per_upload_mb": round((peak - baseline) / concurrency, 2),
+        "peak_worker_rss_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Measures peak RSS of concurrent claim uploads against the configured MinIO")
+    parser.add_argument(
+        "-c", "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Numbers of concurrent claims (text + image upload each) to measure"
+    )
+    parser.add_argument(
+        "--text-mb",
+        type=float,
+        default=8,
+        help="Size of the streamed text document"
+    )
+    parser.add_argument(
+        "--image-size",
+        type=int,
+        nargs=2,
+        default=[3000, 2000],
+        help="Width and height of the uncompressed TIFF scan"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="Optional path of a JSON report"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--fixtures", type=str, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+
+    if args.child:
+        # One measurement per process, since peak RSS never goes down
+        fixtures = Path(args.fixtures)
+        result = asyncio.run(run_uploads(args.concurrency[0], fixtures / "metadata.md", fixtures / "scan.tiff"))
+        print(json.dumps(result))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        text_path, image_path = write_fixtures(Path(directory), args.text_mb, *args.image_size)
+        logger.info(f"Fixtures: text {text_path.stat().st_size} bytes, image {image_path.stat().st_size} bytes")
+        for concurrency in args.concurrency:
+            output = subprocess.run(
+                [sys.executable, "-m", "scripts.bench_upload_memory", "--child", "-c", str(concurrency), "--fixtures", directory],
+                check=True, capture_output=True, text=True, env=os.environ.copy()
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            logger.info(
+                f"{concurrency} concurrent claims: peak RSS {result['peak_rss_mb']} MB "
+                f"(+{result['peak_rss_per_upload_mb']} MB per claim), workers {result['peak_worker_rss_mb']} MB"
+            )
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Evaluation")
 
+POLL_INTERVAL_SECONDS = 2.0
+POLL_TIMEOUT_SECONDS = 600.0
 
-async def process_claim(claim_dir: Path, claim_num: int, api_url: str):
+
+async def wait_for_decision(client: httpx.AsyncClient, api_url: str, claim_id: str):
+    deadline = time.time() + POLL_TIMEOUT_SECONDS
+    while True:
+        response = await client.get(f"{api_url}/claims/{claim_id}")
+        response.raise_for_status()
+        claim_status = response.json()
+        if claim_status["status"] == "DONE":
+            return claim_status
+        if claim_status["status"] == "FAILED":
+            raise RuntimeError(f"Claim {claim_id} failed: {claim_status.get('error')}")
+        if time.time() > deadline:
+            raise TimeoutError(f"Claim {claim_id} still {claim_status['status']} after {POLL_TIMEOUT_SECONDS}s")
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+async def process_claim(claim_dir: Path, claim_num: int, api_url: str, priority: str = "batch"):
     try:
         start_time = time.time()
         
@@ -51,9 +69,9 @@ async def process_claim(claim_dir: Path, claim_num: int, api_url: str):
             logger.info(f"Claim {claim_num}: Submitting without image")
         
         async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(f"{api_url}/claims", files=files)
+            response = await client.post(f"{api_url}/claims", files=files, params={"priority": priority})
             response.raise_for_status()
-            api_response = response.json()
+            api_response = await wait_for_decision(client, api_url, response.json()["claim_id"])
         
         execution_time = time.time() - start_time
         
@@ -108,7 +126,7 @@ async def process_claim(claim_dir: Path, claim_num: int, api_url: str):
         }
 
 
-async def evaluate_dataset(dataset_path: str, output_path: str, api_url: str):
+async def evaluate_dataset(dataset_path: str, output_path: str, api_url: str, priority: str = "batch"):
     dataset_dir = Path(dataset_path)
     
     if not dataset_dir.exists():
@@ -123,7 +141,7 @@ async def evaluate_dataset(dataset_path: str, output_path: str, api_url: str):
     for i in range(1, 26):
         claim_dir = dataset_dir / f"claim {i}"
         if claim_dir.exists():
-            tasks.append(process_claim(claim_dir, i, api_url))
+            tasks.append(process_claim(claim_dir, i, api_url, priority))
         else:
             logger.warning(f"Claim directory not found: {claim_dir}")
     
@@ -142,6 +160,16 @@ async def evaluate_dataset(dataset_path: str, output_path: str, api_url: str):
     explanation_scores = [r.get('explanation_score') for r in results if r.get('explanation_score') is not None]
     avg_explanation_score = sum(explanation_scores) / len(explanation_scores) if explanation_scores else None
     
+    # Share of the claims the rules pre-screen decided without the agent (counted since the API started)
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(f"{api_url}/prescreen/stats")
+            response.raise_for_status()
+            prescreen = response.json()
+    except Exception as e:
+        logger.warning(f"Could not read pre-screen stats: {e}")
+        prescreen = None
+    
     # Create summary statistics
     summary = {
         "summary": {
@@ -150,7 +178,8 @@ async def evaluate_dataset(dataset_path: str, output_path: str, api_url: str):
             "total_claims": total_claims,
             "average_execution_time_seconds": round(avg_execution_time, 2),
             "average_explanation_score": round(avg_explanation_score, 2) if avg_explanation_score is not None else None,
-            "explanation_scores_evaluated": len(explanation_scores)
+            "explanation_scores_evaluated": len(explanation_scores),
+            "prescreen": prescreen
         }
     }
     
@@ -159,6 +188,8 @@ async def evaluate_dataset(dataset_path: str, output_path: str, api_url: str):
     logger.info(f"Average execution time: {avg_execution_time:.2f}s")
     if avg_explanation_score is not None:
         logger.info(f"Average explanation score: {avg_explanation_score:.2f} ({len(explanation_scores)} evaluated)")
+    if prescreen and prescreen.get("screened"):
+        logger.info(f"Pre-screen short-circuited: {prescreen['short_circuited']}/{prescreen['screened']} claims {prescreen['by_rule']}")
     
     output_dir = Path(output_path)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -196,12 +227,19 @@ def get_arguments():
         default="http://localhost:8000",
         help="API base URL"
     )
+    parser.add_argument(
+        "-p", "--priority",
+        type=str,
+        choices=["interactive", "batch"],
+        default="batch",
+        help="Model rate limiter lane of the evaluated claims"
+    )
     return parser.parse_args()
 
 
 def main():
     args = get_arguments()
-    asyncio.run(evaluate_dataset(args.dataset, args.output_dir, args.api_url))
+    asyncio.run(evaluate_dataset(args.dataset, args.output_dir, args.api_url, args.priority))
 
 
 if __name__ == "__main__":
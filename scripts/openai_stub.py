@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("OpenAIStub")
+
+DECISIONS = ["APPROVE", "DENY", "UNCERTAIN"]
+FILLER = "the document shows a hospital letterhead signature and dates consistent with the claim".split()
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _filler(tokens: int) -> str:
+    return " ".join(FILLER[i % len(FILLER)] for i in range(tokens))
+
+
+class Throttle:
+    """
+    Answers 429 like the API under load: beyond rpm requests per minute (token bucket, with a
+    retry-after-ms header), beyond max_concurrency requests in flight, or at random with probability rate.
+    """
+
+    def __init__(self, rpm: int = 0, max_concurrency: int = 0, rate: float = 0.0, rng: random.Random = None):
+        self.rpm = rpm
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.rng = rng or random.Random()
+        self.level = float(rpm)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.served = 0
+        self.throttled = 0
+
+    def _rejection(self):
+        """False to serve the request, else the seconds to send as retry-after-ms (None for no header)"""
+        if self.rate and self.rng.random() < self.rate:
+            return None
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return None
+        if self.rpm:
+            now = time.monotonic()
+            self.level = min(self.rpm, self.level + (now - self.updated) * self.rpm / 60)
+            self.updated = now
+            if self.level < 1:
+                return (1 - self.level) * 60 / self.rpm
+            self.level -= 1
+        return False
+
+    @contextmanager
+    def admit(self):
+        """Yields None when the request is served, else the 429 response to return"""
+        retry_after = self._rejection()
+        if retry_after is not False:
+            self.throttled += 1
+            headers = {"retry-after-ms": str(int(retry_after * 1000))} if retry_after is not None else {}
+            yield JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers=headers,
+            )
+            return
+        self.in_flight += 1
+        try:
+            yield None
+        finally:
+            self.in_flight -= 1
+            self.served += 1
+
+
+def create_app(
+    latency: float, per_token_latency: float, jitter: float, completion_tokens: int, vision: bool, seed: int,
+    throttle: Throttle = None
+) -> FastAPI:
+    """
+    OpenAI-compatible stand-in for load tests. The agent (chat completions) gets one
+    analyze_document call when vision is on, then a present_decision call; the vision and
+    judge queries (responses API) get filler text. Latency is latency + tokens * per_token_latency.
+    """
+    app = FastAPI(title="OpenAI stub")
+    rng = random.Random(seed)
+    throttle = throttle or Throttle()
+
+    @app.get("/stats")
+    async def stats():
+        return {"served": throttle.served, "throttled": throttle.throttled, "in_flight": throttle.in_flight}
+
+    async def _wait(tokens: int):
+        delay = latency + tokens * per_token_latency
+        if jitter:
+            delay *= 1 + rng.uniform(-jitter, jitter)
+        await asyncio.sleep(max(0.0, delay))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        with throttle.admit() as rejected:
+            return rejected or await _chat_completion(request)
+
+    async def _chat_completion(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = json.dumps(messages)
+        match = re.search(r"###CLAIM_ID###:\s*([\w-]+)", prompt)
+        claim_id = match.group(1) if match else "unknown"
+        called_tools = sum(1 for m in messages if m.get("role") == "tool")
+
+        if vision and called_tools == 0:
+            name, arguments = "analyze_document", {
+                "claim_id": claim_id,
+                "authenticity_query": "Is this medical document authentic?",
+                "extraction_query": "Patient name, dates and diagnosis",
+            }
+        else:
+            digest = int(hashlib.sha256(claim_id.encode()).hexdigest(), 16)
+            name, arguments = "present_decision", {
+                "decision": DECISIONS[digest % len(DECISIONS)],
+                "explanation": _filler(completion_tokens),
+            }
+        await _wait(completion_tokens)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-5-mini"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "tool_calls",
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{
+                        "id": f"call_{uuid.uuid4().hex[:24]}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(arguments)},
+                    }],
+                },
+            }],
+            "usage": {
+                "prompt_tokens": _tokens(prompt),
+                "completion_tokens": completion_tokens,
+                "total_tokens": _tokens(prompt) + completion_tokens,
+            },
+        }
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        with throttle.admit() as rejected:
+            return rejected or await _response(request)
+
+    async def _response(request: Request):
+        body = await request.json()
+        prompt = json.dumps(body.get("input", ""))
+        instructions = body.get("instructions") or ""
+        if "judge" in instructions.lower():
+            text = json.dumps({"score": 1.0, "reasoning": _filler(completion_tokens)})
+        else:
+            text = _filler(completion_tokens)
+        await _wait(completion_tokens)
+        prompt_tokens = _tokens(prompt) + _tokens(instructions)
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "gpt-5-mini"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": prompt_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": completion_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server with configurable latency and token counts")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="Base seconds per call")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="Extra seconds per completion token")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative uniform jitter on the latency")
+    parser.add_argument("--completion-tokens", type=int, default=60, help="Completion tokens per answer")
+    parser.add_argument("--no-vision", action="store_true", help="Let the agent decide without calling analyze_document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rpm", type=int, default=0, help="Answer 429 beyond this many requests per minute (0 for no limit)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="Answer 429 beyond this many requests in flight (0 for no limit)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered 429 at random")
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    throttle = Throttle(args.rpm, args.max_concurrency, args.throttle_rate, random.Random(args.seed))
+    app = create_app(args.latency, args.per_token_latency, args.jitter, args.completion_tokens, not args.no_vision, args.seed, throttle)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,131 @@
+import argparse
+import logging
 import os
+import signal
+import socket
+import time
 
 import uvicorn
 from dotenv import find_dotenv, load_dotenv
 
-from src.api.app import app
-from src.minio.client import MinIOClient
-
-# Load environment variables from .env file
+# Load environment variables from .env file, before the app reads its settings on import
 load_dotenv(find_dotenv())
 
+from src.api.app import app  # noqa: E402
+
+logger = logging.getLogger("Serve")
+
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+# Forked worker i also listens on API_WORKER_PORT_BASE + i, so each one's metrics, traces and stats can
+# be read directly (the shared port hands every request to an arbitrary worker); 0 disables
+API_WORKER_PORT_BASE = int(os.getenv("API_WORKER_PORT_BASE", 0))
+# A worker that dies sooner than this after starting is not restarted, to avoid a crash loop
+MIN_WORKER_UPTIME = 5.0
+
+
+def _run_worker(config: uvicorn.Config, sockets: list):
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def _bind_worker_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_forked(config: uvicorn.Config, workers: int, worker_port_base: int = 0):
+    """
+    Serve with worker processes forked from this one after the app is imported, sharing one
+    listening socket. Workers inherit the loaded modules instead of importing them again, so
+    they are ready as soon as their lifespan startup (database, object store) completes.
+
+    Each request on the shared socket goes to whichever worker accepts it, and metrics, traces
+    and stats are kept per worker; with worker_port_base, worker i also serves on its own port
+    worker_port_base + i (kept by a restarted worker), for Prometheus to scrape every worker.
+    """
+    sock = config.bind_socket()
+    worker_socks = [_bind_worker_socket(config.host, worker_port_base + i) for i in range(workers)] if worker_port_base else []
+    children = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            for other, worker_sock in enumerate(worker_socks):
+                if other != index:
+                    worker_sock.close()
+            try:
+                _run_worker(config, [sock] + worker_socks[index:index + 1])
+            finally:
+                os._exit(0)
+        children[pid] = (time.monotonic(), index)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        spawn(index)
+    logger.info(f"Started {workers} workers: {', '.join(str(pid) for pid in children)}")
+    if worker_socks:
+        logger.info(f"Worker ports: {worker_port_base} to {worker_port_base + workers - 1}")
+
+    exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started_at, index = children.pop(pid, (None, None))
+        if stopping or started_at is None:
+            continue
+        if time.monotonic() - started_at < MIN_WORKER_UPTIME:
+            logger.error(f"Worker {pid} exited during startup (status {status}), shutting down")
+            exit_code = 1
+            stop(signal.SIGTERM, None)
+        else:
+            logger.warning(f"Worker {pid} exited (status {status}), starting a new one")
+            spawn(index)
+    sock.close()
+    for worker_sock in worker_socks:
+        worker_sock.close()
+    return exit_code
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Run the claims API")
+    parser.add_argument("--host", type=str, default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Worker processes, 0 for one per CPU core (default API_WORKERS or 1)")
+    parser.add_argument("--spawn", action="store_true", help="Use uvicorn's process manager, where every worker imports the app itself")
+    parser.add_argument("--worker-port-base", type=int, default=API_WORKER_PORT_BASE, help="Forked worker i also listens on this port + i (default API_WORKER_PORT_BASE, 0 for none)")
+    return parser.parse_args()
+
 
 def main():
-    # Initialize Minio Client
-    MinIOClient()
-    
-    # Run the API server
-    uvicorn.run(
-        app,
-        host=os.getenv("HOST", "0.0.0.0"),
-        port=int(os.getenv("PORT", 8000)),
-        log_level="info"
-    )
+    args = get_arguments()
+    workers = args.workers or os.cpu_count() or 1
+
+    if workers == 1:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+    elif args.spawn:
+        uvicorn.run("src.api.app:app", host=args.host, port=args.port, workers=workers, log_level="info")
+    else:
+        config = uvicorn.Config(app, host=args.host, port=args.port, log_level="info")
+        raise SystemExit(serve_forked(config, workers, args.worker_port_base))
 
 
 if __name__ == "__main__":
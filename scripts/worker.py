@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import logging
+import signal
+
+from dotenv import find_dotenv, load_dotenv
+
+# Load environment variables from .env file, before the modules read their settings on import
+load_dotenv(find_dotenv())
+
+from src.api.queue_worker import (JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS,  # noqa: E402
+                                  WORKER_CONCURRENCY, QueueWorker)
+from src.postgreql import crud  # noqa: E402
+from src.postgreql.session import async_session, lifespan  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("Worker")
+
+
+async def requeue_dead(claim_ids: list):
+    async with lifespan():
+        async with async_session() as db:
+            requeued, conflicting = await crud.requeue_dead_claim_jobs(db, claim_ids or None)
+    logger.info(f"Requeued {len(requeued)} dead-lettered claims" + (f": {', '.join(requeued)}" if requeued else ""))
+    if conflicting:
+        logger.warning(f"Left dead, the same files were submitted again as another claim: {', '.join(conflicting)}")
+
+
+async def run_worker(args):
+    worker = QueueWorker(worker_id=args.worker_id, concurrency=args.concurrency, max_attempts=args.max_attempts)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+    async with lifespan():
+        await worker.run(drain_timeout=args.drain_timeout)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(description="Run claims from the Postgres job queue (CLAIM_QUEUE_BACKEND=postgres)")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Claims run at once by this worker")
+    parser.add_argument("--worker-id", type=str, default=None, help="Lease owner name (default host:pid:random)")
+    parser.add_argument("--max-attempts", type=int, default=JOB_MAX_ATTEMPTS, help="Attempts before a claim is dead-lettered")
+    parser.add_argument("--drain-timeout", type=float, default=JOB_LEASE_SECONDS, help="Seconds to let running claims finish on SIGTERM")
+    parser.add_argument("--requeue-dead", nargs="*", metavar="CLAIM_ID", default=None, help="Requeue dead-lettered claims (all if no id is given) and exit")
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    if args.requeue_dead is not None:
+        asyncio.run(requeue_dead(args.requeue_dead))
+    else:
+        asyncio.run(run_worker(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,22 @@
-import asyncio
 import logging
 import os
 import re
-from functools import partial
 
 from dotenv import find_dotenv, load_dotenv
 from langchain.agents import create_agent
-from langchain_core.messages import HumanMessage
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_openai import ChatOpenAI
 
+from src.utils.rate_limiter import (model_async_http_client, model_http_client,
+                                    model_rate_limiter)
 from src.utils.schemas import ClaimDecision, ClaimDecisionResponse
+from src.utils.tracing import span
+from src.utils.usage import counts_from_usage_metadata, record_usage
 
-from .agent_utils import get_client_claim
+from .agent_utils import (ClaimContext, aprefetch_claim_context, image_cache,
+                          release_claim_artifacts)
+from .prescreen import claim_prescreen
 from .prompt import PROMPT
 from .security_filter import OutputValidator, PromptInjectionFilter
 from .tools import tools
@@ -22,33 +28,89 @@ logger = logging.getLogger("src.agent")
 
 
 # Initialize the prompt injection filter
-prompt_injection_filter = PromptInjectionFilter()
+prompt_injection_filter = PromptInjectionFilter.from_config()
 
 # Initialize the output validator
 output_validator = OutputValidator()
 
 
+class TimingMiddleware(AgentMiddleware):
+    """Times every ReAct model step and tool call into the stage metrics and the claim trace"""
 
-# Create the React agent
-agent = create_agent(
-    model="gpt-5-mini",
-    tools=tools,
-    system_prompt=PROMPT
-)
+    async def awrap_model_call(self, request, handler):
+        with span("agent.model_call"):
+            return await handler(request)
 
-def _run_agent_sync(claim_id: str, client_claim: str) -> ClaimDecisionResponse:
-    # Check for prompt injection
-    if prompt_injection_filter.detect_injection(client_claim):
+    async def awrap_tool_call(self, request, handler):
+        with span(f"tool.{request.tool_call['name']}"):
+            return await handler(request)
+
+
+class UsageMiddleware(AgentMiddleware):
+    """Records the token usage of every ReAct model step for the claim being processed"""
+
+    async def awrap_model_call(self, request, handler):
+        response = await handler(request)
+        for message in response.result:
+            if isinstance(message, AIMessage):
+                model = message.response_metadata.get("model_name") or "gpt-5-mini"
+                record_usage("agent", model, counts_from_usage_metadata(message.usage_metadata))
+        return response
+
+
+_agent = None
+
+
+def get_agent():
+    """
+    The React agent, compiled on first use rather than on import; its HTTP clients go through
+    the shared model rate limiter and record or replay cassettes when LLM_CASSETTE_MODE is set
+    """
+    global _agent
+    if _agent is None:
+        _agent = create_agent(
+            model=ChatOpenAI(
+                model="gpt-5-mini",
+                http_client=model_http_client(),
+                http_async_client=model_async_http_client(),
+                max_retries=model_rate_limiter.client_max_retries
+            ),
+            tools=tools,
+            system_prompt=PROMPT,
+            middleware=[TimingMiddleware(), UsageMiddleware()]
+        )
+    return _agent
+
+
+def _build_claim_message(claim_id: str, context: ClaimContext) -> str:
+    # The policy is identical for every claim, so it goes first to keep the
+    # longest possible prompt prefix cacheable across claims
+    policy = context.policy or "MISSING - call get_policy(claim_reason)"
+    metadata = context.metadata or "MISSING - call get_metadata(claim_id)"
+    return (
+        f"###POLICY###:\n{policy}\n\n"
+        f"###CLAIM_ID###:{claim_id}\n"
+        f"###METADATA###:\n{metadata}\n\n"
+        f"###CLAIM###:\n{context.claim_text}"
+    )
+
+
+async def _run_agent_async(claim_id: str, context: ClaimContext, screened: bool = False) -> ClaimDecisionResponse:
+    # Check for prompt injection, unless the API already did before admitting the claim
+    if not screened and prompt_injection_filter.detect_injection(context.claim_text):
         return ClaimDecisionResponse(
             decision=ClaimDecision.DENY,
             explanation="Potential prompt injection detected"
         )
-    
-    client_claim_with_id = f"###CLAIM_ID###:{claim_id}\n###CLAIM###:\n{client_claim}"
+
+    # Clear-cut claims are decided by deterministic rules without running the agent
+    prescreened = await claim_prescreen.ascreen(claim_id, context)
+    if prescreened is not None:
+        return ClaimDecisionResponse(decision=prescreened.decision, explanation=prescreened.explanation)
     
     try:
-        response = agent.invoke(
-            {"messages": [HumanMessage(content=client_claim_with_id)]},
+        response = await get_agent().ainvoke(
+            {"messages": [HumanMessage(content=_build_claim_message(claim_id, context))]},
             {"recursion_limit": int(os.getenv("RECURSION_LIMIT", 20))}
         )
         
@@ -103,20 +165,21 @@ def _run_agent_sync(claim_id: str, client_claim: str) -> ClaimDecisionResponse:
         )
 
 
-async def run_agent_query(claim_id: str) -> ClaimDecisionResponse:
-    """Async wrapper to run agent query"""
+async def run_agent_query(claim_id: str, claim_text: str = None) -> ClaimDecisionResponse:
+    """
+    Run the agent on the event loop; model and tool calls are awaited, not offloaded to threads.
+    A claim_text passed in has already been validated and screened at submission, so it is
+    neither read back from storage nor filtered again.
+    """
     try:
-        loop = asyncio.get_event_loop()
-        client_claim = await loop.run_in_executor(None, get_client_claim, claim_id)
-        
-        result = await loop.run_in_executor(
-            None,
-            partial(_run_agent_sync, claim_id, client_claim)
-        )
-        return result
+        context = await aprefetch_claim_context(claim_id, claim_text)
+        return await _run_agent_async(claim_id, context, screened=claim_text is not None)
     except Exception as e:
         logger.error(f"Error in async agent processing: {str(e)}", exc_info=True)
         return ClaimDecisionResponse(
             decision=ClaimDecision.UNCERTAIN,
             explanation=f"Agent processing error: {str(e)}"
         )
+    finally:
+        release_claim_artifacts(claim_id)
+        logger.debug(f"Image cache stats: {image_cache.stats()}")
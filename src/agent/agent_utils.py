@@ -1,31 +1,53 @@
+import asyncio
 import logging
 import os
+from typing import NamedTuple, Optional
 
-from src.minio.minio import get_file_from_minio
+from src.minio.minio import (aget_claim_metadata, aget_image_from_minio,
+                             get_file_from_minio, run_in_storage_executor)
+from src.utils.cache import LRUCache
+from src.utils.tracing import timed
+from src.utils.vision_analyzer import image_data_url
+
+from .policy_index import policy_index
 
 logger = logging.getLogger("src.agent")
 
-def get_policy_document() -> str:
-    policy_path = os.path.join(
-        os.path.dirname(__file__),
-        "..",
-        "policy",
-        "policy.md"
-    )
-    
+
+class ClaimContext(NamedTuple):
+    claim_text: str
+    metadata: Optional[str]
+    policy: Optional[str]
+
+
+class ImageArtifact(NamedTuple):
+    image_bytes: bytes
+    data_url: str
+
+
+# Cached when a claim has no image, so repeated tool calls don't hit storage again
+_NO_IMAGE = ImageArtifact(b"", "")
+
+# Claim documents fetched and encoded once per agent run, shared by the vision tools
+image_cache = LRUCache(
+    max_entries=int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv("IMAGE_CACHE_TTL_SECONDS", 600)),
+    sizeof=lambda artifact: len(artifact.image_bytes) + len(artifact.data_url),
+)
+_image_fetches = {}
+
+def get_policy_document(claim_reason: Optional[str] = None) -> str:
     try:
-        with open(policy_path, "r", encoding="utf-8") as f:
-            policy_text = f.read()
+        policy_text = policy_index.render(claim_reason)
         logger.info(f"Policy document retrieved successfully ({len(policy_text)} characters)")
         return policy_text
-    except FileNotFoundError:
-        logger.error(f"Policy document not found at {policy_path}")
-        raise
     except Exception as e:
         logger.error(f"Error reading policy document: {e}")
         raise
 
 
+@timed("minio.get_client_claim")
 def get_client_claim(claim_id: str) -> str:
     try:
         object_path = f"{claim_id}/claim.txt"
@@ -38,3 +60,62 @@ def get_client_claim(claim_id: str) -> str:
     except Exception as e:
         logger.error(f"Error retrieving claim {claim_id}: {e}")
         raise
+
+
+async def aget_client_claim(claim_id: str) -> str:
+    return await run_in_storage_executor(get_client_claim, claim_id)
+
+
+async def _given(value):
+    return value
+
+
+@timed("agent.prefetch_context")
+async def aprefetch_claim_context(claim_id: str, claim_text: Optional[str] = None) -> ClaimContext:
+    """
+    Load everything the agent would otherwise request in its first turns.
+    The claim text is required and only read from storage when not passed in; a missing
+    metadata or policy section is left as None so the agent can still fetch it through its tools.
+    """
+    claim_text, metadata = await asyncio.gather(
+        aget_client_claim(claim_id) if claim_text is None else _given(claim_text),
+        aget_claim_metadata(claim_id),
+        return_exceptions=True
+    )
+    if isinstance(claim_text, BaseException):
+        raise claim_text
+    if isinstance(metadata, BaseException):
+        logger.warning(f"Metadata prefetch failed for claim {claim_id}: {metadata}")
+        metadata = None
+
+    try:
+        policy = get_policy_document()
+    except Exception as e:
+        logger.warning(f"Policy prefetch failed for claim {claim_id}: {e}")
+        policy = None
+
+    return ClaimContext(claim_text=claim_text, metadata=metadata, policy=policy)
+
+
+async def _fetch_image_artifact(claim_id: str) -> ImageArtifact:
+    image_bytes = await aget_image_from_minio(claim_id)
+    artifact = ImageArtifact(image_bytes, image_data_url(image_bytes)) if image_bytes else _NO_IMAGE
+    image_cache.set(claim_id, artifact)
+    return artifact
+
+
+async def aget_image_artifact(claim_id: str) -> Optional[ImageArtifact]:
+    artifact = image_cache.get(claim_id)
+    if artifact is None:
+        # Concurrent tool calls for the same claim share a single download
+        fetch = _image_fetches.get(claim_id)
+        if fetch is None:
+            fetch = asyncio.ensure_future(_fetch_image_artifact(claim_id))
+            _image_fetches[claim_id] = fetch
+            fetch.add_done_callback(lambda _: _image_fetches.pop(claim_id, None))
+        artifact = await asyncio.shield(fetch)
+    return artifact if artifact.image_bytes else None
+
+
+def release_claim_artifacts(claim_id: str) -> None:
+    image_cache.pop(claim_id)
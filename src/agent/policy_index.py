@@ -0,0 +1,174 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("src.agent")
+
+POLICY_PATH = os.path.join(os.path.dirname(__file__), "..", "policy", "policy.md")
+
+# Words too common in the policy to tell sections apart
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "claim", "cover", "covered",
+    "due", "during", "e", "eg", "for", "from", "g", "i", "if", "in", "is", "it", "may",
+    "my", "of", "on", "or", "our", "policy", "reason", "such", "the", "this", "to",
+    "travel", "trip", "was", "were", "with", "you", "your",
+}
+_LABEL_RE = re.compile(r"^\*\*(.+?):?\*\*:?\s*$")
+_BULLET_RE = re.compile(r"^\s*[-*]\s+(.*)$")
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _stem(word: str) -> str:
+    return re.sub(r"(izations?|ations?|ions?|ing|ed|es|s)$", "", word)[:6]
+
+
+def _terms(text: str) -> set:
+    return {_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS and len(w) > 2}
+
+
+class PolicySection(NamedTuple):
+    title: str
+    kind: str  # "coverage" or "exclusions"
+    text: str
+    fields: Dict[str, List[str]]  # bullet lists keyed by their bold label, lowercased
+    terms: set
+
+    @property
+    def covered_reasons(self) -> List[str]:
+        return self.fields.get("examples of covered reasons", [])
+
+    @property
+    def requirements(self) -> List[str]:
+        return self.fields.get("what's required", [])
+
+
+def _parse_fields(lines: List[str]) -> Dict[str, List[str]]:
+    fields = {}
+    label = None
+    for line in lines:
+        label_match = _LABEL_RE.match(line.strip())
+        if label_match:
+            label = label_match.group(1).strip().lower()
+            fields[label] = []
+            continue
+        bullet_match = _BULLET_RE.match(line)
+        if bullet_match and label is not None:
+            fields[label].append(bullet_match.group(1).strip())
+    return fields
+
+
+def _make_section(title: str, kind: str, lines: List[str]) -> PolicySection:
+    body = "\n".join(lines).strip().strip("-").strip()
+    fields = _parse_fields(lines)
+    if kind == "exclusions":
+        fields["exclusions"] = [m.group(1).strip() for m in map(_BULLET_RE.match, lines) if m]
+    return PolicySection(title=title, kind=kind, text=body, fields=fields, terms=_terms(f"{title}\n{body}"))
+
+
+def parse_policy(text: str):
+    """Split policy markdown into (document title, sections) using its heading structure"""
+    title = ""
+    group = ""
+    sections = []
+    current_title, current_kind, current_lines = None, None, []
+
+    def flush():
+        if current_title is not None and "\n".join(current_lines).strip(" \n-"):
+            sections.append(_make_section(current_title, current_kind, current_lines))
+
+    for line in text.splitlines():
+        if line.startswith("# "):
+            title = line[2:].strip()
+        elif line.startswith("## "):
+            flush()
+            group = line[3:].strip()
+            is_exclusion = "not covered" in group.lower()
+            current_title = group if is_exclusion else None
+            current_kind = "exclusions" if is_exclusion else None
+            current_lines = []
+        elif line.startswith("### "):
+            flush()
+            current_title, current_kind, current_lines = line[4:].strip(), "coverage", []
+        elif current_title is not None:
+            current_lines.append(line)
+    flush()
+    return title, sections
+
+
+class PolicyIndex:
+    """In-memory, sectioned view of policy.md, re-parsed when the file's mtime changes"""
+
+    def __init__(self, path: str = POLICY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._text = ""
+        self._title = ""
+        self._sections = []
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            logger.error(f"Policy document not found at {self.path}")
+            raise
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                text = f.read()
+            self._title, self._sections = parse_policy(text)
+            self._text = text
+            self._mtime = mtime
+            logger.info(f"Policy document loaded ({len(text)} characters, {len(self._sections)} sections)")
+
+    @property
+    def text(self) -> str:
+        self._refresh()
+        return self._text
+
+    @property
+    def sections(self) -> List[PolicySection]:
+        self._refresh()
+        return self._sections
+
+    def coverage_sections(self) -> List[PolicySection]:
+        return [s for s in self.sections if s.kind == "coverage"]
+
+    def exclusions(self) -> List[PolicySection]:
+        return [s for s in self.sections if s.kind == "exclusions"]
+
+    def match(self, claim_reason: str) -> List[PolicySection]:
+        """Coverage sections sharing at least one significant term with the claim reason"""
+        terms = _terms(claim_reason)
+        return [s for s in self.coverage_sections() if terms & s.terms]
+
+    def render(self, claim_reason: Optional[str] = None) -> str:
+        """
+        Policy text scoped to a claim reason: the matching coverage sections plus all exclusions.
+        Falls back to the full document when no reason is given or nothing matches, since
+        deciding that a reason is not covered needs every coverage section.
+        """
+        if not claim_reason:
+            return self.text
+        matched = self.match(claim_reason)
+        if not matched:
+            return self.text
+
+        parts = [f"# {self._title}"] if self._title else []
+        for section in matched:
+            parts.append(f"### {section.title}\n\n{section.text}")
+        for section in self.exclusions():
+            parts.append(f"## {section.title}\n\n{section.text}")
+        omitted = [s.title for s in self.coverage_sections() if s not in matched]
+        if omitted:
+            parts.append(f"(Other coverage sections not relevant to '{claim_reason}': {'; '.join(omitted)})")
+        return "\n\n".join(parts)
+
+
+policy_index = PolicyIndex()
@@ -0,0 +1,274 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from src.utils.schemas import ClaimDecision
+from src.utils.tracing import span
+
+from .agent_utils import ClaimContext, aget_image_artifact
+
+logger = logging.getLogger("src.agent.prescreen")
+
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "true").lower() == "true"
+PRESCREEN_RULES = [
+    rule.strip() for rule in os.getenv("PRESCREEN_RULES", "uncovered_reason,date_contradiction,missing_document").split(",")
+    if rule.strip()
+]
+# "Late reporting" in policy.md: claims submitted more than this many days after the policy expired
+LATE_REPORTING_DAYS = int(os.getenv("PRESCREEN_LATE_REPORTING_DAYS", 30))
+
+# Reasons the policy names as not covered ("voluntary changes to your travel")
+UNCOVERED_REASON_PATTERNS = [
+    r"changed\s+my\s+mind",
+    r"change\s+of\s+(plans?|mind)",
+    r"changed\s+(my|our)\s+(travel\s+)?plans",
+    r"no\s+longer\s+(want|wish|interested|feel\s+like)",
+    r"(don'?t|do\s+not|didn'?t|did\s+not)\s+(want|feel\s+like)\s+to\s+(go|travel|fly)",
+    r"decided\s+(not\s+to\s+(go|travel|fly)|to\s+stay)",
+    r"(found|booked)\s+a\s+(cheaper|better)\s+(flight|deal|hotel|option|price)",
+    r"(prefer|rather)\s+(to\s+)?(go|travel|fly)\s+(another|a\s+different)",
+]
+# Parts of a message that only ask for the money back or close the letter
+REQUEST_PATTERNS = [
+    r"refund", r"reimburs", r"compensat", r"money\s+back", r"claim", r"cancel(l?ing)?\s+(my|our|the)\s+(booking|trip|flight|reservation)",
+    r"\bthank", r"regards", r"\bdear\b", r"\bhello\b", r"\bhi\b", r"\bplease\b",
+]
+# A voluntary change with a stated cause ("... because I got the flu", "... so we decided not to go") may
+# be a covered emergency, so any causal wording sends the claim to the agent
+CAUSE_PATTERNS = [
+    r"\bbecause\b", r"\bcause", r"\bdue\b", r"\bafter\b", r"\bsince\b", r"\bas\b", r"\bso\b", r"\bowing\b",
+    r"\bfollowing\b", r"\bresult", r"\btherefore\b", r"\bthus\b", r"\bwhen\b", r"\bbefore\b", r"\bwhile\b",
+    r"\breason", r"\bthanks\s+to\b",
+]
+# Anything that may be a covered reason sends the claim to the agent, even next to a voluntary change
+COVERED_REASON_PATTERNS = [
+    r"jury", r"court", r"summon", r"medic", r"hospital", r"doctor", r"physician", r"clinic", r"surgery",
+    r"\bill(ness)?\b", r"\bsick", r"injur", r"diagnos", r"pregnan", r"emergenc", r"accident", r"theft",
+    r"stole", r"robb", r"police", r"crim", r"\blost\b", r"damage", r"death", r"\bdied\b", r"funeral",
+    r"missed", r"delay", r"strike", r"cancell?ed", r"airline", r"storm", r"weather", r"flood", r"fire", r"burgl",
+    r"break[\s-]?in", r"broke", r"pass(ed)?\s+away", r"stroke", r"flu\b", r"fever", r"covid", r"virus", r"infect",
+    r"pain", r"birth", r"labou?r", r"family",
+]
+# The message is split into clauses, and only a message whose every clause is a voluntary change
+# or a request is decided; a clause saying anything else may describe what actually happened
+_CLAUSE_SPLIT_RE = re.compile(r"[.!?\n,;:()]+|\s+(?:and|but|then|-)\s+")
+
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+)}
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_ISO_DATE_RE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+_DAY_MONTH_RE = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+{_MONTH},?\s+(\d{{4}})\b")
+_MONTH_DAY_RE = re.compile(rf"\b{_MONTH}\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b")
+# "Label: value", "**Label:** value", "- Label: value" and two-cell table rows "| Label | value |"
+_FIELD_RE = re.compile(r"^[\s>|*-]*\**\s*([A-Za-z][A-Za-z ()/_'-]{1,60}?)\s*:?\**\s*[:|]\s*\**\s*(.+?)[\s|]*$")
+
+# Metadata labels naming each date the rules compare; a label matching several roles is ignored
+DATE_ROLES = {
+    "booking": ("booking date", "date of booking", "booked on", "date booked", "purchase date", "date of purchase",
+                "purchased on", "reservation date"),
+    "coverage_start": ("policy start", "coverage start", "cover start", "valid from", "effective date", "inception"),
+    "coverage_end": ("policy end", "coverage end", "cover end", "valid until", "valid to", "expiry", "expiration",
+                     "expires"),
+    "incident": ("incident date", "date of incident", "event date", "date of event", "date of loss", "accident date"),
+    "submission": ("claim date", "date of claim", "submission date", "submitted on", "date submitted", "filed on"),
+}
+
+
+class PrescreenResult(NamedTuple):
+    decision: ClaimDecision
+    explanation: str
+    rule: str
+
+
+def _valid_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        parsed = date(year, month, day)
+    except ValueError:
+        return None
+    return parsed if 1950 <= year <= 2100 else None
+
+
+def parse_date(text: str) -> Optional[Tuple[date, ...]]:
+    """
+    Every reading of the first date in text; numeric day/month dates whose order can't be
+    told apart (03/05/2024) have two, so rules only decide when both readings agree
+    """
+    lowered = text.lower()
+    match = _ISO_DATE_RE.search(lowered)
+    if match:
+        year, month, day = map(int, match.groups())
+        parsed = _valid_date(year, month, day)
+        return (parsed,) if parsed else None
+    match = _NUMERIC_DATE_RE.search(lowered)
+    if match:
+        first, second, year = map(int, match.groups())
+        readings = {d for d in (_valid_date(year, second, first), _valid_date(year, first, second)) if d}
+        return tuple(sorted(readings)) or None
+    match = _DAY_MONTH_RE.search(lowered)
+    if match:
+        parsed = _valid_date(int(match.group(3)), _MONTHS[match.group(2)[:3]], int(match.group(1)))
+        return (parsed,) if parsed else None
+    match = _MONTH_DAY_RE.search(lowered)
+    if match:
+        parsed = _valid_date(int(match.group(3)), _MONTHS[match.group(1)[:3]], int(match.group(2)))
+        return (parsed,) if parsed else None
+    return None
+
+
+def parse_metadata_dates(metadata: str) -> Dict[str, Tuple[date, ...]]:
+    """Dates of the metadata keyed by role; a role given more than once with different dates is dropped"""
+    dates = {}
+    conflicting = set()
+    for line in metadata.splitlines():
+        match = _FIELD_RE.match(line)
+        if not match:
+            continue
+        label = match.group(1).lower()
+        roles = [role for role, names in DATE_ROLES.items() if any(name in label for name in names)]
+        if len(roles) != 1:
+            continue
+        parsed = parse_date(match.group(2))
+        if parsed is None:
+            continue
+        role = roles[0]
+        if dates.get(role, parsed) != parsed:
+            conflicting.add(role)
+        dates[role] = parsed
+    for role in conflicting:
+        dates.pop(role)
+    return dates
+
+
+def _before(earlier: Tuple[date, ...], later: Tuple[date, ...], days: int = 0) -> bool:
+    """True only when every reading of earlier is more than days before every reading of later"""
+    return max(earlier) + timedelta(days=days) < min(later)
+
+
+class ClaimPrescreen:
+    """
+    Deterministic checks run before the agent, deciding the claims whose outcome doesn't
+    need the model: a message that only states a voluntary change, dates in the metadata
+    that put the claim outside the policy, or no supporting document at all. Everything
+    else, including any claim a rule can't read with certainty, goes to the agent.
+    """
+
+    def __init__(self, enabled: bool = PRESCREEN_ENABLED, rules=None):
+        self.enabled = enabled
+        self.rules = list(rules if rules is not None else PRESCREEN_RULES)
+        self._uncovered_re = re.compile("|".join(f"(?:{p})" for p in UNCOVERED_REASON_PATTERNS))
+        self._covered_re = re.compile("|".join(f"(?:{p})" for p in COVERED_REASON_PATTERNS))
+        self._request_re = re.compile("|".join(f"(?:{p})" for p in REQUEST_PATTERNS))
+        self._cause_re = re.compile("|".join(f"(?:{p})" for p in CAUSE_PATTERNS))
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.short_circuited = 0
+        self.by_rule = {rule: 0 for rule in self.rules}
+        self.seconds = 0.0
+
+    def uncovered_reason(self, context: ClaimContext) -> Optional[PrescreenResult]:
+        text = context.claim_text.lower()
+        match = self._uncovered_re.search(text)
+        if match is None or self._covered_re.search(text) or self._cause_re.search(text):
+            return None
+        for clause in _CLAUSE_SPLIT_RE.split(text):
+            if clause.strip() and not (self._uncovered_re.search(clause) or self._request_re.search(clause)):
+                return None
+        return PrescreenResult(
+            ClaimDecision.DENY,
+            f"The claim reason is a voluntary change to the travel plans ('{match.group(0)}'), which is not a "
+            "covered reason under the policy, so no document analysis is needed.",
+            "uncovered_reason",
+        )
+
+    def date_contradiction(self, context: ClaimContext) -> Optional[PrescreenResult]:
+        if not context.metadata:
+            return None
+        dates = parse_metadata_dates(context.metadata)
+        booking = dates.get("booking")
+        start = dates.get("coverage_start")
+        end = dates.get("coverage_end")
+        incident = dates.get("incident")
+        submission = dates.get("submission")
+
+        explanation = None
+        if incident and booking and _before(incident, booking):
+            explanation = (
+                f"The incident ({max(incident)}) happened before the trip was booked ({min(booking)}), so it was "
+                "known before purchase and is excluded by the policy (prior knowledge)."
+            )
+        elif incident and start and _before(incident, start):
+            explanation = f"The incident ({max(incident)}) happened before the coverage began ({min(start)}), outside the policy period."
+        elif incident and end and _before(end, incident):
+            explanation = f"The incident ({min(incident)}) happened after the coverage ended ({max(end)}), outside the policy period."
+        elif submission and end and _before(end, submission, LATE_REPORTING_DAYS):
+            explanation = (
+                f"The claim was submitted on {min(submission)}, more than {LATE_REPORTING_DAYS} days after the policy "
+                f"expired on {max(end)} (late reporting)."
+            )
+        if explanation is None:
+            return None
+        return PrescreenResult(ClaimDecision.DENY, explanation, "date_contradiction")
+
+    async def missing_document(self, claim_id: str) -> Optional[PrescreenResult]:
+        # The image is cached for the agent's document tools, so a claim that goes on doesn't fetch it twice
+        try:
+            artifact = await aget_image_artifact(claim_id)
+        except Exception as e:
+            logger.warning(f"Pre-screen could not check the document of claim {claim_id}: {e}")
+            return None
+        if artifact is not None:
+            return None
+        return PrescreenResult(
+            ClaimDecision.DENY,
+            "No supporting document was provided with the claim; the policy requires valid supporting "
+            "documentation (e.g. medical certificate, police report, jury summons), so the documentation is incomplete.",
+            "missing_document",
+        )
+
+    async def ascreen(self, claim_id: str, context: ClaimContext) -> Optional[PrescreenResult]:
+        """The decision for a clear-cut claim, or None when the agent has to decide"""
+        if not self.enabled:
+            return None
+        with span("agent.prescreen"):
+            start = time.perf_counter()
+            result = None
+            for rule in ("uncovered_reason", "date_contradiction"):
+                if rule in self.rules:
+                    result = getattr(self, rule)(context)
+                    if result is not None:
+                        break
+            # Timed apart from the storage round trip of the document check
+            elapsed = time.perf_counter() - start
+            if result is None and "missing_document" in self.rules:
+                result = await self.missing_document(claim_id)
+
+        with self._lock:
+            self.screened += 1
+            self.seconds += elapsed
+            if result is not None:
+                self.short_circuited += 1
+                self.by_rule[result.rule] = self.by_rule.get(result.rule, 0) + 1
+        if result is not None:
+            logger.info(f"Claim {claim_id} decided by the pre-screen ({result.rule}): {result.decision.value}")
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rules": self.rules,
+                "screened": self.screened,
+                "short_circuited": self.short_circuited,
+                "short_circuit_fraction": round(self.short_circuited / self.screened, 4) if self.screened else None,
+                "by_rule": dict(self.by_rule),
+                "avg_rule_microseconds": round(self.seconds / self.screened * 1e6, 1) if self.screened else None,
+            }
+
+
+claim_prescreen = ClaimPrescreen()
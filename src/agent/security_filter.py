@@ -1,43 +1,89 @@
+import json
+import os
 import re
 
 from dotenv import find_dotenv, load_dotenv
 
 load_dotenv(find_dotenv())
 
+DEFAULT_DANGEROUS_PATTERNS = [
+    r'ignore\s+(all\s+)?previous\s+instructions?',
+    r'you\s+are\s+now\s+(in\s+)?developer\s+mode',
+    r'system\s+override',
+    r'reveal\s+prompt',
+]
+
+DEFAULT_FUZZY_PATTERNS = [
+    'ignore', 'bypass', 'override', 'reveal', 'delete', 'system'
+]
+
+_WORD_RE = re.compile(r'\w+')
+
 
 class PromptInjectionFilter:
-    def __init__(self):
-        self.dangerous_patterns = [
-            re.compile(r'ignore\s+(all\s+)?previous\s+instructions?', re.IGNORECASE),
-            re.compile(r'you\s+are\s+now\s+(in\s+)?developer\s+mode', re.IGNORECASE),
-            re.compile(r'system\s+override', re.IGNORECASE),
-            re.compile(r'reveal\s+prompt', re.IGNORECASE),
-        ]
+    """
+    Detects prompt injection with one merged regex plus a fuzzy-word index.
 
-        # Fuzzy matching patterns
-        self.fuzzy_patterns = [
-            'ignore', 'bypass', 'override', 'reveal', 'delete', 'system'
-        ]
+    A word is a fuzzy match for a pattern when both have the same length (>= 3), the same
+    first and last letter, and the same letters in between in any order. Patterns are indexed
+    by (length, first, last) -> sorted middles, so each word costs one dict lookup and sorts
+    its middle only when that lookup hits.
+    """
+
+    def __init__(self, dangerous_patterns=None, fuzzy_patterns=None):
+        self.dangerous_patterns = list(dangerous_patterns if dangerous_patterns is not None else DEFAULT_DANGEROUS_PATTERNS)
+        self.fuzzy_patterns = [p.lower() for p in (fuzzy_patterns if fuzzy_patterns is not None else DEFAULT_FUZZY_PATTERNS)]
+
+        # IGNORECASE is several times slower than a plain search, so all-lowercase patterns run
+        # case-sensitively on the lowered text; patterns with uppercase escapes (\S, \W, ...) can't
+        lowered = [p for p in self.dangerous_patterns if p == p.lower()]
+        mixed = [p for p in self.dangerous_patterns if p != p.lower()]
+        self._lowered_re = self._merge(lowered)
+        self._dangerous_re = self._merge(mixed, re.IGNORECASE)
+        self._fuzzy_index = {}
+        for pattern in self.fuzzy_patterns:
+            if len(pattern) >= 3:
+                key = (len(pattern), pattern[0], pattern[-1])
+                self._fuzzy_index.setdefault(key, set()).add(''.join(sorted(pattern[1:-1])))
+
+    @staticmethod
+    def _merge(patterns, flags=0):
+        return re.compile('|'.join(f'(?:{p})' for p in patterns), flags) if patterns else None
+
+    @classmethod
+    def from_config(cls, path: str = None) -> "PromptInjectionFilter":
+        """
+        Build the filter from a JSON file with optional "dangerous_patterns" (regexes) and
+        "fuzzy_patterns" (words) lists; missing keys keep the defaults.
+        The path defaults to INJECTION_PATTERNS_FILE; without it the built-in patterns are used.
+        """
+        path = path or os.getenv("INJECTION_PATTERNS_FILE")
+        if not path:
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(
+            dangerous_patterns=config.get("dangerous_patterns"),
+            fuzzy_patterns=config.get("fuzzy_patterns")
+        )
 
     def detect_injection(self, text: str) -> bool:
         # Standard pattern matching
-        if any(pattern.search(text) for pattern in self.dangerous_patterns):
+        lowered = text.lower()
+        if self._lowered_re is not None and self._lowered_re.search(lowered):
+            return True
+        if self._dangerous_re is not None and self._dangerous_re.search(text):
             return True
 
         # Fuzzy matching for misspelled words
-        words = re.findall(r'\b\w+\b', text.lower())
-        for word in words:
-            for pattern in self.fuzzy_patterns:
-                if self._is_similar_word(word, pattern):
-                    return True
-        return False
-
-    def _is_similar_word(self, word: str, target: str) -> bool:
-        if len(word) != len(target) or len(word) < 3:
+        index = self._fuzzy_index
+        if not index:
             return False
-        return (word[0] == target[0] and
-                word[-1] == target[-1] and
-                sorted(word[1:-1]) == sorted(target[1:-1]))
+        for word in set(_WORD_RE.findall(lowered)):
+            middles = index.get((len(word), word[0], word[-1]))
+            if middles is not None and ''.join(sorted(word[1:-1])) in middles:
+                return True
+        return False
 
 class OutputValidator:
     def __init__(self):
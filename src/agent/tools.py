@@ -1,29 +1,36 @@
 from langchain_core.tools import tool
 
-from src.agent.agent_utils import get_policy_document
-from src.minio.minio import get_claim_metadata, get_image_from_minio
+from src.agent.agent_utils import aget_image_artifact, get_policy_document
+from src.minio.minio import aget_claim_metadata
 from src.utils.schemas import ClaimDecision, ClaimDecisionResponse
-from src.utils.vision_analyzer import query_image_forgery, query_image_ocr
+from src.utils.vision_analyzer import (aquery_document_analysis,
+                                      aquery_image_forgery, aquery_image_ocr)
 
 
 @tool(return_direct=False)
-def get_policy() -> str:
+def get_policy(claim_reason: str = "") -> str:
     """
-    Retrieve the CFSR insurance policy document to reference during claim analysis.
+    Retrieve the CFSR insurance policy to reference during claim analysis.
     This tool should be called early to understand policy coverage rules.
     
+    Args:
+        claim_reason: short description of why the client is claiming (e.g. "medical emergency",
+                      "jury duty", "lost luggage", "missed connection due to traffic accident").
+                      Leave empty to get the full policy.
+    
     Returns:
-        Full policy text including covered reasons, requirements, and exclusions
+        Policy sections relevant to the claim reason (covered reasons, requirements, payout)
+        plus all exclusions; the full policy text if no section matches
     """
     try:
-        policy_text = get_policy_document()
+        policy_text = get_policy_document(claim_reason or None)
         return policy_text
     except Exception as e:
         return f"Error retrieving policy: {str(e)}"
 
 
 @tool(return_direct=False)
-def get_metadata(claim_id: str) -> str:
+async def get_metadata(claim_id: str) -> str:
     """
     Retrieve claim metadata (booking details, dates, amounts, etc.) from storage.
     Should be called to get additional context about the claim.
@@ -35,7 +42,7 @@ def get_metadata(claim_id: str) -> str:
         Metadata content containing booking information and claim details
     """
     try:
-        metadata = get_claim_metadata(claim_id)
+        metadata = await aget_claim_metadata(claim_id)
         return metadata
     except Exception as e:
         return f"Error retrieving metadata for claim {claim_id}: {str(e)}"
@@ -57,7 +64,7 @@ def present_decision(decision: ClaimDecision, explanation: str) -> ClaimDecision
 
 
 @tool
-def get_info_from_image(claim_id: str, query: str) -> str:
+async def get_info_from_image(claim_id: str, query: str) -> str:
     """
     Extracts textual information from claim documents using OCR vision model.
     Use this tool to READ and EXTRACT information from documents.
@@ -77,16 +84,16 @@ def get_info_from_image(claim_id: str, query: str) -> str:
         Extracted information from the document based on the query
     """
     try:
-        image_bytes = get_image_from_minio(claim_id)
-        if image_bytes is None:
+        artifact = await aget_image_artifact(claim_id)
+        if artifact is None:
             return "No image document has been provided by the user for this claim."
-        image_info = query_image_ocr(image_bytes, query)
+        image_info = await aquery_image_ocr(artifact.data_url, query)
         return image_info
     except Exception as e:
         return f"Error retrieving/analyzing image for claim {claim_id}: {str(e)}"
 
 @tool
-def check_image_forgery(claim_id: str, query: str) -> str:
+async def check_image_forgery(claim_id: str, query: str) -> str:
     """
     Analyzes document authenticity and detects potential forgery or manipulation.
     Use this tool FIRST before extracting information to verify the document is legitimate.
@@ -123,16 +130,51 @@ def check_image_forgery(claim_id: str, query: str) -> str:
         Assessment of document authenticity: DEFINITIVE FRAUD, SUSPICIOUS, or LEGITIMATE with specific observations
     """
     try:
-        image_bytes = get_image_from_minio(claim_id)
-        if image_bytes is None:
+        artifact = await aget_image_artifact(claim_id)
+        if artifact is None:
             return "No image document has been provided by the user for this claim."
-        image_info = query_image_forgery(image_bytes, query)
+        image_info = await aquery_image_forgery(artifact.data_url, query)
         return image_info
     except Exception as e:
         return f"Error retrieving/analyzing image for claim {claim_id}: {str(e)}"
 
 
+@tool
+async def analyze_document(claim_id: str, authenticity_query: str, extraction_query: str) -> str:
+    """
+    Checks document authenticity AND extracts its information in a single step.
+    Both analyses run at the same time on the claim document, so prefer this tool over calling
+    check_image_forgery and get_info_from_image one after the other.
+    
+    Args:
+        claim_id: claim id that is being analyzed
+        authenticity_query: question about document authenticity WITH CONTEXT about the claim
+                            (same format as the check_image_forgery query), e.g.
+                            "Analyze for authenticity. Context: Medical emergency claim for hospitalization on 2023-08-13. Should be hospital admission/discharge certificate. Check: Is this plain text or official form? Any photoshopped stamps? Blank critical fields? Date inconsistencies? Assess: DEFINITIVE FRAUD, SUSPICIOUS, or LEGITIMATE."
+        extraction_query: the information to extract (same format as the get_info_from_image query), e.g.
+                          "What is: patient name, all dates, diagnosis/findings, fitness statements ('healthy'/'fit'/'no contraindication'), visible signatures/stamps?"
+    
+    Returns:
+        The AUTHENTICITY ASSESSMENT (DEFINITIVE FRAUD, SUSPICIOUS, or LEGITIMATE with observations)
+        followed by the EXTRACTED INFORMATION. Always weigh the authenticity assessment first.
+    """
+    try:
+        artifact = await aget_image_artifact(claim_id)
+        if artifact is None:
+            return "No image document has been provided by the user for this claim."
+        forgery, extraction = await aquery_document_analysis(artifact.data_url, authenticity_query, extraction_query)
+    except Exception as e:
+        return f"Error retrieving/analyzing image for claim {claim_id}: {str(e)}"
+
+    if isinstance(forgery, Exception):
+        forgery = f"Error analyzing document authenticity: {str(forgery)}"
+    if isinstance(extraction, Exception):
+        extraction = f"Error extracting document information: {str(extraction)}"
+    return f"### AUTHENTICITY ASSESSMENT\n{forgery}\n\n### EXTRACTED INFORMATION\n{extraction}"
+
+
 tools = [
+    analyze_document,
     check_image_forgery,
     get_policy,
     get_metadata,
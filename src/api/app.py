@@ -1,16 +1,49 @@
+import asyncio
+import json
 import logging
 import sys
+import time
 import uuid
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional
 
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
+from fastapi import (Depends, FastAPI, File, Header, HTTPException, Query,
+                     Request, Response, UploadFile)
+from fastapi.responses import (JSONResponse, PlainTextResponse,
+                               StreamingResponse)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.agent.agent import run_agent_query
-from src.minio.minio import upload_file_to_minio
+from src.agent.agent_utils import image_cache
+from src.agent.prescreen import claim_prescreen
+from src.minio.client import get_minio_client
+from src.minio.minio import (MAX_UPLOAD_REQUEST_BYTES, UploadTooLargeError,
+                             delete_claim_files, run_in_storage_executor,
+                             upload_file_to_minio, upload_timings,
+                             validate_upload_sizes)
+from src.minio.transcoder import TranscoderBusyError, image_transcoder
 from src.postgreql import crud
-from src.postgreql.session import get_db, lifespan
-from src.utils.schemas import ClaimDecisionResponse, ClaimsListResponse
+from src.postgreql.session import async_session, get_db, lifespan
+from src.postgreql.writer import decision_writer
+from src.utils.schemas import (ClaimDecision, ClaimsListResponse,
+                               ClaimStatus, ClaimStatusResponse,
+                               ClaimUsageResponse, TokenUsage,
+                               UsageSummaryResponse)
+from src.utils.decision_cache import NOT_FOUND, decision_cache
+from src.utils.rate_limiter import LANES, model_rate_limiter
+from src.utils.tracing import (claim_trace, get_claim_trace, span,
+                               stage_metrics)
+from src.utils.vision_cache import vision_cache
+
+from .idempotency import (check_idempotency_key, fingerprint_submission,
+                          submission_locks)
+from .jobs import (CLAIM_QUEUE_BACKEND, QueueFullError, attach_to_claim,
+                   is_tracked, job_runner, run_claim_job, track_claim)
+from .pagination import (MAX_PAGE_SIZE, InvalidCursorError, decode_cursor,
+                         encode_cursor)
+from .validation import (INJECTION_EXPLANATION, InvalidClaimError,
+                         is_injection, validate_claim_submission)
 
 # Configure logging
 logging.basicConfig(
@@ -27,7 +60,18 @@ logger.setLevel(logging.INFO)
 async def app_lifespan(app: FastAPI):
     """Application lifespan with startup and shutdown"""
     async with lifespan():
-        yield
+        # Connect to the object store per worker at startup, off the event loop, so a bad config fails fast
+        await run_in_storage_executor(get_minio_client)
+        await image_transcoder.start()
+        await decision_writer.start()
+        if CLAIM_QUEUE_BACKEND == "memory":
+            await job_runner.start()
+        try:
+            yield
+        finally:
+            await job_runner.stop()
+            await decision_writer.stop()
+            await image_transcoder.stop()
 
 
 app = FastAPI(
@@ -37,6 +81,44 @@ app = FastAPI(
 )
 
 
+# Allowance for multipart boundaries and headers on top of the file payloads
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+@app.middleware("http")
+async def limit_claim_upload_size(request: Request, call_next):
+    # Refuse oversized submissions from Content-Length, before the body is parsed and spooled
+    if request.method == "POST" and request.url.path == "/claims":
+        content_length = request.headers.get("content-length")
+        if content_length:
+            try:
+                content_length = int(content_length)
+                if content_length < 0:
+                    raise ValueError(content_length)
+            except ValueError:
+                return JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header"})
+        if content_length and content_length > MAX_UPLOAD_REQUEST_BYTES + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Request body is {content_length} bytes, limit is {MAX_UPLOAD_REQUEST_BYTES}"}
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not by raw path, to keep one series per endpoint
+    route = request.scope.get("route")
+    stage_metrics.observe(
+        "http_request_duration_seconds",
+        (("method", request.method), ("route", route.path if route else "unmatched"), ("status", str(response.status_code))),
+        time.perf_counter() - start
+    )
+    return response
+
+
 @app.get("/")
 async def root():
     return {
@@ -45,78 +127,300 @@ async def root():
     }
 
 
-@app.post("/claims", response_model=dict)
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "image": image_cache.stats(),
+        # Scans the cache directory when its size is stale
+        "vision": await asyncio.to_thread(vision_cache.stats),
+        "decision": decision_cache.stats()
+    }
+
+
+@app.get("/transcoder/stats")
+async def transcoder_stats():
+    return image_transcoder.stats()
+
+
+@app.get("/writer/stats")
+async def writer_stats():
+    return decision_writer.stats()
+
+
+@app.get("/models/stats")
+async def model_stats():
+    return model_rate_limiter.stats()
+
+
+@app.get("/prescreen/stats")
+async def prescreen_stats():
+    return claim_prescreen.stats()
+
+
+@app.get("/queue/stats")
+async def queue_stats(db: AsyncSession = Depends(get_db)):
+    if CLAIM_QUEUE_BACKEND == "postgres":
+        return {"backend": CLAIM_QUEUE_BACKEND, "jobs": await crud.count_claim_jobs(db)}
+    return {"backend": CLAIM_QUEUE_BACKEND, **job_runner.stats()}
+
+
+@app.get("/uploads/stats")
+async def upload_stats():
+    return {name: timing.summary() for name, timing in upload_timings.items()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage and request duration histograms in the Prometheus text format"""
+    return stage_metrics.render_prometheus()
+
+
+@app.get("/metrics/summary")
+async def metrics_summary():
+    return stage_metrics.summary()
+
+
+@app.post("/claims", response_model=dict, status_code=202)
 async def process_claim(
+    response: Response,
     claim_message: UploadFile = File(..., description="User claim (.txt file)"),
     claim_metadata: UploadFile = File(..., description="User metadata (.md file)"),
     claim_image: UploadFile = File(None, description="Image supporting the claim (.webp, .jpg, .jpeg, .png, .bmp, .tiff) - Optional"),
+    wait: bool = Query(False, description="Block until the decision is available instead of returning 202 and polling"),
+    priority: str = Query(LANES[0], description="Model call priority lane: interactive, or batch for bulk re-runs"),
+    idempotency_key: Optional[str] = Header(None, description="Client key making retries of this submission return the same claim"),
     db: AsyncSession = Depends(get_db)
 ):
+    if priority not in LANES:
+        raise HTTPException(status_code=422, detail=f"priority must be one of: {', '.join(LANES)}")
+
+    if not wait and job_runner.is_full():
+        raise HTTPException(
+            status_code=503,
+            detail="Claim queue is full, retry later"
+        )
+
+    try:
+        validate_upload_sizes([f for f in (claim_message, claim_metadata, claim_image) if f])
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
     claim_id = str(uuid.uuid4())
     
-    try:
-        logger.info(f"Processing new claim: {claim_id}")
-        logger.info(f"Uploading claim documents")
-        
-        # Upload claim message with standardized name
-        message_path = await upload_file_to_minio(claim_message, claim_id, "claim.txt")
-        metadata_path = await upload_file_to_minio(claim_metadata, claim_id, "metadata.md")
-        
-        image_path = None
-        if claim_image:
-            image_path = await upload_file_to_minio(claim_image, claim_id, "image.webp")
-            logger.info(f"Files uploaded for claim {claim_id}: {message_path}, {metadata_path}, {image_path}")
-        else:
-            logger.info(f"Files uploaded for claim {claim_id}: {message_path}, {metadata_path} (no image provided)")
+    with claim_trace(claim_id):
+        try:
+            logger.info(f"Processing new claim: {claim_id}")
 
-        response = await run_agent_query(claim_id)
-        
-        decision = response.decision.value  # Convert enum to string
-        explanation = response.explanation or ""
+            # Malformed and injected claims are answered and recorded before anything is uploaded
+            try:
+                with span("claim.validate"):
+                    idempotency_key = check_idempotency_key(idempotency_key)
+                    claim_text = await validate_claim_submission(claim_message, claim_metadata, claim_image)
+            except InvalidClaimError as e:
+                logger.warning(f"Claim {claim_id} rejected: {e}")
+                decided_at = datetime.now(timezone.utc)
+                await decision_writer.create_rejected_claim(db, claim_id, error=str(e), decided_at=decided_at)
+                await decision_cache.put(ClaimStatusResponse(
+                    claim_id=claim_id, status=ClaimStatus.FAILED, error=str(e), created_at=decided_at, completed_at=decided_at
+                ))
+                raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Location": f"/claims/{claim_id}"})
+
+            with span("claim.fingerprint"):
+                fingerprint = await fingerprint_submission(claim_text, claim_metadata, claim_image)
+
+            # Retries and concurrent copies of a submission get the claim of the first one
+            async with submission_locks.hold(idempotency_key and f"key:{idempotency_key}", f"fingerprint:{fingerprint}"):
+                existing = await crud.find_duplicate_claim(db, idempotency_key=idempotency_key, fingerprint=fingerprint)
+                if existing is not None:
+                    return await _replay_claim(existing, fingerprint, wait, response)
+
+                try:
+                    submitted = await _submit_claim(
+                        db, response, claim_id, claim_text, claim_message, claim_metadata, claim_image,
+                        idempotency_key, fingerprint, wait, priority
+                    )
+                except IntegrityError:
+                    # Another API worker stored the same submission first
+                    await db.rollback()
+                    await delete_claim_files(claim_id)
+                    existing = await crud.find_duplicate_claim(db, idempotency_key=idempotency_key, fingerprint=fingerprint)
+                    if existing is None:
+                        raise
+                    return await _replay_claim(existing, fingerprint, wait, response)
+                if submitted is not None:
+                    return submitted
+
+            if CLAIM_QUEUE_BACKEND == "postgres":
+                result = await attach_to_claim(claim_id)
+                if result is None:
+                    response.headers["Location"] = f"/claims/{claim_id}"
+                    return {"message": "Claim still processing", "claim_id": claim_id, "status": ClaimStatus.PENDING.value}
+            else:
+                result = await run_claim_job(claim_id, claim_text, priority)
+            response.status_code = 200
+            return {
+                "message": f"Claim submitted successfully",
+                "claim_id": claim_id,
+                "decision": result.decision.value,
+                "explanation" : result.explanation or ""
+            }
         
-        # Save claim decision to database
-        await crud.create_claim(
-            db=db,
-            claim_id=claim_id,
-            decision=decision,
-            explanation=explanation
+        except HTTPException:
+            raise
+        except TranscoderBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error processing claim: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Claim submission failed: {str(e)}"
+            )
+
+
+async def _submit_claim(
+    db: AsyncSession, response: Response, claim_id: str, claim_text: str,
+    claim_message: UploadFile, claim_metadata: UploadFile, claim_image: Optional[UploadFile],
+    idempotency_key: Optional[str], fingerprint: str, wait: bool, priority: str
+) -> Optional[dict]:
+    """Store a new claim; returns the response, or None when the caller should run it and wait"""
+    if is_injection(claim_text):
+        decided_at = datetime.now(timezone.utc)
+        await decision_writer.create_claim(
+            db, claim_id, decision=ClaimDecision.DENY.value, explanation=INJECTION_EXPLANATION, decided_at=decided_at,
+            idempotency_key=idempotency_key, fingerprint=fingerprint
         )
-        
-        logger.info(f"Claim {claim_id} processed with decision: {decision}")
-        
+        await decision_cache.put(ClaimStatusResponse(
+            claim_id=claim_id, status=ClaimStatus.DONE, decision=ClaimDecision.DENY, explanation=INJECTION_EXPLANATION,
+            created_at=decided_at, completed_at=decided_at
+        ))
+        response.status_code = 200
+        response.headers["Location"] = f"/claims/{claim_id}"
         return {
-            "message": f"Claim submitted successfully",
+            "message": f"Claim rejected",
             "claim_id": claim_id,
-            "decision": decision,
-            "explanation" : explanation
+            "status": ClaimStatus.DONE.value,
+            "decision": ClaimDecision.DENY.value,
+            "explanation": INJECTION_EXPLANATION
         }
-        
-    except Exception as e:
-        logger.error(f"Error processing claim: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Claim submission failed: {str(e)}"
-        )
 
+    logger.info(f"Uploading claim documents")
 
-@app.get("/claims/{claim_id}", response_model=ClaimDecisionResponse)
-async def get_claim_result(
-    claim_id: str,
-    db: AsyncSession = Depends(get_db)
-):
+    # Upload claim documents concurrently with standardized names
+    uploads = [
+        upload_file_to_minio(claim_message, claim_id, "claim.txt"),
+        upload_file_to_minio(claim_metadata, claim_id, "metadata.md"),
+    ]
+    if claim_image:
+        uploads.append(upload_file_to_minio(claim_image, claim_id, "image.webp"))
+
+    start = time.perf_counter()
+    with span("claim.upload"):
+        results = await asyncio.gather(*uploads, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        await delete_claim_files(claim_id)
+        raise errors[0]
+
+    logger.info(
+        f"Files uploaded for claim {claim_id} in {time.perf_counter() - start:.3f}s: {', '.join(results)}"
+        + ("" if claim_image else " (no image provided)")
+    )
+
+    queued = CLAIM_QUEUE_BACKEND == "postgres"
+    await crud.create_pending_claim(
+        db, claim_id, idempotency_key=idempotency_key, fingerprint=fingerprint,
+        enqueue=queued, claim_text=claim_text, priority=priority
+    )
+
+    if wait:
+        if not queued:
+            # Registered before the submission lock is released so duplicates attach to this run
+            track_claim(claim_id)
+        return None
+
+    if not queued:
+        try:
+            job_runner.submit(claim_id, claim_text, priority)
+        except QueueFullError as e:
+            await decision_writer.fail_claim(db, claim_id, error=str(e))
+            await delete_claim_files(claim_id)
+            raise HTTPException(status_code=503, detail=str(e))
+
+    response.headers["Location"] = f"/claims/{claim_id}"
+    return {
+        "message": f"Claim accepted for processing",
+        "claim_id": claim_id,
+        "status": "PENDING"
+    }
+
+
+async def _replay_claim(existing, fingerprint: str, wait: bool, response: Response) -> dict:
+    """Answer a repeated submission with the claim it duplicates, waiting for it if asked to"""
+    if existing.fingerprint is not None and existing.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different claim")
+
+    claim_id = existing.claim_id
+    status, decision, explanation, error = existing.status, existing.decision, existing.explanation, existing.error
+    unfinished = status in (ClaimStatus.PENDING.value, ClaimStatus.RUNNING.value)
+    if unfinished and CLAIM_QUEUE_BACKEND == "memory" and not is_tracked(claim_id):
+        # The claim may have been left behind by a stopped process; if so it is run here right away
+        # instead of at the next recovery sweep, so the duplicate does not wait on a stuck claim
+        try:
+            if await job_runner.recover([claim_id]):
+                status = ClaimStatus.PENDING.value
+        except Exception as e:
+            logger.warning(f"Recovering claim {claim_id} failed: {e}")
+    if wait and status in (ClaimStatus.PENDING.value, ClaimStatus.RUNNING.value):
+        try:
+            result = await attach_to_claim(claim_id)
+        except Exception as e:
+            status, error = ClaimStatus.FAILED.value, str(e)
+        else:
+            if result is not None:
+                status, decision, explanation = ClaimStatus.DONE.value, result.decision.value, result.explanation or ""
+
+    logger.info(f"Duplicate submission answered with claim {claim_id} ({status})")
+    response.headers["Location"] = f"/claims/{claim_id}"
+    response.headers["Idempotent-Replayed"] = "true"
+    body = {"message": "Claim already submitted", "claim_id": claim_id, "status": status}
+    if status in (ClaimStatus.DONE.value, ClaimStatus.FAILED.value):
+        response.status_code = 200
+        body.update(decision=decision, explanation=explanation, error=error)
+    return body
+
+
+@app.get("/claims/{claim_id}", response_model=ClaimStatusResponse)
+async def get_claim_result(claim_id: str):
     try:
-        db_claim = await crud.get_claim_by_id(db, claim_id)
+        # Finished claims never change, so polls are answered from the decision cache
+        cached = await decision_cache.get(claim_id)
+        if cached is NOT_FOUND:
+            raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+        if cached is not None:
+            return cached
+
+        async with async_session() as db:
+            db_claim = await crud.get_claim_by_id(db, claim_id)
         
         if not db_claim:
+            decision_cache.put_not_found(claim_id)
             raise HTTPException(
                 status_code=404,
                 detail=f"Claim {claim_id} not found"
             )
         
-        return ClaimDecisionResponse(
+        claim = ClaimStatusResponse(
+            claim_id=db_claim.claim_id,
+            status=db_claim.status,
             decision=db_claim.decision,
-            explanation=db_claim.explanation
+            explanation=db_claim.explanation,
+            error=db_claim.error,
+            created_at=db_claim.created_at,
+            started_at=db_claim.started_at,
+            completed_at=db_claim.completed_at
         )
+        await decision_cache.put(claim)
+        return claim
         
     except HTTPException:
         raise
@@ -128,17 +432,100 @@ async def get_claim_result(
         )
 
 
+@app.get("/claims/{claim_id}/trace")
+async def get_claim_trace_endpoint(claim_id: str):
+    """Timing spans of a recently submitted claim, kept in memory by this process"""
+    trace = get_claim_trace(claim_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace for claim {claim_id}")
+    return trace
+
+
+USAGE_FIELDS = ("calls", "input_tokens", "cached_tokens", "output_tokens", "reasoning_tokens", "image_tokens", "cost_usd")
+
+
+def _sum_usage(rows, kind: str = None, model: str = None) -> TokenUsage:
+    totals = {field: sum(getattr(row, field) for row in rows) for field in USAGE_FIELDS}
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    return TokenUsage(kind=kind, model=model, **totals)
+
+
+@app.get("/claims/{claim_id}/usage", response_model=ClaimUsageResponse)
+async def get_claim_usage(
+    claim_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        rows = await crud.get_claim_usage(db, claim_id)
+        if not rows and not await crud.get_claim_by_id(db, claim_id):
+            raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+        return ClaimUsageResponse(
+            claim_id=claim_id,
+            total=_sum_usage(rows),
+            by_kind=[_sum_usage([row], row.kind, row.model) for row in rows]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving usage for claim {claim_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving usage: {str(e)}")
+
+
+@app.get("/usage", response_model=UsageSummaryResponse)
+async def get_usage_summary(
+    since: Optional[datetime] = Query(None, description="Only claims completed at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only claims completed before this time"),
+    kind: Optional[str] = Query(None, description="Only one kind of call, e.g. agent or vision.ocr"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Token and cost totals across claims, per kind of call and model, and averaged per claim"""
+    try:
+        claims, rows = await crud.get_usage_summary(db, since=since, until=until, kind=kind)
+        total = _sum_usage(rows)
+        per_claim = {field: (getattr(total, field) / claims if claims else 0) for field in USAGE_FIELDS}
+        return UsageSummaryResponse(
+            claims=claims,
+            total=total,
+            per_claim=TokenUsage(**{field: round(value, 6) if field == "cost_usd" else round(value) for field, value in per_claim.items()}),
+            by_kind=[_sum_usage([row], row.kind, row.model) for row in rows]
+        )
+    except Exception as e:
+        logger.error(f"Error retrieving usage summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving usage summary: {str(e)}")
+
+
 @app.get("/claims", response_model=ClaimsListResponse)
 async def get_claims(
-    skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    decision: Optional[ClaimDecision] = Query(None),
+    status: Optional[ClaimStatus] = Query(None),
+    since: Optional[datetime] = Query(None, description="Only claims created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only claims created before this time"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson streams every matching claim, one JSON object per line"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset pagination, use cursor instead"),
     db: AsyncSession = Depends(get_db)
 ):
+    """Claims newest first, paginated with an opaque cursor on (created_at, id)"""
     try:
-        claims = await crud.get_all_claims(db, skip=skip, limit=limit)
-        claim_ids = [claim.claim_id for claim in claims]
-        
-        return ClaimsListResponse(claims=claim_ids)
+        filters = dict(
+            after=decode_cursor(cursor) if cursor else None,
+            decision=decision.value if decision else None,
+            status=status.value if status else None,
+            since=since,
+            until=until
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "ndjson":
+        return StreamingResponse(_stream_claims_ndjson(filters), media_type="application/x-ndjson")
+
+    try:
+        # One extra row tells whether there is a next page
+        claims = await crud.get_all_claims(db, skip=skip, limit=limit + 1, **filters)
+        next_cursor = encode_cursor(claims[limit - 1].created_at, claims[limit - 1].id) if len(claims) > limit else None
+        return ClaimsListResponse(claims=[claim.claim_id for claim in claims[:limit]], next_cursor=next_cursor)
         
     except Exception as e:
         logger.error(f"Error retrieving claims: {str(e)}")
@@ -146,3 +533,20 @@ async def get_claims(
             status_code=500,
             detail=f"Error retrieving claims: {str(e)}"
         )
+
+
+async def _stream_claims_ndjson(filters: dict):
+    # The request's session is closed before a streamed body is sent, so the stream opens its own
+    async with async_session() as db:
+        try:
+            async for claim in crud.stream_claims(db, **filters):
+                yield json.dumps({
+                    "claim_id": claim.claim_id,
+                    "status": claim.status,
+                    "decision": claim.decision,
+                    "created_at": claim.created_at.isoformat() if claim.created_at else None,
+                    "completed_at": claim.completed_at.isoformat() if claim.completed_at else None,
+                }) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming claims: {str(e)}")
+            raise
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import UploadFile
+
+from .validation import VALIDATION_CHUNK_BYTES, InvalidClaimError
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+
+def check_idempotency_key(key: Optional[str]) -> Optional[str]:
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH or not key.isprintable():
+        raise InvalidClaimError(f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} printable characters")
+    return key
+
+
+async def _file_digest(file: Optional[UploadFile]) -> bytes:
+    digest = hashlib.sha256()
+    if file is not None:
+        try:
+            while chunk := await file.read(VALIDATION_CHUNK_BYTES):
+                digest.update(chunk)
+        finally:
+            await file.seek(0)
+    return digest.digest()
+
+
+async def fingerprint_submission(claim_text: str, claim_metadata: UploadFile, claim_image: Optional[UploadFile]) -> str:
+    """sha256 over the claim text and the metadata and image bytes, each hashed on its own so parts cannot shift"""
+    parts = [
+        hashlib.sha256(claim_text.encode("utf-8")).digest(),
+        await _file_digest(claim_metadata),
+        await _file_digest(claim_image) if claim_image else b"",
+    ]
+    return hashlib.sha256(b"".join(parts)).hexdigest()
+
+
+class SubmissionLocks:
+    """
+    Per-key asyncio locks so that concurrent submissions with the same Idempotency-Key or
+    fingerprint are handled one after the other in this process: the first one creates the
+    claim, the next ones find it. Across processes the unique indexes on claims decide.
+    """
+
+    def __init__(self):
+        self._locks = {}  # key -> (lock, number of holders and waiters)
+
+    @asynccontextmanager
+    async def hold(self, *keys: Optional[str]):
+        # Always acquired in sorted order so two submissions sharing keys cannot deadlock
+        keys = sorted({key for key in keys if key is not None})
+        registered, held = [], []
+        try:
+            for key in keys:
+                lock, users = self._locks.get(key, (None, 0))
+                lock = lock or asyncio.Lock()
+                self._locks[key] = (lock, users + 1)
+                registered.append(key)
+                await lock.acquire()
+                held.append(key)
+            yield
+        finally:
+            for key in reversed(registered):
+                lock, users = self._locks[key]
+                if key in held:
+                    lock.release()
+                if users <= 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, users - 1)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+submission_locks = SubmissionLocks()
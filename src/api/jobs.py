@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.agent.agent import run_agent_query
+from src.postgreql import crud
+from src.postgreql.session import async_session
+from src.postgreql.writer import decision_writer
+from src.utils.decision_cache import decision_cache
+from src.utils.schemas import (ClaimDecision, ClaimDecisionResponse,
+                               ClaimStatus, ClaimStatusResponse)
+from src.utils.rate_limiter import LANES, model_lane
+from src.utils.tracing import claim_trace, record_span, span
+from src.utils.usage import claim_usage
+
+logger = logging.getLogger("src.api.jobs")
+
+CLAIM_WORKERS = int(os.getenv("CLAIM_WORKERS", 8))
+CLAIM_QUEUE_SIZE = int(os.getenv("CLAIM_QUEUE_SIZE", 100))
+# memory: agent runs in this process (CLAIM_WORKERS) | postgres: queued in claim_jobs for scripts/worker.py
+CLAIM_QUEUE_BACKEND = os.getenv("CLAIM_QUEUE_BACKEND", "memory").lower()
+# How ?wait=true submissions follow claims run by queue workers
+CLAIM_WAIT_POLL_SECONDS = float(os.getenv("CLAIM_WAIT_POLL_SECONDS", 0.5))
+CLAIM_WAIT_TIMEOUT_SECONDS = float(os.getenv("CLAIM_WAIT_TIMEOUT_SECONDS", 300))
+# The in-process runner refreshes the claims it holds every CLAIM_HEARTBEAT_SECONDS; PENDING or RUNNING
+# claims not refreshed for CLAIM_ORPHAN_SECONDS were left by a stopped process and are run again
+CLAIM_HEARTBEAT_SECONDS = float(os.getenv("CLAIM_HEARTBEAT_SECONDS", 30))
+CLAIM_ORPHAN_SECONDS = float(os.getenv("CLAIM_ORPHAN_SECONDS", 120))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class ClaimFailedError(Exception):
+    pass
+
+
+# Claims queued or running in this process -> future of their agent response, for duplicate submissions to attach to
+_in_flight = {}
+
+
+def track_claim(claim_id: str) -> asyncio.Future:
+    """Register a claim as queued or running so duplicate submissions can attach to it"""
+    future = _in_flight.get(claim_id)
+    if future is None:
+        future = asyncio.get_running_loop().create_future()
+        # Retrieve the exception so an unattached failure is not reported as never retrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        _in_flight[claim_id] = future
+    return future
+
+
+def is_tracked(claim_id: str) -> bool:
+    return claim_id in _in_flight
+
+
+def _untrack_claim(claim_id: str, result=None, error: BaseException = None):
+    future = _in_flight.pop(claim_id, None)
+    if future is None or future.done():
+        return
+    if isinstance(error, asyncio.CancelledError):
+        future.cancel()
+    elif error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+async def _poll_claim(claim_id: str, timeout: float = CLAIM_WAIT_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while True:
+        async with async_session() as db:
+            claim = await crud.get_claim_by_id(db, claim_id)
+        if claim is None:
+            return None
+        if claim.status == ClaimStatus.DONE.value:
+            return ClaimDecisionResponse(decision=ClaimDecision(claim.decision), explanation=claim.explanation)
+        if claim.status == ClaimStatus.FAILED.value:
+            raise ClaimFailedError(claim.error)
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(CLAIM_WAIT_POLL_SECONDS)
+
+
+async def attach_to_claim(claim_id: str):
+    """
+    Wait for the agent response of a claim queued or running in this process, or with the postgres
+    queue, poll the database until a worker finishes it. None if it is not running or still is at the timeout.
+    """
+    future = _in_flight.get(claim_id)
+    if future is None:
+        if CLAIM_QUEUE_BACKEND == "postgres":
+            with span("job.wait"):
+                return await _poll_claim(claim_id)
+        return None
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if future.cancelled():
+            return None
+        raise
+
+
+async def cache_decided_claim(claim_id: str, local: bool = True):
+    """
+    Put a claim just decided into the decision cache, so its first poll does not reach the database.
+    It is read back once to cache the stored timestamps; local=False fills only the shared store.
+    """
+    if not decision_cache.enabled or (not local and decision_cache.shared is None):
+        return
+    try:
+        async with async_session() as db:
+            claim = await crud.get_claim_by_id(db, claim_id)
+        if claim is not None:
+            await decision_cache.put(ClaimStatusResponse.model_validate(claim, from_attributes=True), local=local)
+    except Exception as e:
+        logger.warning(f"Caching the decision of claim {claim_id} failed: {e}")
+
+
+async def _process_claim(claim_id: str, claim_text: str = None, lane: str = LANES[0]):
+    with claim_trace(claim_id), claim_usage(claim_id) as usage, model_lane(lane):
+        async with async_session() as db:
+            try:
+                await crud.mark_claim_running(db, claim_id)
+                with span("agent.run"):
+                    response = await run_agent_query(claim_id, claim_text)
+                decision = response.decision.value
+                explanation = response.explanation or ""
+                await decision_writer.complete_claim(db, claim_id, decision=decision, explanation=explanation, usage=usage)
+                await cache_decided_claim(claim_id)
+                total = usage.total()
+                logger.info(
+                    f"Claim {claim_id} processed with decision: {decision} "
+                    f"({total.input_tokens} input / {total.output_tokens} output tokens, ${total.cost_usd:.5f})"
+                )
+                return response
+            except Exception as e:
+                logger.error(f"Claim job {claim_id} failed: {e}", exc_info=True)
+                await db.rollback()
+                await decision_writer.fail_claim(db, claim_id, error=str(e))
+                raise
+
+
+async def run_claim_job(claim_id: str, claim_text: str = None, lane: str = LANES[0]):
+    """
+    Run the agent for an already persisted PENDING claim and record the outcome.
+    claim_text is the validated message from the submission; without it the agent reads it from storage.
+    lane is the model rate limiter priority lane of its model calls.
+    """
+    track_claim(claim_id)
+    try:
+        response = await _process_claim(claim_id, claim_text, lane)
+    except BaseException as e:
+        _untrack_claim(claim_id, error=e)
+        raise
+    _untrack_claim(claim_id, result=response)
+    return response
+
+
+class ClaimJobRunner:
+    """
+    Fixed-size pool of asyncio workers draining a bounded queue of (claim id, claim text, lane).
+
+    The queue lives in this process, so a heartbeat keeps the claims it holds fresh in the database,
+    and claims whose heartbeat stopped (the process was stopped or crashed) are taken over at startup
+    and on every heartbeat, as long as the queue has room; their text is read back from storage.
+    """
+
+    def __init__(
+        self,
+        workers: int = CLAIM_WORKERS,
+        queue_size: int = CLAIM_QUEUE_SIZE,
+        heartbeat_seconds: float = CLAIM_HEARTBEAT_SECONDS,
+        orphan_seconds: float = CLAIM_ORPHAN_SECONDS,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.orphan_seconds = max(orphan_seconds, 2 * heartbeat_seconds)
+        self._queue = None
+        self._tasks = []
+        self.recovered = 0
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def submit(self, claim_id: str, claim_text: str = None, lane: str = LANES[0]):
+        if self._queue is None:
+            raise RuntimeError("Claim job runner is not started")
+        try:
+            self._queue.put_nowait((claim_id, claim_text, lane, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Claim queue is full ({self.queue_size} pending)")
+        track_claim(claim_id)
+
+    async def _worker(self):
+        while True:
+            claim_id, claim_text, lane, enqueued_at = await self._queue.get()
+            with claim_trace(claim_id):
+                record_span("job.queue_wait", enqueued_at)
+            try:
+                await run_claim_job(claim_id, claim_text, lane)
+            except Exception:
+                pass  # already logged and recorded as FAILED
+            finally:
+                self._queue.task_done()
+
+    async def recover(self, claim_ids: list = None) -> list:
+        """Queue orphaned claims (all, or those of claim_ids) here, up to the room left in the queue"""
+        if self._queue is None:
+            return []
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.orphan_seconds)
+        async with async_session() as db:
+            orphaned = await crud.recover_orphaned_claims(
+                db, stale_before, self.queue_size - self._queue.qsize(), claim_ids=claim_ids
+            )
+        # Claims stored before their lane was recorded run in the default lane
+        for claim_id, priority in orphaned:
+            self.submit(claim_id, lane=priority if priority in LANES else LANES[0])
+        recovered = [claim_id for claim_id, _ in orphaned]
+        if recovered:
+            self.recovered += len(recovered)
+            logger.warning(f"Recovered {len(recovered)} claims left unfinished by a stopped process: {', '.join(recovered)}")
+        return recovered
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                if _in_flight:
+                    async with async_session() as db:
+                        await crud.touch_claims(db, list(_in_flight))
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Claim heartbeat failed: {e}", exc_info=True)
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(_in_flight),
+            "recovered": self.recovered,
+        }
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        logger.info(f"Claim job runner started with {self.workers} workers (queue size {self.queue_size})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Claim job runner stopped")
+
+
+job_runner = ClaimJobRunner()
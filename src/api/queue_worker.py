@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from src.agent.agent import run_agent_query
+from src.postgreql import crud
+from src.postgreql.session import async_session
+from src.utils.rate_limiter import LANES, model_lane
+from src.utils.tracing import claim_trace, span
+from src.utils.usage import claim_usage
+
+from .jobs import cache_decided_claim
+
+logger = logging.getLogger("src.api.queue_worker")
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 8))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 15))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Retries wait JOB_RETRY_BACKOFF_SECONDS, then twice as long after each further failure
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 10))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+
+
+class QueueWorker:
+    """
+    Runs claim jobs leased from the claim_jobs table, up to concurrency at a time.
+
+    A job is leased for lease_seconds and the lease is renewed every heartbeat_seconds while the
+    agent runs; if the worker dies, the lease expires and another worker picks the job up. A run
+    whose lease was taken over is cancelled and writes nothing. Failed attempts are retried with
+    exponential backoff, and the job is dead-lettered (status DEAD, claim FAILED) after max_attempts.
+    """
+
+    def __init__(
+        self,
+        worker_id: str = None,
+        concurrency: int = WORKER_CONCURRENCY,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_backoff: float = JOB_RETRY_BACKOFF_SECONDS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+    ):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = min(heartbeat_seconds, lease_seconds / 2)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.poll_seconds = poll_seconds
+        self._running = set()
+        # Jobs whose lease renewal found another worker holding them
+        self._lost = set()
+        self._stop = asyncio.Event()
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.lost_leases = 0
+
+    def stop(self):
+        """Stop leasing new jobs; run() returns once the running ones are finished"""
+        self._stop.set()
+
+    async def run(self, drain_timeout: float = None):
+        logger.info(
+            f"Worker {self.worker_id} started (concurrency {self.concurrency}, lease {self.lease_seconds:.0f}s, "
+            f"heartbeat {self.heartbeat_seconds:.0f}s, max attempts {self.max_attempts})"
+        )
+        while not self._stop.is_set():
+            free = self.concurrency - len(self._running)
+            if free <= 0:
+                await self._wait(asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED))
+                continue
+
+            try:
+                async with async_session() as db:
+                    dead = await crud.dead_letter_expired_claim_jobs(db, self.max_attempts)
+                    jobs = await crud.lease_claim_jobs(db, self.worker_id, free, self.lease_seconds, self.max_attempts)
+            except Exception as e:
+                logger.error(f"Leasing claim jobs failed: {e}", exc_info=True)
+                await self._wait(asyncio.sleep(self.poll_seconds))
+                continue
+
+            if dead:
+                self.dead_lettered += len(dead)
+                logger.warning(f"Dead-lettered claims whose worker died on their last attempt: {', '.join(dead)}")
+            for job_id, claim_id, claim_text, priority, attempt in jobs:
+                task = asyncio.create_task(self._run_job(job_id, claim_id, claim_text, priority or LANES[0], attempt))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            if not jobs:
+                await self._wait(asyncio.sleep(self.poll_seconds))
+
+        if self._running:
+            logger.info(f"Worker {self.worker_id} stopping, waiting for {len(self._running)} running jobs")
+            done, pending = await asyncio.wait(self._running, timeout=drain_timeout)
+            # Unfinished jobs keep their lease until it expires, then another worker retries them
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info(f"Worker {self.worker_id} stopped: {self.stats()}")
+
+    async def _wait(self, awaitable):
+        """Wait for awaitable, or less if the worker is stopped"""
+        stopped = asyncio.create_task(self._stop.wait())
+        waiting = asyncio.ensure_future(awaitable)
+        await asyncio.wait({stopped, waiting}, return_when=asyncio.FIRST_COMPLETED)
+        stopped.cancel()
+        if not waiting.done():
+            waiting.cancel()
+
+    async def _heartbeat(self, job_id: int, claim_id: str, run: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                async with async_session() as db:
+                    held = await crud.renew_claim_job_lease(db, job_id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                # Keep going; if the database stays unreachable the lease expires and the job is retried elsewhere
+                logger.warning(f"Lease renewal of claim {claim_id} failed: {e}")
+                continue
+            if not held:
+                self._lost.add(job_id)
+                run.cancel()
+                return
+
+    async def _run_job(self, job_id: int, claim_id: str, claim_text: str, lane: str, attempt: int):
+        with claim_trace(claim_id), claim_usage(claim_id) as usage, model_lane(lane):
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, claim_id, asyncio.current_task()))
+            try:
+                async with async_session() as db:
+                    await crud.mark_claim_running(db, claim_id)
+                with span("agent.run"):
+                    response = await run_agent_query(claim_id, claim_text)
+                decision = response.decision.value
+
+                async with async_session() as db:
+                    written = await crud.complete_claim_job(
+                        db, job_id, self.worker_id, claim_id,
+                        decision=decision, explanation=response.explanation or "", usage=usage
+                    )
+                if not written:
+                    self._drop(claim_id, attempt)
+                    return
+                self.completed += 1
+                # The API processes serve polls, so only a shared decision cache is worth filling from here
+                await cache_decided_claim(claim_id, local=False)
+                total = usage.total()
+                logger.info(
+                    f"Claim {claim_id} processed with decision: {decision} on attempt {attempt} "
+                    f"({total.input_tokens} input / {total.output_tokens} output tokens, ${total.cost_usd:.5f})"
+                )
+            except asyncio.CancelledError:
+                if job_id not in self._lost:
+                    raise
+                self._drop(claim_id, attempt)
+            except Exception as e:
+                logger.error(f"Claim job {claim_id} failed on attempt {attempt} of {self.max_attempts}: {e}", exc_info=True)
+                await self._record_failure(job_id, claim_id, attempt, str(e))
+            finally:
+                heartbeat.cancel()
+                self._lost.discard(job_id)
+
+    def _drop(self, claim_id: str, attempt: int):
+        self.lost_leases += 1
+        logger.warning(f"Lease of claim {claim_id} was taken over by another worker, dropping attempt {attempt}")
+
+    async def _record_failure(self, job_id: int, claim_id: str, attempt: int, error: str):
+        try:
+            async with async_session() as db:
+                if attempt >= self.max_attempts:
+                    if await crud.dead_letter_claim_job(db, job_id, self.worker_id, claim_id, error=error):
+                        self.dead_lettered += 1
+                        logger.error(f"Claim {claim_id} dead-lettered after {attempt} attempts")
+                else:
+                    retry_at = datetime.now(timezone.utc) + timedelta(seconds=self.retry_backoff * 2 ** (attempt - 1))
+                    if await crud.retry_claim_job(db, job_id, self.worker_id, claim_id, error=error, retry_at=retry_at):
+                        self.retried += 1
+        except Exception as e:
+            # The lease then expires and the attempt is retried like one whose worker died
+            logger.error(f"Recording the failure of claim {claim_id} failed: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "running": len(self._running),
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "lost_leases": self.lost_leases,
+        }
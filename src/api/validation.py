@@ -0,0 +1,109 @@
+import codecs
+import logging
+import os
+from typing import Optional
+
+from fastapi import UploadFile
+
+from src.agent.agent import prompt_injection_filter
+from src.minio.minio import SUPPORTED_IMAGE_FORMATS
+
+logger = logging.getLogger("src.api.validation")
+
+MAX_CLAIM_TEXT_BYTES = int(os.getenv("MAX_CLAIM_TEXT_BYTES", 64 * 1024))
+VALIDATION_CHUNK_BYTES = 1024 * 1024
+
+# Clients that don't know a type send application/octet-stream; the extension decides then
+GENERIC_CONTENT_TYPES = {None, "", "application/octet-stream"}
+CLAIM_TEXT_TYPES = {"text/plain"}
+CLAIM_TEXT_EXTENSIONS = {".txt"}
+METADATA_TYPES = {"text/markdown", "text/x-markdown", "text/plain"}
+METADATA_EXTENSIONS = {".md", ".markdown", ".txt"}
+
+INJECTION_EXPLANATION = "Potential prompt injection detected"
+
+
+class InvalidClaimError(Exception):
+    """A submission that is rejected before upload, with the HTTP status to answer"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _extension(file: UploadFile) -> str:
+    name = (file.filename or "").lower()
+    return "." + name.rsplit(".", 1)[-1] if "." in name else ""
+
+
+def _content_type(file: UploadFile) -> Optional[str]:
+    return file.content_type.split(";", 1)[0].strip().lower() if file.content_type else None
+
+
+def check_content_type(file: UploadFile, field: str, types: set, extensions: set, prefix: str = None) -> None:
+    content_type = _content_type(file)
+    if content_type in GENERIC_CONTENT_TYPES:
+        if _extension(file) not in extensions:
+            raise InvalidClaimError(f"{field} must be one of {', '.join(sorted(extensions))}, got {file.filename}", 415)
+    elif content_type not in types and not (prefix and content_type.startswith(prefix)):
+        raise InvalidClaimError(f"{field} has unsupported content type {content_type}", 415)
+
+
+async def read_claim_text(file: UploadFile) -> str:
+    """Read and decode the claim message; it is small and handed to the agent from memory"""
+    if file.size is not None and file.size > MAX_CLAIM_TEXT_BYTES:
+        raise InvalidClaimError(f"claim_message is {file.size} bytes, limit is {MAX_CLAIM_TEXT_BYTES}", 413)
+    data = await file.read(MAX_CLAIM_TEXT_BYTES + 1)
+    await file.seek(0)
+    if len(data) > MAX_CLAIM_TEXT_BYTES:
+        raise InvalidClaimError(f"claim_message is larger than {MAX_CLAIM_TEXT_BYTES} bytes", 413)
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise InvalidClaimError(f"claim_message is not valid UTF-8: {e.reason} at byte {e.start}")
+    if "\x00" in text:
+        raise InvalidClaimError("claim_message contains NUL characters")
+    if not text.strip():
+        raise InvalidClaimError("claim_message is empty")
+    return text
+
+
+async def check_utf8_stream(file: UploadFile, field: str) -> None:
+    # Decoded chunk by chunk, so a large metadata file is never held in memory as a whole
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    offset = 0
+    try:
+        while True:
+            chunk = await file.read(VALIDATION_CHUNK_BYTES)
+            decoder.decode(chunk, final=not chunk)
+            if not chunk:
+                break
+            offset += len(chunk)
+    except UnicodeDecodeError as e:
+        raise InvalidClaimError(f"{field} is not valid UTF-8: {e.reason} near byte {offset + e.start}")
+    finally:
+        await file.seek(0)
+    if offset == 0:
+        raise InvalidClaimError(f"{field} is empty")
+
+
+async def validate_claim_submission(claim_message: UploadFile, claim_metadata: UploadFile, claim_image: Optional[UploadFile]) -> str:
+    """
+    Check content types and encodings of a submission before anything is stored.
+    Returns the decoded claim text; raises InvalidClaimError for a malformed submission.
+    """
+    check_content_type(claim_message, "claim_message", CLAIM_TEXT_TYPES, CLAIM_TEXT_EXTENSIONS)
+    check_content_type(claim_metadata, "claim_metadata", METADATA_TYPES, METADATA_EXTENSIONS)
+    if claim_image:
+        check_content_type(claim_image, "claim_image", set(), SUPPORTED_IMAGE_FORMATS, prefix="image/")
+
+    claim_text = await read_claim_text(claim_message)
+    await check_utf8_stream(claim_metadata, "claim_metadata")
+    return claim_text
+
+
+def is_injection(claim_text: str) -> bool:
+    detected = prompt_injection_filter.detect_injection(claim_text)
+    if detected:
+        logger.warning("Prompt injection detected in claim message")
+    return detected
@@ -1,11 +1,15 @@
-from .minio import (delete_file_from_minio, get_file_from_minio,
-                    get_image_from_minio, list_files_in_minio,
-                    upload_file_to_minio)
+from .minio import (aget_claim_metadata, aget_image_from_minio,
+                    delete_claim_files, delete_file_from_minio,
+                    get_file_from_minio, get_image_from_minio,
+                    list_files_in_minio, upload_file_to_minio)
 
 __all__ = [
     "upload_file_to_minio",
     "get_file_from_minio",
     "get_image_from_minio",
+    "aget_image_from_minio",
+    "aget_claim_metadata",
     "delete_file_from_minio",
+    "delete_claim_files",
     "list_files_in_minio",
 ]
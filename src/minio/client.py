@@ -1,13 +1,18 @@
 import logging
 import os
+import threading
 
 from minio import Minio
 
+from .memory_store import MemoryObjectStore
+
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "minio:9000")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minio_user")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minio_password_123")
 MINIO_BUCKET_NAME = os.getenv("MINIO_BUCKET_NAME", "claims-bucket")
 MINIO_SECURE = os.getenv("MINIO_SECURE", "False").lower() == "true"
+# "memory" swaps MinIO for an in-process store (load tests, local runs without Docker)
+OBJECT_STORE_BACKEND = os.getenv("OBJECT_STORE_BACKEND", "minio").lower()
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +20,7 @@ logger = logging.getLogger(__name__)
 class MinIOClient:
     _instance = None
     _client = None
+    _lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -23,9 +29,15 @@ class MinIOClient:
     
     def __init__(self):
         if self._client is None:
-            self._initialize_client()
+            with self._lock:
+                if self._client is None:
+                    self._initialize_client()
     
     def _initialize_client(self):
+        if OBJECT_STORE_BACKEND == "memory":
+            self._client = MemoryObjectStore()
+            logger.warning("Using the in-memory object store, uploads are not persisted")
+            return
         try:
             self._client = Minio(
                 MINIO_ENDPOINT,
@@ -49,5 +61,10 @@ class MinIOClient:
         return self._client
 
 
-# Global client instance
-minio_client = MinIOClient().get_client()
+def get_minio_client():
+    """
+    The shared client, created (and the bucket checked) on first use rather than on import,
+    so importing the app has no network side effects and is safe before forking workers.
+    """
+    client = MinIOClient._client
+    return client if client is not None else MinIOClient().get_client()
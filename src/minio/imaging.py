@@ -0,0 +1,121 @@
+import logging
+import math
+import os
+from io import BytesIO
+from typing import BinaryIO, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("src.minio")
+
+WEBP_QUALITY = 85
+
+# Vision models bill images by 32px patches, capped at 1536 patches and scaled by a
+# per-model multiplier (1.62 for gpt-5-mini)
+IMAGE_PATCH_SIZE = 32
+IMAGE_MAX_PATCHES = 1536
+IMAGE_TOKEN_MULTIPLIER = float(os.getenv("IMAGE_TOKEN_MULTIPLIER", 1.62))
+
+
+class DerivativeSettings(NamedTuple):
+    max_dimension: int = int(os.getenv("IMAGE_ANALYSIS_MAX_DIM", 1600))
+    max_tokens: int = int(os.getenv("IMAGE_ANALYSIS_MAX_TOKENS", 2000))
+    max_bytes: int = int(os.getenv("IMAGE_ANALYSIS_MAX_BYTES", 400 * 1024))
+    quality: int = int(os.getenv("IMAGE_ANALYSIS_QUALITY", 80))
+    min_quality: int = int(os.getenv("IMAGE_ANALYSIS_MIN_QUALITY", 50))
+    grayscale: bool = os.getenv("IMAGE_ANALYSIS_GRAYSCALE", "False").lower() == "true"
+    autocontrast: bool = os.getenv("IMAGE_ANALYSIS_AUTOCONTRAST", "False").lower() == "true"
+
+
+IMAGE_DERIVATIVE_ENABLED = os.getenv("IMAGE_DERIVATIVE_ENABLED", "True").lower() == "true"
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    patches = math.ceil(width / IMAGE_PATCH_SIZE) * math.ceil(height / IMAGE_PATCH_SIZE)
+    if patches > IMAGE_MAX_PATCHES:
+        shrink = math.sqrt(IMAGE_MAX_PATCHES * IMAGE_PATCH_SIZE ** 2 / (width * height))
+        width, height = width * shrink, height * shrink
+        fit = min(
+            math.floor(width / IMAGE_PATCH_SIZE) / (width / IMAGE_PATCH_SIZE),
+            math.floor(height / IMAGE_PATCH_SIZE) / (height / IMAGE_PATCH_SIZE),
+        )
+        patches = math.ceil(width * fit / IMAGE_PATCH_SIZE) * math.ceil(height * fit / IMAGE_PATCH_SIZE)
+    return int(patches * IMAGE_TOKEN_MULTIPLIER)
+
+
+def load_image_rgb(source: Union[bytes, BinaryIO]) -> Image.Image:
+    # File objects (e.g. an upload's spooled temp file) are decoded in place, without a bytes copy
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    else:
+        source.seek(0)
+    image = Image.open(source)
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def encode_webp(image: Image.Image, quality: int = WEBP_QUALITY) -> bytes:
+    webp_buffer = BytesIO()
+    image.save(webp_buffer, format='WebP', quality=quality)
+    return webp_buffer.getvalue()
+
+
+def _fit_token_budget(width: int, height: int, max_tokens: int) -> Tuple[int, int]:
+    scale = 1.0
+    while estimate_image_tokens(int(width * scale), int(height * scale)) > max_tokens and scale > 0.05:
+        scale *= 0.95
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def make_analysis_derivative(image: Image.Image, settings: Optional[DerivativeSettings] = None) -> bytes:
+    """
+    Build the copy of a claim document sent to the vision models: bounded dimension and
+    estimated token cost, optional grayscale/contrast normalization, and re-encoded
+    (lower quality first, then smaller) until it fits the byte budget.
+    """
+    settings = settings or DerivativeSettings()
+
+    if settings.grayscale:
+        image = image.convert('L')
+    if settings.autocontrast:
+        image = ImageOps.autocontrast(image, cutoff=1)
+
+    width, height = image.size
+    scale = min(1.0, settings.max_dimension / max(width, height))
+    width, height = _fit_token_budget(max(1, int(width * scale)), max(1, int(height * scale)), settings.max_tokens)
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.LANCZOS)
+
+    quality = settings.quality
+    data = encode_webp(image, quality)
+    while len(data) > settings.max_bytes:
+        if quality - 10 >= settings.min_quality:
+            quality -= 10
+        else:
+            width, height = int(image.width * 0.8), int(image.height * 0.8)
+            if min(width, height) < IMAGE_PATCH_SIZE:
+                break
+            image = image.resize((width, height), Image.LANCZOS)
+        data = encode_webp(image, quality)
+    return data
+
+
+def transcode_image(source: Union[bytes, BinaryIO], convert: bool = True, derivative: bool = IMAGE_DERIVATIVE_ENABLED) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """
+    Decode an uploaded image once and produce (stored WebP, analysis derivative).
+    With convert=False the upload is already WebP and is stored as is, so no WebP is returned.
+    """
+    if not convert and not derivative:
+        return None, None
+    image = load_image_rgb(source)
+    original = encode_webp(image) if convert else None
+    analysis = make_analysis_derivative(image) if derivative else None
+    return original, analysis
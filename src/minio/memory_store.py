@@ -0,0 +1,69 @@
+import threading
+from io import BytesIO
+from typing import NamedTuple
+
+from minio.error import S3Error
+
+
+class _Object(NamedTuple):
+    object_name: str
+    size: int
+
+
+class _ObjectResponse(BytesIO):
+    def release_conn(self):
+        pass
+
+
+class MemoryObjectStore:
+    """
+    In-process stand-in for the subset of the Minio client used by this package.
+    Selected with OBJECT_STORE_BACKEND=memory for load tests and local runs; objects are
+    lost when the process exits and are not shared between API workers.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return True
+
+    def make_bucket(self, bucket_name: str):
+        pass
+
+    def _missing(self, bucket_name: str, object_name: str) -> S3Error:
+        return S3Error(None, "NoSuchKey", "Object does not exist", object_name, None, None,
+                       bucket_name=bucket_name, object_name=object_name)
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int, content_type: str = None, **kwargs):
+        content = data.read(length) if length >= 0 else data.read()
+        with self._lock:
+            self._objects[(bucket_name, object_name)] = content
+
+    def get_object(self, bucket_name: str, object_name: str) -> _ObjectResponse:
+        with self._lock:
+            content = self._objects.get((bucket_name, object_name))
+        if content is None:
+            raise self._missing(bucket_name, object_name)
+        return _ObjectResponse(content)
+
+    def stat_object(self, bucket_name: str, object_name: str) -> _Object:
+        with self._lock:
+            content = self._objects.get((bucket_name, object_name))
+        if content is None:
+            raise self._missing(bucket_name, object_name)
+        return _Object(object_name, len(content))
+
+    def remove_object(self, bucket_name: str, object_name: str):
+        with self._lock:
+            self._objects.pop((bucket_name, object_name), None)
+
+    def list_objects(self, bucket_name: str, prefix: str = "", recursive: bool = False):
+        with self._lock:
+            return [_Object(name, len(content)) for (bucket, name), content in self._objects.items()
+                    if bucket == bucket_name and name.startswith(prefix)]
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(len(content) for content in self._objects.values())
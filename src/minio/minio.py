@@ -1,70 +1,157 @@
+import asyncio
+import contextvars
 import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from io import BytesIO
 
 from fastapi import UploadFile
-from PIL import Image
 
 from minio.error import S3Error
 
-from .client import MINIO_BUCKET_NAME, minio_client
+from src.utils.timing import TimingStats
+from src.utils.tracing import span, timed
+
+from .client import MINIO_BUCKET_NAME, get_minio_client
+from .transcoder import image_transcoder
 
 logger = logging.getLogger("src.minio")
 
 SUPPORTED_IMAGE_FORMATS = {'.webp', '.jpg', '.jpeg', '.png', '.bmp', '.tiff'}
 
+# Suffix of the downscaled copy of an image that the vision models analyze
+ANALYSIS_SUFFIX = "_analysis"
 
-def convert_image_to_webp(file_data: bytes, original_filename: str) -> bytes:
-    try:
-        image = Image.open(BytesIO(file_data))
-        
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        webp_buffer = BytesIO()
-        image.save(webp_buffer, format='WebP', quality=85)
-        webp_buffer.seek(0)
-        
-        logger.info(f"Image converted to WebP: {original_filename}")
-        return webp_buffer.getvalue()
-    
-    except Exception as e:
-        logger.error(f"Error converting image to WebP: {e}", exc_info=True)
-        raise
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", 20 * 1024 * 1024))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", 40 * 1024 * 1024))
+# Multipart chunk size when streaming uploads to MinIO (S3 minimum is 5 MiB)
+UPLOAD_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv("UPLOAD_PART_SIZE", 5 * 1024 * 1024)))
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+# The MinIO SDK is blocking, so storage calls made from coroutines run on a
+# dedicated pool instead of the loop's default executor.
+MINIO_IO_WORKERS = int(os.getenv("MINIO_IO_WORKERS", 64))
+storage_executor = ThreadPoolExecutor(max_workers=MINIO_IO_WORKERS, thread_name_prefix="minio-io")
+
+
+async def run_in_storage_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over so spans in func land in the current claim trace
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(storage_executor, partial(context.run, func, *args, **kwargs))
+
+
+# Upload durations (read + transcode + put) keyed by stored file name
+upload_timings = defaultdict(TimingStats)
+
+
+@timed("minio.put")
+async def _put_object(object_name: str, data: bytes, content_type: str):
+    await run_in_storage_executor(_put_bytes_sync, object_name, data, content_type)
+
+
+def _put_bytes_sync(object_name: str, data: bytes, content_type: str):
+    get_minio_client().put_object(
+        bucket_name=MINIO_BUCKET_NAME,
+        object_name=object_name,
+        data=BytesIO(data),
+        length=len(data),
+        content_type=content_type
+    )
+
+
+def _put_stream_sync(object_name: str, stream, length: int, content_type: str):
+    stream.seek(0)
+    get_minio_client().put_object(
+        bucket_name=MINIO_BUCKET_NAME,
+        object_name=object_name,
+        data=stream,
+        length=length,
+        content_type=content_type,
+        part_size=UPLOAD_PART_SIZE
+    )
+
+
+@timed("minio.put_stream")
+async def _put_stream(object_name: str, stream, length: int, content_type: str):
+    # MinIO reads the stream one part at a time, so memory stays bounded by UPLOAD_PART_SIZE
+    await run_in_storage_executor(_put_stream_sync, object_name, stream, length, content_type)
+
+
+def upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+def validate_upload_sizes(files) -> None:
+    """Reject oversized uploads from their spooled sizes, before any of them is read"""
+    total = 0
+    for file in files:
+        size = upload_size(file)
+        if size > MAX_UPLOAD_FILE_BYTES:
+            raise UploadTooLargeError(f"File {file.filename} is {size} bytes, limit is {MAX_UPLOAD_FILE_BYTES}")
+        total += size
+    if total > MAX_UPLOAD_REQUEST_BYTES:
+        raise UploadTooLargeError(f"Uploads total {total} bytes, limit is {MAX_UPLOAD_REQUEST_BYTES}")
 
 
+def analysis_object_name(name: str) -> str:
+    return name.rsplit('.', 1)[0] + ANALYSIS_SUFFIX + '.webp'
+
+
+@timed("minio.upload_file")
 async def upload_file_to_minio(file: UploadFile, claim_id: int, filename: str = None) -> str:
     try:
+        start = time.perf_counter()
         name = filename or file.filename
-        file_data = await file.read()
+        size = upload_size(file)
+        if size > MAX_UPLOAD_FILE_BYTES:
+            raise UploadTooLargeError(f"File {name} is {size} bytes, limit is {MAX_UPLOAD_FILE_BYTES}")
         
+        # Converted images are stored from memory; everything else streams from the upload spool
+        file_data = None
+        derivative_data = None
+        content_type = file.content_type
         file_extension = name.lower().rsplit('.', 1)[-1] if '.' in name else ''
         if f'.{file_extension}' in SUPPORTED_IMAGE_FORMATS:
             if file_extension != 'webp':
                 logger.info(f"Converting image to WebP: {name}")
-                file_data = convert_image_to_webp(file_data, name)
                 name = name.rsplit('.', 1)[0] + '.webp'
             else:
                 logger.info(f"Image already in WebP format, skipping conversion: {name}")
+            content_type = 'image/webp'
+            # Pool processes cannot read the spooled file, so only they get a bytes copy
+            source = file.file if image_transcoder.in_process else await file.read()
+            with span("image.transcode"):
+                file_data, derivative_data = await image_transcoder.transcode(source, convert=file_extension != 'webp')
+            del source
         
         object_name = f"{claim_id}/{name}"
         
         logger.info(f"Uploading file: {object_name}")
         
-        minio_client.put_object(
-            bucket_name=MINIO_BUCKET_NAME,
-            object_name=object_name,
-            data=BytesIO(file_data),
-            length=len(file_data),
-            content_type='image/webp' if name.endswith('.webp') else file.content_type
-        )
+        if file_data is not None:
+            puts = [_put_object(object_name, file_data, content_type)]
+            size = len(file_data)
+        else:
+            puts = [_put_stream(object_name, file.file, size, content_type)]
+        if derivative_data is not None:
+            puts.append(_put_object(f"{claim_id}/{analysis_object_name(name)}", derivative_data, 'image/webp'))
+        await asyncio.gather(*puts)
         
-        logger.info(f"File uploaded successfully: {object_name}")
+        elapsed = time.perf_counter() - start
+        upload_timings[name].observe(elapsed)
+        logger.info(f"File uploaded successfully: {object_name} ({size} bytes in {elapsed:.3f}s)")
         return object_name
     
     except S3Error as e:
@@ -77,7 +164,7 @@ async def upload_file_to_minio(file: UploadFile, claim_id: int, filename: str =
 
 def get_file_from_minio(object_path: str):
     try:
-        response = minio_client.get_object(MINIO_BUCKET_NAME, object_path)
+        response = get_minio_client().get_object(MINIO_BUCKET_NAME, object_path)
         logger.info(f"File retrieved: {object_path}")
         return response
     except (S3Error, Exception) as e:
@@ -89,19 +176,38 @@ def get_file_from_minio_sync(object_path: str):
     return get_file_from_minio(object_path)
 
 
-def get_image_from_minio(claim_id: str) -> bytes:
+def _read_object(object_path: str):
+    """Object content, or None if it does not exist"""
+    try:
+        response = get_minio_client().get_object(MINIO_BUCKET_NAME, object_path)
+    except S3Error as e:
+        if 'NoSuchKey' in str(e) or 'Not Found' in str(e):
+            return None
+        raise
     try:
-        object_path = f"{claim_id}/image.webp"
-        response = minio_client.get_object(MINIO_BUCKET_NAME, object_path)
-        image_bytes = response.read()
+        return response.read()
+    finally:
         response.close()
         response.release_conn()
+
+
+@timed("minio.get_image")
+def get_image_from_minio(claim_id: str, original: bool = False) -> bytes:
+    """Claim image as sent to the vision models: the analysis derivative unless original=True"""
+    try:
+        if not original:
+            image_bytes = _read_object(f"{claim_id}/{analysis_object_name('image.webp')}")
+            if image_bytes is not None:
+                logger.info(f"Analysis image retrieved for claim {claim_id}")
+                return image_bytes
+        # Claims uploaded before derivatives existed only have the full-size image
+        image_bytes = _read_object(f"{claim_id}/image.webp")
+        if image_bytes is None:
+            logger.info(f"No image found for claim {claim_id}")
+            return None
         logger.info(f"Image retrieved for claim {claim_id}")
         return image_bytes
     except S3Error as e:
-        if 'NoSuchKey' in str(e) or 'Not Found' in str(e):
-            logger.info(f"No image found for claim {claim_id}")
-            return None
         logger.error(f"Error retrieving image for claim {claim_id}: {e}")
         raise
     except Exception as e:
@@ -109,10 +215,15 @@ def get_image_from_minio(claim_id: str) -> bytes:
         raise
 
 
+async def aget_image_from_minio(claim_id: str, original: bool = False) -> bytes:
+    return await run_in_storage_executor(get_image_from_minio, claim_id, original)
+
+
+@timed("minio.get_metadata")
 def get_claim_metadata(claim_id: str) -> str:
     try:
         metadata_path = f"{claim_id}/metadata.md"
-        response = minio_client.get_object(MINIO_BUCKET_NAME, metadata_path)
+        response = get_minio_client().get_object(MINIO_BUCKET_NAME, metadata_path)
         metadata_content = response.read().decode("utf-8")
         response.close()
         response.release_conn()
@@ -123,9 +234,17 @@ def get_claim_metadata(claim_id: str) -> str:
         raise
 
 
+async def aget_claim_metadata(claim_id: str) -> str:
+    return await run_in_storage_executor(get_claim_metadata, claim_id)
+
+
+def _remove_object_sync(object_path: str):
+    get_minio_client().remove_object(MINIO_BUCKET_NAME, object_path)
+
+
 async def delete_file_from_minio(object_path: str) -> bool:
     try:
-        minio_client.remove_object(MINIO_BUCKET_NAME, object_path)
+        await run_in_storage_executor(_remove_object_sync, object_path)
         logger.info(f"File deleted: {object_path}")
         return True
     except (S3Error, Exception) as e:
@@ -133,13 +252,25 @@ async def delete_file_from_minio(object_path: str) -> bool:
         raise
 
 
+def _list_object_names(prefix: str):
+    return [obj.object_name for obj in get_minio_client().list_objects(MINIO_BUCKET_NAME, prefix=prefix)]
+
+
 async def list_files_in_minio(claim_id: int):
     try:
         prefix = f"{claim_id}/"
-        objects = minio_client.list_objects(MINIO_BUCKET_NAME, prefix=prefix)
-        file_list = [obj.object_name for obj in objects]
+        file_list = await run_in_storage_executor(_list_object_names, prefix)
         logger.info(f"Listed {len(file_list)} files for claim {claim_id}")
         return file_list
     except (S3Error, Exception) as e:
         logger.error(f"Error listing files for claim {claim_id}: {e}")
         raise
+
+
+async def delete_claim_files(claim_id: str) -> None:
+    """Best-effort removal of everything stored for a claim, e.g. after a partial upload"""
+    try:
+        file_list = await list_files_in_minio(claim_id)
+        await asyncio.gather(*(delete_file_from_minio(path) for path in file_list), return_exceptions=True)
+    except Exception as e:
+        logger.error(f"Error cleaning up files for claim {claim_id}: {e}")
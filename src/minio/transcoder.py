@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Optional, Tuple, Union
+
+from src.utils.timing import TimingStats
+from src.utils.tracing import record_span
+
+from .imaging import IMAGE_DERIVATIVE_ENABLED, transcode_image
+
+logger = logging.getLogger("src.minio")
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", 32))
+IMAGE_TRANSCODE_TIMEOUT = float(os.getenv("IMAGE_TRANSCODE_TIMEOUT", 30))
+
+
+class TranscoderBusyError(Exception):
+    pass
+
+
+class TranscodeTimeoutError(Exception):
+    pass
+
+
+class TranscodeFailedError(Exception):
+    pass
+
+
+def _timed_transcode(source: Union[bytes, BinaryIO], convert: bool, derivative: bool):
+    # Runs in a pool process or thread: report when work started and how long it took
+    started_at = time.time()
+    start = time.perf_counter()
+    result = transcode_image(source, convert=convert, derivative=derivative)
+    return result, started_at, time.perf_counter() - start
+
+
+def _noop():
+    return None
+
+
+class ImageTranscoder:
+    """
+    Runs Pillow decode/encode in a process pool so it never blocks the event loop.
+
+    At most queue_size images are admitted (running or waiting for a worker); further
+    requests fail fast with TranscoderBusyError. A timed-out job is abandoned by the caller
+    but keeps its worker, and its admission slot, until Pillow returns. A pool whose worker
+    died (e.g. killed for memory on a decompression bomb) is replaced on the next request.
+    """
+
+    def __init__(self, workers: int = IMAGE_WORKERS, queue_size: int = IMAGE_QUEUE_SIZE, timeout: float = IMAGE_TRANSCODE_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._admitted = 0
+        self.queue_wait = TimingStats()
+        self.encode = TimingStats()
+        self.timeouts = 0
+        self.rejections = 0
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def start(self):
+        # Fork the workers at startup, before the process has many threads, instead of on the first upload
+        pool = self._get_pool()
+        if pool is not None:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.workers)))
+            logger.info(f"Image transcoder started with {self.workers} worker processes (queue size {self.queue_size})")
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future: asyncio.Future):
+        self._admitted -= 1
+        # Retrieve the outcome of abandoned jobs so it is not reported as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+    async def stop(self, wait: bool = False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def in_process(self) -> bool:
+        """True when transcoding runs in a thread of this process and can read file objects directly"""
+        return self.workers <= 0
+
+    async def transcode(self, source: Union[bytes, BinaryIO], convert: bool = True, derivative: bool = IMAGE_DERIVATIVE_ENABLED) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """(WebP to store or None if the upload is stored as is, analysis derivative or None)"""
+        if self._admitted >= self.queue_size:
+            self.rejections += 1
+            raise TranscoderBusyError(f"Image transcoding queue is full ({self.queue_size} images)")
+
+        submitted_at = time.time()
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(pool, _timed_transcode, source, convert, derivative)
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            raise TranscodeFailedError(f"Image transcoding worker pool is broken: {e}")
+        # The slot is held until the work really ends, not until the caller stops waiting for it
+        self._admitted += 1
+        future.add_done_callback(self._release)
+        try:
+            result, started_at, encode_seconds = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TranscodeTimeoutError(f"Image transcoding timed out after {self.timeout}s")
+        except BrokenProcessPool as e:
+            logger.error(f"Image transcoding worker died, restarting the pool: {e}")
+            self._discard_pool(pool)
+            raise TranscodeFailedError(f"Image transcoding worker died: {e}")
+
+        self.queue_wait.observe(max(0.0, started_at - submitted_at))
+        self.encode.observe(encode_seconds)
+        # Measured in the worker: place it on this process's clock for the claim's trace
+        record_span("image.convert_webp", time.perf_counter() - (time.time() - started_at), seconds=encode_seconds)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._admitted,
+            "queue_wait": self.queue_wait.summary(),
+            "encode": self.encode.summary(),
+            "timeouts": self.timeouts,
+            "rejections": self.rejections,
+        }
+
+
+image_transcoder = ImageTranscoder()
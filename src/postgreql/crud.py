@@ -1,22 +1,483 @@
-from sqlalchemy import select
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import (and_, bindparam, func, insert, or_, select, tuple_,
+                        update)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .models import Claim
+from src.utils.schemas import ClaimStatus, JobStatus
+from src.utils.tracing import timed
+
+from .models import Claim, ClaimJob, ClaimTokenUsage
+
+
+@timed("db.create_claim")
+async def create_claim(
+    db: AsyncSession, claim_id: str, decision: str, explanation: str = None, decided_at: datetime = None,
+    idempotency_key: str = None, fingerprint: str = None
+) -> Claim:
+    """decided_at, if given, is stored as both created_at and completed_at"""
+    db_claim = Claim(
+        claim_id=claim_id,
+        status=ClaimStatus.DONE.value,
+        decision=decision,
+        explanation=explanation,
+        created_at=decided_at or func.now(),
+        completed_at=decided_at or func.now(),
+        idempotency_key=idempotency_key,
+        fingerprint=fingerprint
+    )
+    db.add(db_claim)
+    await db.commit()
+    return db_claim
+
+
+@timed("db.create_pending_claim")
+async def create_pending_claim(
+    db: AsyncSession, claim_id: str, idempotency_key: str = None, fingerprint: str = None,
+    enqueue: bool = False, claim_text: str = None, priority: str = None
+) -> Claim:
+    """With enqueue, the agent run is queued in claim_jobs for the workers in the same transaction"""
+    db_claim = Claim(
+        claim_id=claim_id,
+        status=ClaimStatus.PENDING.value,
+        idempotency_key=idempotency_key,
+        fingerprint=fingerprint,
+        priority=priority
+    )
+    db.add(db_claim)
+    if enqueue:
+        db.add(ClaimJob(
+            claim_id=claim_id,
+            claim_text=claim_text,
+            priority=priority,
+            status=JobStatus.QUEUED.value,
+            available_at=datetime.now(timezone.utc)
+        ))
+    await db.commit()
+    return db_claim
 
 
-async def create_claim(db: AsyncSession, claim_id: str, decision: str, explanation: str = None) -> Claim:
-    db_claim = Claim(claim_id=claim_id, decision=decision, explanation=explanation)
+@timed("db.create_rejected_claim")
+async def create_rejected_claim(db: AsyncSession, claim_id: str, error: str, decided_at: datetime = None) -> Claim:
+    db_claim = Claim(
+        claim_id=claim_id,
+        status=ClaimStatus.FAILED.value,
+        error=error,
+        created_at=decided_at or func.now(),
+        completed_at=decided_at or func.now()
+    )
     db.add(db_claim)
     await db.commit()
-    await db.refresh(db_claim)
     return db_claim
 
 
+async def _update_claim(db: AsyncSession, claim_id: str, **values) -> None:
+    await db.execute(update(Claim).where(Claim.claim_id == claim_id).values(**values))
+    await db.commit()
+
+
+@timed("db.mark_claim_running")
+async def mark_claim_running(db: AsyncSession, claim_id: str) -> None:
+    await _update_claim(db, claim_id, status=ClaimStatus.RUNNING.value, started_at=func.now())
+
+
+def usage_values(claim_id: str, usage) -> list:
+    """claim_token_usage column values for the rows of a ClaimUsage"""
+    return [
+        dict(claim_id=claim_id, kind=kind, model=model, cost_usd=counts.cost_usd, **counts._asdict())
+        for (kind, model), counts in usage.rows.items()
+    ]
+
+
+def _usage_rows(claim_id: str, usage) -> list:
+    return [ClaimTokenUsage(**values) for values in usage_values(claim_id, usage)]
+
+
+@timed("db.complete_claim")
+async def complete_claim(db: AsyncSession, claim_id: str, decision: str, explanation: str = None, usage=None) -> None:
+    """Store the decision and, in the same transaction, the ClaimUsage token counts if given"""
+    if usage is not None:
+        db.add_all(_usage_rows(claim_id, usage))
+    await _update_claim(
+        db,
+        claim_id,
+        status=ClaimStatus.DONE.value,
+        decision=decision,
+        explanation=explanation,
+        completed_at=func.now()
+    )
+
+
+@timed("db.fail_claim")
+async def fail_claim(db: AsyncSession, claim_id: str, error: str) -> None:
+    await _update_claim(
+        db,
+        claim_id,
+        status=ClaimStatus.FAILED.value,
+        error=error,
+        completed_at=func.now()
+    )
+
+
+@timed("db.write_claim_batch")
+async def write_claim_batch(db: AsyncSession, inserts: list = (), updates: list = (), usage: list = ()) -> None:
+    """
+    Write many claim outcomes in one transaction: new finished claims as one multi-row INSERT,
+    outcomes of existing claims as one executemany UPDATE per set of columns, and their token usage rows.
+    Inserted rows carry their own created_at and completed_at, updated claims get completed_at = now().
+    """
+    claims = Claim.__table__
+    if inserts:
+        await db.execute(insert(claims), list(inserts))
+
+    by_columns = {}
+    for values in updates:
+        by_columns.setdefault(tuple(sorted(values)), []).append(values)
+    for columns, rows in by_columns.items():
+        statement = (
+            update(claims)
+            .where(claims.c.claim_id == bindparam("b_claim_id"))
+            .values(completed_at=func.now(), **{column: bindparam(column) for column in columns if column != "b_claim_id"})
+        )
+        await db.execute(statement, rows)
+
+    if usage:
+        await db.execute(insert(ClaimTokenUsage.__table__), list(usage))
+    await db.commit()
+
+
+# Claims run by the in-process runner (CLAIM_QUEUE_BACKEND=memory). The runner refreshes updated_at of the
+# claims it holds, so claims left PENDING or RUNNING by a stopped process go stale and are taken over.
+# Staleness is judged on the API clock, which only needs to agree with the database to well within CLAIM_ORPHAN_SECONDS.
+
+@timed("db.touch_claims")
+async def touch_claims(db: AsyncSession, claim_ids: list) -> None:
+    """Heartbeat of the claims queued or running in this process"""
+    await db.execute(
+        update(Claim)
+        .where(Claim.claim_id.in_(claim_ids), Claim.status.in_([ClaimStatus.PENDING.value, ClaimStatus.RUNNING.value]))
+        .values(updated_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+@timed("db.recover_orphaned_claims")
+async def recover_orphaned_claims(db: AsyncSession, stale_before: datetime, limit: int, claim_ids: list = None) -> list:
+    """
+    Take over up to limit PENDING or RUNNING claims not updated since stale_before and not in the
+    claim_jobs queue, oldest first: they are set back to PENDING with a fresh updated_at, so another
+    process sweeping at the same time skips them. Returns their (claim id, priority) pairs.
+    """
+    if limit <= 0:
+        return []
+    orphaned = (
+        select(Claim.id)
+        .where(
+            Claim.status.in_([ClaimStatus.PENDING.value, ClaimStatus.RUNNING.value]),
+            Claim.updated_at < stale_before,
+            ~select(ClaimJob.id).where(ClaimJob.claim_id == Claim.claim_id).exists()
+        )
+        .order_by(Claim.created_at, Claim.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if claim_ids:
+        orphaned = orphaned.where(Claim.claim_id.in_(claim_ids))
+    result = await db.execute(
+        update(Claim)
+        .where(Claim.id.in_(orphaned), Claim.updated_at < stale_before)
+        .values(status=ClaimStatus.PENDING.value, started_at=None, updated_at=datetime.now(timezone.utc))
+        .returning(Claim.claim_id, Claim.priority)
+        .execution_options(synchronize_session=False)
+    )
+    recovered = [tuple(row) for row in result.all()]
+    await db.commit()
+    return recovered
+
+
+# Claim job queue. Lease times come from the worker clocks, which only need to agree to well within a lease.
+
+@timed("db.lease_claim_jobs")
+async def lease_claim_jobs(db: AsyncSession, worker_id: str, limit: int, lease_seconds: float, max_attempts: int) -> list:
+    """
+    Lease up to limit jobs to worker_id: queued jobs that are due, oldest first, and running jobs whose
+    lease expired with attempts left. Rows locked by another worker are skipped (FOR UPDATE SKIP LOCKED),
+    so concurrent workers never lease the same job. Returns rows of (id, claim_id, claim_text, priority, attempts).
+    """
+    now = datetime.now(timezone.utc)
+    runnable = (
+        select(ClaimJob.id)
+        .where(or_(
+            and_(ClaimJob.status == JobStatus.QUEUED.value, ClaimJob.available_at <= now),
+            and_(
+                ClaimJob.status == JobStatus.RUNNING.value,
+                ClaimJob.lease_expires_at < now,
+                ClaimJob.attempts < max_attempts
+            ),
+        ))
+        .order_by(ClaimJob.available_at, ClaimJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        update(ClaimJob)
+        .where(ClaimJob.id.in_(runnable))
+        .values(
+            status=JobStatus.RUNNING.value,
+            attempts=ClaimJob.attempts + 1,
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            heartbeat_at=now
+        )
+        .returning(ClaimJob.id, ClaimJob.claim_id, ClaimJob.claim_text, ClaimJob.priority, ClaimJob.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    jobs = result.all()
+    await db.commit()
+    return jobs
+
+
+def _leased_job(job_id: int, worker_id: str):
+    return update(ClaimJob).where(
+        ClaimJob.id == job_id,
+        ClaimJob.lease_owner == worker_id,
+        ClaimJob.status == JobStatus.RUNNING.value
+    ).execution_options(synchronize_session=False)
+
+
+@timed("db.renew_claim_job_lease")
+async def renew_claim_job_lease(db: AsyncSession, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """Heartbeat: extend the lease; False if the worker no longer holds it"""
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        _leased_job(job_id, worker_id).values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def _finish_leased_job(db: AsyncSession, job_id: int, worker_id: str, claim_id: str, job_values: dict, claim_values: dict, usage=None) -> bool:
+    # The job row is updated first: it is only written while the lease is held, and then locked until commit
+    result = await db.execute(
+        _leased_job(job_id, worker_id).values(lease_owner=None, lease_expires_at=None, **job_values)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+    if usage is not None:
+        db.add_all(_usage_rows(claim_id, usage))
+    await _update_claim(db, claim_id, **claim_values)
+    return True
+
+
+@timed("db.complete_claim_job")
+async def complete_claim_job(
+    db: AsyncSession, job_id: int, worker_id: str, claim_id: str, decision: str, explanation: str = None, usage=None
+) -> bool:
+    """Store the decision and close the job in one transaction; False, with nothing written, if the lease was lost"""
+    return await _finish_leased_job(
+        db, job_id, worker_id, claim_id,
+        job_values=dict(status=JobStatus.DONE.value, last_error=None),
+        claim_values=dict(status=ClaimStatus.DONE.value, decision=decision, explanation=explanation, error=None, completed_at=func.now()),
+        usage=usage,
+    )
+
+
+@timed("db.retry_claim_job")
+async def retry_claim_job(db: AsyncSession, job_id: int, worker_id: str, claim_id: str, error: str, retry_at: datetime) -> bool:
+    """Queue the job again from retry_at, the claim back to PENDING with the error of the failed attempt"""
+    return await _finish_leased_job(
+        db, job_id, worker_id, claim_id,
+        job_values=dict(status=JobStatus.QUEUED.value, available_at=retry_at, last_error=error),
+        claim_values=dict(status=ClaimStatus.PENDING.value, error=error),
+    )
+
+
+@timed("db.dead_letter_claim_job")
+async def dead_letter_claim_job(db: AsyncSession, job_id: int, worker_id: str, claim_id: str, error: str) -> bool:
+    """Park the job as DEAD after its last attempt and fail the claim"""
+    return await _finish_leased_job(
+        db, job_id, worker_id, claim_id,
+        job_values=dict(status=JobStatus.DEAD.value, last_error=error),
+        claim_values=dict(status=ClaimStatus.FAILED.value, error=error, completed_at=func.now()),
+    )
+
+
+@timed("db.dead_letter_expired_claim_jobs")
+async def dead_letter_expired_claim_jobs(db: AsyncSession, max_attempts: int) -> list:
+    """Dead-letter running jobs whose lease expired on their last attempt (the worker died every time); returns their claim ids"""
+    now = datetime.now(timezone.utc)
+    error = f"Worker lease expired on the last of {max_attempts} attempts"
+    expired = (
+        select(ClaimJob.id)
+        .where(
+            ClaimJob.status == JobStatus.RUNNING.value,
+            ClaimJob.lease_expires_at < now,
+            ClaimJob.attempts >= max_attempts
+        )
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        update(ClaimJob)
+        .where(ClaimJob.id.in_(expired))
+        .values(
+            status=JobStatus.DEAD.value,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=error
+        )
+        .returning(ClaimJob.claim_id)
+        .execution_options(synchronize_session=False)
+    )
+    dead = result.scalars().all()
+    if dead:
+        await db.execute(
+            update(Claim)
+            .where(Claim.claim_id.in_(dead))
+            .values(status=ClaimStatus.FAILED.value, error=error, completed_at=func.now())
+        )
+    await db.commit()
+    return dead
+
+
+@timed("db.requeue_dead_claim_jobs")
+async def requeue_dead_claim_jobs(db: AsyncSession, claim_ids: list = None) -> tuple:
+    """
+    Give dead-lettered jobs (all, or those of claim_ids) a fresh set of attempts and their claims back
+    to PENDING. A claim whose files were submitted again after it failed would break the active
+    fingerprint index and is left dead. Returns (requeued claim ids, claim ids left dead).
+    """
+    query = select(ClaimJob.claim_id).where(ClaimJob.status == JobStatus.DEAD.value)
+    if claim_ids:
+        query = query.where(ClaimJob.claim_id.in_(claim_ids))
+    dead = (await db.execute(query.with_for_update(skip_locked=True))).scalars().all()
+
+    now = datetime.now(timezone.utc)
+    requeued, conflicting = [], []
+    for claim_id in dead:
+        try:
+            async with db.begin_nested():
+                await db.execute(
+                    update(Claim)
+                    .where(Claim.claim_id == claim_id)
+                    .values(status=ClaimStatus.PENDING.value, error=None, completed_at=None)
+                )
+                await db.execute(
+                    update(ClaimJob)
+                    .where(ClaimJob.claim_id == claim_id)
+                    .values(status=JobStatus.QUEUED.value, attempts=0, available_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            requeued.append(claim_id)
+        except IntegrityError:
+            conflicting.append(claim_id)
+    await db.commit()
+    return requeued, conflicting
+
+
+@timed("db.count_claim_jobs")
+async def count_claim_jobs(db: AsyncSession) -> dict:
+    result = await db.execute(select(ClaimJob.status, func.count()).group_by(ClaimJob.status))
+    return {status: count for status, count in result.all()}
+
+
+@timed("db.get_claim_by_id")
 async def get_claim_by_id(db: AsyncSession, claim_id: str) -> Claim:
     result = await db.execute(select(Claim).where(Claim.claim_id == claim_id))
     return result.scalar_one_or_none()
 
 
-async def get_all_claims(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(Claim).offset(skip).limit(limit))
+def claims_query(after=None, decision: str = None, status: str = None, since: datetime = None, until: datetime = None):
+    """
+    Claims newest first, ordered on (created_at, id) so pages are stable while claims are inserted.
+    after is the (created_at, id) of the last claim of the previous page.
+    """
+    query = select(Claim)
+    if decision is not None:
+        query = query.where(Claim.decision == decision)
+    if status is not None:
+        query = query.where(Claim.status == status)
+    if since is not None:
+        query = query.where(Claim.created_at >= since)
+    if until is not None:
+        query = query.where(Claim.created_at < until)
+    if after is not None:
+        query = query.where(tuple_(Claim.created_at, Claim.id) < tuple_(*after))
+    return query.order_by(Claim.created_at.desc(), Claim.id.desc())
+
+
+@timed("db.find_duplicate_claim")
+async def find_duplicate_claim(db: AsyncSession, idempotency_key: str = None, fingerprint: str = None) -> Claim:
+    """
+    The unfailed claim submitted with this Idempotency-Key, else the unfailed claim with the same files.
+    A failed claim (e.g. answered 503 by a full queue) gives up its key, so retrying it submits anew.
+    """
+    if idempotency_key is not None:
+        result = await db.execute(select(Claim).where(Claim.idempotency_key == idempotency_key))
+        claim = result.scalar_one_or_none()
+        if claim is not None and claim.status != ClaimStatus.FAILED.value:
+            return claim
+        if claim is not None:
+            await db.execute(
+                update(Claim)
+                .where(Claim.id == claim.id, Claim.status == ClaimStatus.FAILED.value)
+                .values(idempotency_key=None)
+            )
+            await db.commit()
+    if fingerprint is not None:
+        result = await db.execute(
+            select(Claim).where(Claim.fingerprint == fingerprint, Claim.status != ClaimStatus.FAILED.value).limit(1)
+        )
+        return result.scalar_one_or_none()
+    return None
+
+
+@timed("db.get_all_claims")
+async def get_all_claims(db: AsyncSession, skip: int = 0, limit: int = 100, after=None, **filters):
+    result = await db.execute(claims_query(after=after, **filters).offset(skip).limit(limit))
     return result.scalars().all()
+
+
+async def stream_claims(db: AsyncSession, batch_size: int = 500, **filters):
+    """Async iterator over all matching claims, fetched from a server-side cursor in batches"""
+    result = await db.stream_scalars(claims_query(**filters).execution_options(yield_per=batch_size))
+    async for claim in result:
+        yield claim
+
+
+_USAGE_COLUMNS = ("calls", "input_tokens", "cached_tokens", "output_tokens", "reasoning_tokens", "image_tokens", "cost_usd")
+
+
+@timed("db.get_claim_usage")
+async def get_claim_usage(db: AsyncSession, claim_id: str):
+    result = await db.execute(
+        select(ClaimTokenUsage).where(ClaimTokenUsage.claim_id == claim_id).order_by(ClaimTokenUsage.kind)
+    )
+    return result.scalars().all()
+
+
+@timed("db.get_usage_summary")
+async def get_usage_summary(db: AsyncSession, since: datetime = None, until: datetime = None, kind: str = None):
+    """(number of claims, rows of summed usage columns per kind and model) over the time range"""
+    filters = []
+    if since is not None:
+        filters.append(ClaimTokenUsage.created_at >= since)
+    if until is not None:
+        filters.append(ClaimTokenUsage.created_at < until)
+    if kind is not None:
+        filters.append(ClaimTokenUsage.kind == kind)
+
+    claims = await db.scalar(select(func.count(func.distinct(ClaimTokenUsage.claim_id))).where(*filters))
+    result = await db.execute(
+        select(
+            ClaimTokenUsage.kind,
+            ClaimTokenUsage.model,
+            *(func.coalesce(func.sum(getattr(ClaimTokenUsage, column)), 0).label(column) for column in _USAGE_COLUMNS)
+        )
+        .where(*filters)
+        .group_by(ClaimTokenUsage.kind, ClaimTokenUsage.model)
+        .order_by(ClaimTokenUsage.kind, ClaimTokenUsage.model)
+    )
+    return claims or 0, result.all()
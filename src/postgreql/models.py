@@ -1,4 +1,5 @@
-from sqlalchemy import Column, DateTime, Integer, String, Text, func
+from sqlalchemy import (Column, DateTime, Float, ForeignKey, Index, Integer,
+                        String, Text, func, text)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -9,10 +10,83 @@ class Claim(Base):
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     claim_id = Column(String, unique=True, index=True, nullable=False)
-    decision = Column(String, nullable=False) 
+    status = Column(String, default="PENDING", index=True, nullable=False)
+    decision = Column(String, nullable=True)
     explanation = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    # Client Idempotency-Key header and sha256 of the submitted files, to answer retries with the same claim
+    idempotency_key = Column(String, nullable=True)
+    fingerprint = Column(String(64), nullable=True)
+    # Model rate limiter lane of the agent run, kept so a claim taken over after a restart runs in the same lane
+    priority = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), alone or after an equality filter
+        Index("ix_claims_created_at_id", "created_at", "id"),
+        Index("ix_claims_decision_created_at_id", "decision", "created_at", "id"),
+        Index("ix_claims_status_created_at_id", "status", "created_at", "id"),
+        Index("ux_claims_idempotency_key", "idempotency_key", unique=True),
+        # A failed claim does not block submitting the same files again
+        Index(
+            "ux_claims_fingerprint_active", "fingerprint", unique=True,
+            postgresql_where=text("status <> 'FAILED'"), sqlite_where=text("status <> 'FAILED'"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Claim(id={self.id}, claim_id='{self.claim_id}', status='{self.status}', decision='{self.decision}')>"
+
+
+class ClaimTokenUsage(Base):
+    """Tokens spent on one claim, one row per kind of call (agent, vision.ocr, ...) and model"""
+    __tablename__ = "claim_token_usage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    claim_id = Column(String, ForeignKey("claims.claim_id", ondelete="CASCADE"), index=True, nullable=False)
+    kind = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    calls = Column(Integer, default=0, nullable=False)
+    input_tokens = Column(Integer, default=0, nullable=False)
+    cached_tokens = Column(Integer, default=0, nullable=False)
+    output_tokens = Column(Integer, default=0, nullable=False)
+    reasoning_tokens = Column(Integer, default=0, nullable=False)
+    image_tokens = Column(Integer, default=0, nullable=False)
+    cost_usd = Column(Float, default=0.0, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=func.now(), index=True, nullable=False)
+
+    def __repr__(self):
+        return f"<ClaimTokenUsage(claim_id='{self.claim_id}', kind='{self.kind}', input={self.input_tokens}, output={self.output_tokens})>"
+
+
+class ClaimJob(Base):
+    """Agent run of a claim queued for the worker fleet (CLAIM_QUEUE_BACKEND=postgres), leased by one worker at a time"""
+    __tablename__ = "claim_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    claim_id = Column(String, ForeignKey("claims.claim_id", ondelete="CASCADE"), unique=True, nullable=False)
+    # Validated claim message from the submission; without it the agent reads it from storage
+    claim_text = Column(Text, nullable=True)
+    status = Column(String, default="QUEUED", nullable=False)
+    # Model rate limiter lane of the agent run (interactive | batch)
+    priority = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime(timezone=True), nullable=False)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Due queued jobs, and running jobs whose worker stopped renewing its lease
+        Index("ix_claim_jobs_status_available_at", "status", "available_at"),
+        Index("ix_claim_jobs_status_lease_expires_at", "status", "lease_expires_at"),
+    )
 
     def __repr__(self):
-        return f"<Claim(id={self.id}, claim_id='{self.claim_id}', decision='{self.decision}')>"
+        return f"<ClaimJob(id={self.id}, claim_id='{self.claim_id}', status='{self.status}', attempts={self.attempts})>"
@@ -1,6 +1,7 @@
 import os
 from contextlib import asynccontextmanager
 
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -31,9 +32,48 @@ async_session = sessionmaker(
 )
 
 
+# Values given to existing rows when a NOT NULL column is added to a table created by an earlier
+# version: claims stored before the status column existed were all decided synchronously
+BACKFILL_DEFAULTS = {
+    ("claims", "status"): "'DONE'",
+}
+
+
+def _add_missing_columns(conn, table):
+    existing = {column["name"]: column for column in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        column_type = column.type.compile(dialect=conn.dialect)
+        if column.name not in existing:
+            if column.nullable:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                continue
+            backfill = BACKFILL_DEFAULTS.get((table.name, column.name))
+            if backfill is None:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} to existing rows, migrate it by hand")
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type} NOT NULL DEFAULT {backfill}"))
+            if conn.dialect.name == "postgresql":
+                # New rows get their value from the model, as for tables created from scratch
+                conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP DEFAULT"))
+        elif column.nullable and not existing[column.name]["nullable"]:
+            # e.g. claims.decision, empty until a claim finishes
+            if conn.dialect.name != "postgresql":
+                raise RuntimeError(f"Cannot make {table.name}.{column.name} nullable on {conn.dialect.name}, migrate it by hand")
+            conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"))
+
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    # create_all skips tables that already exist: bring tables created by earlier versions up to date
+    # (added columns, columns that became nullable), then create indexes added later, which may use those columns
+    for table in Base.metadata.sorted_tables:
+        _add_missing_columns(conn, table)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_schema)
 
 
 async def get_db():
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from src.utils.schemas import ClaimStatus
+from src.utils.tracing import record_span, stage_metrics
+
+from . import crud
+from .session import async_session
+
+logger = logging.getLogger("src.postgreql.writer")
+
+# direct: every outcome is its own transaction | batched: write-behind buffer flushed in multi-row statements
+DECISION_WRITE_MODE = os.getenv("DECISION_WRITE_MODE", "direct").lower()
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 100))
+WRITE_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_FLUSH_INTERVAL_MS", 20))
+
+
+class _PendingWrite(NamedTuple):
+    insert: Optional[dict]
+    update: Optional[dict]
+    usage: list
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class DecisionWriter:
+    """
+    Write-behind persistence of claim outcomes (decisions, failures, rejections).
+
+    In batched mode outcomes are buffered and flushed together when batch_size of them are
+    waiting or the oldest has waited flush_interval seconds, in one transaction of multi-row
+    statements. Callers still await their write: it returns only once the batch is committed,
+    so a decision is never acknowledged before it is durable. If a batch fails, its writes are
+    retried one transaction each so that one bad row does not fail the others.
+    """
+
+    def __init__(self, mode: str = DECISION_WRITE_MODE, batch_size: int = WRITE_BATCH_SIZE, flush_interval: float = WRITE_FLUSH_INTERVAL_MS / 1000):
+        self.batched = mode == "batched"
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._wakeup = None
+        self._full = None
+        self._task = None
+        self._stopping = False
+        self.flushes = 0
+        self.rows = 0
+        self.failed_batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if not self.batched:
+            return
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Decision writer started (batch size {self.batch_size}, flush interval {self.flush_interval * 1000:.0f}ms)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Let the flush loop drain the buffer instead of cancelling it mid-batch
+        self._stopping = True
+        self._full.set()
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        logger.info(f"Decision writer stopped after {self.flushes} flushes of {self.rows} writes")
+
+    async def create_claim(
+        self, db, claim_id: str, decision: str, explanation: str = None, decided_at: datetime = None,
+        idempotency_key: str = None, fingerprint: str = None
+    ):
+        """Record a new claim that was decided at submission"""
+        if not self.running:
+            return await crud.create_claim(
+                db, claim_id, decision=decision, explanation=explanation, decided_at=decided_at,
+                idempotency_key=idempotency_key, fingerprint=fingerprint
+            )
+        decided_at = decided_at or datetime.now(timezone.utc)
+        await self._write(insert=dict(
+            claim_id=claim_id, status=ClaimStatus.DONE.value, decision=decision, explanation=explanation, error=None,
+            created_at=decided_at, completed_at=decided_at, idempotency_key=idempotency_key, fingerprint=fingerprint,
+        ))
+
+    async def create_rejected_claim(self, db, claim_id: str, error: str, decided_at: datetime = None):
+        if not self.running:
+            return await crud.create_rejected_claim(db, claim_id, error=error, decided_at=decided_at)
+        decided_at = decided_at or datetime.now(timezone.utc)
+        await self._write(insert=dict(
+            claim_id=claim_id, status=ClaimStatus.FAILED.value, decision=None, explanation=None, error=error,
+            created_at=decided_at, completed_at=decided_at, idempotency_key=None, fingerprint=None,
+        ))
+
+    async def complete_claim(self, db, claim_id: str, decision: str, explanation: str = None, usage=None):
+        if not self.running:
+            return await crud.complete_claim(db, claim_id, decision=decision, explanation=explanation, usage=usage)
+        await self._write(
+            update=dict(b_claim_id=claim_id, status=ClaimStatus.DONE.value, decision=decision, explanation=explanation),
+            usage=crud.usage_values(claim_id, usage) if usage is not None else [],
+        )
+
+    async def fail_claim(self, db, claim_id: str, error: str):
+        if not self.running:
+            return await crud.fail_claim(db, claim_id, error=error)
+        await self._write(update=dict(b_claim_id=claim_id, status=ClaimStatus.FAILED.value, error=error))
+
+    async def _write(self, insert: dict = None, update: dict = None, usage: list = ()):
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append(_PendingWrite(insert, update, list(usage), future, start))
+        self._wakeup.set()
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+        try:
+            await asyncio.shield(future)
+        finally:
+            # Time from the call to the commit of its batch, in the claim trace as well
+            record_span("db.write_behind", start)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if self._buffer and len(self._buffer) < self.batch_size and not self._stopping:
+                wait = self._buffer[0].enqueued_at + self.flush_interval - time.perf_counter()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            if len(self._buffer) < self.batch_size:
+                self._full.clear()
+            if not self._buffer and not self._stopping:
+                self._wakeup.clear()
+            if batch:
+                await self._flush(batch)
+            if self._stopping and not self._buffer:
+                return
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
+        error = None
+        try:
+            async with async_session() as db:
+                await crud.write_claim_batch(
+                    db,
+                    inserts=[write.insert for write in batch if write.insert is not None],
+                    updates=[write.update for write in batch if write.update is not None],
+                    usage=[row for write in batch for row in write.usage],
+                )
+        except Exception as e:
+            error = e
+            self.failed_batches += 1
+            logger.error(f"Batch of {len(batch)} claim writes failed, retrying them one by one: {e}", exc_info=True)
+            await self._flush_each(batch)
+        else:
+            for write in batch:
+                if not write.future.done():
+                    write.future.set_result(None)
+
+        stage_metrics.observe("write_behind_flush_seconds", (), time.perf_counter() - start, error=error is not None)
+        self.flushes += 1
+        self.rows += len(batch)
+
+    async def _flush_each(self, batch: list):
+        for write in batch:
+            try:
+                async with async_session() as db:
+                    await crud.write_claim_batch(
+                        db,
+                        inserts=[write.insert] if write.insert is not None else [],
+                        updates=[write.update] if write.update is not None else [],
+                        usage=write.usage,
+                    )
+            except Exception as e:
+                if not write.future.done():
+                    write.future.set_exception(e)
+            else:
+                if not write.future.done():
+                    write.future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "batched" if self.batched else "direct",
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "buffered": len(self._buffer),
+            "flushes": self.flushes,
+            "writes": self.rows,
+            "avg_batch": round(self.rows / self.flushes, 2) if self.flushes else None,
+            "failed_batches": self.failed_batches,
+        }
+
+
+decision_writer = DecisionWriter()
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+from dotenv import find_dotenv, load_dotenv
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+load_dotenv(find_dotenv())
+
+logger = logging.getLogger("src.utils.cassette")
+
+# off: live calls, record: live calls saved as cassettes, replay: cassettes only, no network
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "cassettes")
+# none: answer immediately, recorded: sleep the recorded latency, <seconds>: sleep a fixed latency
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "none").lower()
+LLM_REPLAY_LATENCY_SCALE = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", 1.0))
+
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+
+
+def normalize_request(request: httpx.Request) -> Tuple[str, List[str]]:
+    """
+    Key of a request: method, path and canonical JSON body (sorted keys) with every UUID
+    replaced by its order of appearance, since claim ids are new on every run.
+    Returns (key, UUIDs in order of appearance).
+    """
+    body = request.content.decode("utf-8", errors="replace")
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except ValueError:
+        pass
+
+    uuids = []
+    def placeholder(match):
+        value = match.group(0).lower()
+        if value not in uuids:
+            uuids.append(value)
+        return f"<uuid-{uuids.index(value)}>"
+
+    body = _UUID_RE.sub(placeholder, body)
+    key = hashlib.sha256(f"{request.method} {request.url.path}\n{body}".encode("utf-8")).hexdigest()
+    return key, uuids
+
+
+class Cassette:
+    """
+    Request/response recordings of model API calls, one JSON file per normalized request hash.
+
+    In replay mode the UUIDs of the recorded request are mapped, in order, to the ones of the
+    current request, so a tool call recorded for one claim id is replayed for the new one.
+    Only successful responses are recorded; a request without a recording is answered with 404.
+    """
+
+    def __init__(self, directory: str = LLM_CASSETTE_DIR, mode: str = LLM_CASSETTE_MODE,
+                 latency: str = LLM_REPLAY_LATENCY, latency_scale: float = LLM_REPLAY_LATENCY_SCALE):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, request: httpx.Request, response: httpx.Response, latency: float) -> None:
+        if not response.is_success:
+            return
+        key, uuids = normalize_request(request)
+        path = self._path(key)
+        entry = {
+            "request": {"method": request.method, "path": request.url.path, "uuids": uuids},
+            "response": {
+                "status_code": response.status_code,
+                "content_type": response.headers.get("content-type", "application/json"),
+                "body": response.text,
+            },
+            "latency": round(latency, 4),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.recorded += 1
+
+    def replay(self, request: httpx.Request) -> Tuple[httpx.Response, float]:
+        """(response, seconds to wait before answering)"""
+        key, uuids = normalize_request(request)
+        entry = self._load(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            logger.warning(f"No cassette for {request.method} {request.url.path} ({key})")
+            return httpx.Response(
+                404,
+                json={"error": {"message": f"No cassette recorded for request {key}", "type": "cassette_miss"}},
+                request=request
+            ), 0.0
+
+        body = entry["response"]["body"]
+        recorded_uuids = entry["request"]["uuids"]
+        if recorded_uuids:
+            mapping = dict(zip(recorded_uuids, uuids))
+            body = _UUID_RE.sub(lambda m: mapping.get(m.group(0).lower(), m.group(0)), body)
+
+        with self._lock:
+            self.replayed += 1
+        response = httpx.Response(
+            entry["response"]["status_code"],
+            headers={"content-type": entry["response"]["content_type"]},
+            content=body.encode("utf-8"),
+            request=request
+        )
+        return response, self._delay(entry)
+
+    def _delay(self, entry: dict) -> float:
+        if self.latency == "none":
+            return 0.0
+        if self.latency == "recorded":
+            return entry.get("latency", 0.0) * self.latency_scale
+        return float(self.latency) * self.latency_scale
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "directory": self.directory,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+        }
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._transport = httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(request)
+            if delay:
+                time.sleep(delay)
+            return response
+
+        start = time.perf_counter()
+        response = self._transport.handle_request(request)
+        response.read()
+        if self.cassette.recording:
+            self.cassette.save(request, response, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self._transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.cassette.mode == "replay":
+            response, delay = self.cassette.replay(request)
+            if delay:
+                await asyncio.sleep(delay)
+            return response
+
+        start = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        await response.aread()
+        if self.cassette.recording:
+            self.cassette.save(request, response, time.perf_counter() - start)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+cassette = Cassette()
+
+
+def cassette_transport() -> Optional[CassetteTransport]:
+    return None if cassette.mode == "off" else CassetteTransport(cassette)
+
+
+def async_cassette_transport() -> Optional[AsyncCassetteTransport]:
+    return None if cassette.mode == "off" else AsyncCassetteTransport(cassette)
+
+
+def cassette_http_client() -> Optional[httpx.Client]:
+    """HTTP client for a sync OpenAI client, or None (SDK default) when cassettes are off"""
+    transport = cassette_transport()
+    return DefaultHttpxClient(transport=transport) if transport is not None else None
+
+
+def cassette_async_http_client() -> Optional[httpx.AsyncClient]:
+    """HTTP client for an async OpenAI client, or None (SDK default) when cassettes are off"""
+    transport = async_cassette_transport()
+    return DefaultAsyncHttpxClient(transport=transport) if transport is not None else None
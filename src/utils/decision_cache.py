@@ -0,0 +1,139 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from .cache import LRUCache
+from .schemas import ClaimStatus, ClaimStatusResponse
+
+logger = logging.getLogger("src.utils.decision_cache")
+
+DECISION_CACHE_ENABLED = os.getenv("DECISION_CACHE_ENABLED", "True").lower() == "true"
+DECISION_CACHE_MAX_ENTRIES = int(os.getenv("DECISION_CACHE_MAX_ENTRIES", 10000))
+DECISION_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("DECISION_CACHE_NEGATIVE_TTL_SECONDS", 2))
+# Optional shared backend (redis://host:6379/0) so API workers share entries; requires the redis
+# package, which is not installed by default (pip install -r requirements_redis.txt)
+DECISION_CACHE_REDIS_URL = os.getenv("DECISION_CACHE_REDIS_URL", "")
+DECISION_CACHE_REDIS_TTL_SECONDS = int(os.getenv("DECISION_CACHE_REDIS_TTL_SECONDS", 86400))
+
+# Claims in these states never change again and can be cached for good; FAILED is left out
+# because a dead-lettered claim can be requeued and run again
+FINAL_STATUSES = {ClaimStatus.DONE}
+
+NOT_FOUND = object()
+
+
+class DecisionStore(ABC):
+    """Shared second-level store for decision cache entries (JSON of a ClaimStatusResponse)"""
+
+    @abstractmethod
+    async def get(self, claim_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set(self, claim_id: str, value: str) -> None:
+        ...
+
+
+class RedisDecisionStore(DecisionStore):
+    def __init__(self, url: str, ttl_seconds: int = DECISION_CACHE_REDIS_TTL_SECONDS, prefix: str = "claims:decision:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            logger.error("DECISION_CACHE_REDIS_URL is set but the redis package is not installed (pip install -r requirements_redis.txt)")
+            raise e
+        self._client = redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, claim_id: str) -> Optional[str]:
+        value = await self._client.get(self.prefix + claim_id)
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    async def set(self, claim_id: str, value: str) -> None:
+        await self._client.set(self.prefix + claim_id, value, ex=self.ttl_seconds)
+
+
+class DecisionCache:
+    """
+    Read-through cache of finished claims for GET /claims/{claim_id}.
+
+    Only DONE claims are cached, as they are never updated again. Lookups go to an
+    in-process LRU, then to the optional shared store, then to the database; unknown ids are
+    remembered for negative_ttl seconds so repeated polls of a bad id do not reach the database.
+    Shared store errors are logged and treated as misses.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DECISION_CACHE_MAX_ENTRIES,
+        negative_ttl: float = DECISION_CACHE_NEGATIVE_TTL_SECONDS,
+        shared: Optional[DecisionStore] = None,
+        enabled: bool = DECISION_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.negative_ttl = negative_ttl
+        self.shared = shared
+        self._local = LRUCache(max_entries=max_entries)
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self.negative_hits = 0
+
+    async def get(self, claim_id: str):
+        """The cached ClaimStatusResponse, NOT_FOUND for a recently unknown id, or None on a miss"""
+        if not self.enabled:
+            return None
+        entry = self._local.get(claim_id)
+        if entry is NOT_FOUND:
+            self.negative_hits += 1
+            return entry
+        if entry is not None or self.shared is None:
+            return entry
+
+        try:
+            value = await self.shared.get(claim_id)
+        except Exception as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared decision cache lookup failed for {claim_id}: {e}")
+            return None
+        if value is None:
+            return None
+        entry = ClaimStatusResponse.model_validate_json(value)
+        # Entries written before FAILED claims stopped being cached
+        if entry.status not in FINAL_STATUSES:
+            return None
+        self.shared_hits += 1
+        self._local.set(claim_id, entry)
+        return entry
+
+    async def put(self, claim: ClaimStatusResponse, local: bool = True):
+        """Cache a claim if it is final; returns whether it was cached. local=False only writes the shared store"""
+        if not self.enabled or claim.status not in FINAL_STATUSES:
+            return False
+        if local:
+            self._local.set(claim.claim_id, claim)
+        if self.shared is not None:
+            try:
+                await self.shared.set(claim.claim_id, claim.model_dump_json())
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"Shared decision cache write failed for {claim.claim_id}: {e}")
+        return True
+
+    def put_not_found(self, claim_id: str):
+        if self.enabled and self.negative_ttl > 0:
+            self._local.set(claim_id, NOT_FOUND, ttl_seconds=self.negative_ttl)
+
+    def stats(self) -> dict:
+        stats = self._local.stats()
+        stats.update({
+            "enabled": self.enabled,
+            "negative_hits": self.negative_hits,
+            "shared": type(self.shared).__name__ if self.shared is not None else None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        })
+        return stats
+
+
+decision_cache = DecisionCache(shared=RedisDecisionStore(DECISION_CACHE_REDIS_URL) if DECISION_CACHE_REDIS_URL else None)
@@ -1,3 +1,4 @@
+import functools
 import json
 from typing import Any, Dict, List
 
@@ -7,10 +8,17 @@ import seaborn as sns
 from dotenv import find_dotenv, load_dotenv
 from openai import OpenAI
 
+from .rate_limiter import model_http_client, model_rate_limiter
+from .tracing import span
+
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
 
-client = OpenAI()
+
+@functools.lru_cache(maxsize=None)
+def _judge_client() -> OpenAI:
+    return OpenAI(http_client=model_http_client(), max_retries=model_rate_limiter.client_max_retries)
+
 
 def calculate_confusion_matrix(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
     decisions = ["APPROVE", "DENY", "UNCERTAIN"]
@@ -116,16 +124,17 @@ def evaluate_explanation_match(predicted_explanation: str, expected_explanation:
     """
     
     try:
-        response = client.responses.create(
-            model="gpt-5-mini",
-            instructions=SYSTEM_PROMPT_EXPLANATION_JUDGE,
-            input=[{
-                "role": "user",
-                "content": [{"type": "input_text", "text": query}],
-            }],
-            reasoning={"effort": "low"},
-            text={"verbosity": "low"},
-        )
+        with span("judge.model_call"):
+            response = _judge_client().responses.create(
+                model="gpt-5-mini",
+                instructions=SYSTEM_PROMPT_EXPLANATION_JUDGE,
+                input=[{
+                    "role": "user",
+                    "content": [{"type": "input_text", "text": query}],
+                }],
+                reasoning={"effort": "low"},
+                text={"verbosity": "low"},
+            )
         result = json.loads(response.output_text)
         return result
     except Exception as e:
@@ -0,0 +1,441 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from .cassette import (async_cassette_transport, cassette_async_http_client,
+                       cassette_http_client, cassette_transport)
+from .tracing import record_span, stage_metrics
+
+logger = logging.getLogger("src.utils.rate_limiter")
+
+MODEL_RATE_LIMIT_ENABLED = os.getenv("MODEL_RATE_LIMIT_ENABLED", "True").lower() == "true"
+# Account limits for this process, 0 for none (divide the account limits by the number of processes)
+MODEL_RPM_LIMIT = int(os.getenv("MODEL_RPM_LIMIT", 0))
+MODEL_TPM_LIMIT = int(os.getenv("MODEL_TPM_LIMIT", 0))
+# Concurrent model calls: starts at the initial value, grows by one per window of successful calls,
+# halves on a 429 and shrinks when latency rises above MODEL_LATENCY_TOLERANCE times its long-run average
+MODEL_CONCURRENCY_INITIAL = int(os.getenv("MODEL_CONCURRENCY_INITIAL", 16))
+MODEL_CONCURRENCY_MIN = int(os.getenv("MODEL_CONCURRENCY_MIN", 1))
+MODEL_CONCURRENCY_MAX = int(os.getenv("MODEL_CONCURRENCY_MAX", 64))
+MODEL_LATENCY_TOLERANCE = float(os.getenv("MODEL_LATENCY_TOLERANCE", 2.0))
+# Retries of 429 and 5xx answers, done here instead of by the OpenAI clients so they wait their turn
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", 4))
+MODEL_RETRY_BACKOFF_SECONDS = float(os.getenv("MODEL_RETRY_BACKOFF_SECONDS", 0.5))
+# Token estimate of a request before its usage is known: ~4 characters per token, plus these
+MODEL_IMAGE_TOKEN_ESTIMATE = int(os.getenv("MODEL_IMAGE_TOKEN_ESTIMATE", 800))
+MODEL_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("MODEL_OUTPUT_TOKEN_ESTIMATE", 1000))
+
+# Lanes in priority order: a waiting interactive call is always admitted before a batch one
+LANES = ("interactive", "batch")
+_LANE_PRIORITY = {lane: priority for priority, lane in enumerate(LANES)}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_DATA_URL_RE = re.compile(rb'data:image/[^"]*')
+_current_lane = contextvars.ContextVar("model_lane", default=LANES[0])
+
+
+@contextmanager
+def model_lane(lane: str):
+    """Run the model calls made in this context (and the tasks it starts) in a priority lane"""
+    if lane not in _LANE_PRIORITY:
+        raise ValueError(f"Unknown model lane: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def estimate_request_tokens(request: httpx.Request) -> int:
+    """Input tokens from the body size with images at a flat estimate, plus the expected output"""
+    body = request.content
+    images = len(_DATA_URL_RE.findall(body))
+    if images:
+        body = _DATA_URL_RE.sub(b"", body)
+    return len(body) // 4 + images * MODEL_IMAGE_TOKEN_ESTIMATE + MODEL_OUTPUT_TOKEN_ESTIMATE
+
+
+def _used_tokens(response: httpx.Response) -> Optional[int]:
+    try:
+        return json.loads(response.content)["usage"]["total_tokens"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass
+    return None
+
+
+class _Bucket:
+    """Token bucket refilled at per_minute / 60 per second, holding at most a minute's worth"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, cost: float, now: float) -> float:
+        """Seconds until cost can be taken; a cost above capacity only needs a full bucket"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(cost, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, cost: float, now: float):
+        if self.capacity:
+            self._refill(now)
+            self.level -= cost
+
+
+class _Waiter:
+    __slots__ = ("tokens", "granted", "cancelled", "timed", "_loop", "_future", "_event")
+
+    def __init__(self, tokens: int, loop: asyncio.AbstractEventLoop = None):
+        self.tokens = tokens
+        self.granted = False
+        self.cancelled = False
+        # Whether the waiter will poll again on its own, rather than only when woken
+        self.timed = True
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+        self._event = threading.Event() if loop is None else None
+
+    def grant(self):
+        self.granted = True
+        self.wake()
+
+    def wake(self):
+        if self._event is not None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait_async(self, timeout: Optional[float]):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        if not self.granted and self._future.done():
+            self._future = self._loop.create_future()
+
+    def wait_sync(self, timeout: Optional[float]):
+        self._event.wait(timeout)
+        if not self.granted:
+            self._event.clear()
+
+
+class ModelRateLimiter:
+    """
+    Process-wide admission control for model API calls, shared by the sync and async clients.
+
+    A call is admitted when fewer than `limit` calls are in flight, the requests/min and tokens/min
+    buckets have room for it and no 429 asked to pause; waiting calls are admitted in lane priority
+    order, first come first served within a lane. The concurrency limit adapts (AIMD): +1 per `limit`
+    successful calls, halved on a 429 (at most once per average call latency), and cut by 10% when the
+    recent latency exceeds latency_tolerance times the long-run average. Token usage is estimated
+    on admission and corrected with the usage reported in the response.
+    """
+
+    def __init__(
+        self,
+        rpm: int = MODEL_RPM_LIMIT,
+        tpm: int = MODEL_TPM_LIMIT,
+        initial_concurrency: int = MODEL_CONCURRENCY_INITIAL,
+        min_concurrency: int = MODEL_CONCURRENCY_MIN,
+        max_concurrency: int = MODEL_CONCURRENCY_MAX,
+        latency_tolerance: float = MODEL_LATENCY_TOLERANCE,
+        max_retries: int = MODEL_MAX_RETRIES,
+        retry_backoff: float = MODEL_RETRY_BACKOFF_SECONDS,
+        enabled: bool = MODEL_RATE_LIMIT_ENABLED,
+    ):
+        self.enabled = enabled
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.latency_tolerance = latency_tolerance
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._latency_recent = None
+        self._latency_baseline = None
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.decreases = 0
+
+    @property
+    def client_max_retries(self) -> int:
+        """max_retries for the OpenAI clients: retries are done here when the limiter is on"""
+        return 0 if self.enabled else 2
+
+    def _enqueue(self, waiter: _Waiter, lane: str) -> Optional[float]:
+        with self._lock:
+            heapq.heappush(self._waiters, (_LANE_PRIORITY[lane], next(self._sequence), waiter))
+            delay = self._grant_locked()
+            waiter.timed = delay is not None
+            return delay
+
+    def _grant_locked(self) -> Optional[float]:
+        """Admit waiters while there is room; seconds until the first one can be, if it waits on time only"""
+        now = time.monotonic()
+        while self._waiters:
+            waiter = self._waiters[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return None  # admitted on a release
+            wait = max(self._blocked_until - now, self._requests.wait(1, now), self._tokens.wait(waiter.tokens, now))
+            if wait > 0:
+                if not waiter.timed:
+                    # It waits for a release, which may never come while nothing is in flight
+                    waiter.wake()
+                return wait
+            heapq.heappop(self._waiters)
+            self._requests.take(1, now)
+            self._tokens.take(waiter.tokens, now)
+            self.in_flight += 1
+            waiter.grant()
+        return None
+
+    def _poll(self, waiter: _Waiter) -> Optional[float]:
+        with self._lock:
+            if waiter.granted:
+                return None
+            waiter.timed = True
+            delay = self._grant_locked()
+            waiter.timed = delay is not None
+            return delay
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            waiter.cancelled = True
+            if waiter.granted:
+                self.in_flight -= 1
+                self._grant_locked()
+
+    def _admitted(self, lane: str, start: float):
+        waited = time.perf_counter() - start
+        stage_metrics.observe("model_rate_limit_wait_seconds", (("lane", lane),), waited)
+        if waited > 0.001:
+            record_span("model.rate_limit_wait", start)
+
+    async def acquire(self, tokens: int, lane: str):
+        start = time.perf_counter()
+        waiter = _Waiter(tokens, asyncio.get_running_loop())
+        delay = self._enqueue(waiter, lane)
+        try:
+            while not waiter.granted:
+                await waiter.wait_async(delay)
+                delay = self._poll(waiter)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._admitted(lane, start)
+
+    def acquire_sync(self, tokens: int, lane: str):
+        start = time.perf_counter()
+        waiter = _Waiter(tokens)
+        delay = self._enqueue(waiter, lane)
+        try:
+            while not waiter.granted:
+                waiter.wait_sync(delay)
+                delay = self._poll(waiter)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._admitted(lane, start)
+
+    def release(self, response: Optional[httpx.Response], latency: float, tokens: int, attempt: int) -> Optional[float]:
+        """
+        Record the outcome of an admitted call and free its slot. Returns the seconds to wait before
+        retrying it, or None if the response (or the exception, when response is None) is final.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            retry = None
+            if response is None:
+                pass
+            elif response.status_code == 429:
+                self.throttled += 1
+                retry_after = _retry_after(response)
+                # One decrease per round trip: the 429s of calls already in flight describe the same overload
+                if now - self._last_decrease >= (self._latency_baseline or 1.0):
+                    self._decrease(0.5, now)
+                if retry_after is not None:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                retry = retry_after or 0.0
+            elif response.status_code in RETRY_STATUSES:
+                retry = 0.0
+            elif response.is_success:
+                used = _used_tokens(response)
+                if used is not None:
+                    self._tokens.take(used - tokens, now)
+                self._observe_latency(latency, now)
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._grant_locked()
+
+        if retry is None or attempt >= self.max_retries:
+            return None
+        self.retries += 1
+        # Exponential backoff with full jitter when the server did not say how long to wait
+        return retry if retry > 0 else random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    def _observe_latency(self, latency: float, now: float):
+        if self._latency_baseline is None:
+            self._latency_recent = self._latency_baseline = latency
+            return
+        self._latency_recent += 0.2 * (latency - self._latency_recent)
+        self._latency_baseline += 0.01 * (latency - self._latency_baseline)
+        if (
+            self._latency_recent > self.latency_tolerance * self._latency_baseline
+            and now - self._last_decrease >= self._latency_recent
+        ):
+            self._decrease(0.9, now)
+
+    def _decrease(self, factor: float, now: float):
+        self.limit = max(self.min_concurrency, self.limit * factor)
+        self._last_decrease = now
+        self.decreases += 1
+        logger.info(f"Model concurrency limit lowered to {int(self.limit)} ({self.in_flight} in flight)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            waiting = {lane: 0 for lane in LANES}
+            for priority, _, waiter in self._waiters:
+                if not waiter.cancelled and not waiter.granted:
+                    waiting[LANES[priority]] += 1
+            return {
+                "enabled": self.enabled,
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": waiting,
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "decreases": self.decreases,
+                "latency_recent_s": round(self._latency_recent, 3) if self._latency_recent is not None else None,
+                "latency_baseline_s": round(self._latency_baseline, 3) if self._latency_baseline is not None else None,
+                "rpm_available": round(self._requests.level, 1) if self._requests.capacity else None,
+                "tpm_available": round(self._tokens.level) if self._tokens.capacity else None,
+            }
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    def __init__(self, limiter: ModelRateLimiter, transport: httpx.BaseTransport):
+        self.limiter = limiter
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        lane = _current_lane.get()
+        tokens = estimate_request_tokens(request)
+        attempt = 0
+        while True:
+            self.limiter.acquire_sync(tokens, lane)
+            start = time.perf_counter()
+            try:
+                response = self._transport.handle_request(request)
+                response.read()
+            except BaseException:
+                self.limiter.release(None, time.perf_counter() - start, tokens, attempt)
+                raise
+            delay = self.limiter.release(response, time.perf_counter() - start, tokens, attempt)
+            if delay is None:
+                return response
+            response.close()
+            logger.warning(f"Model call answered {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, limiter: ModelRateLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        lane = _current_lane.get()
+        tokens = estimate_request_tokens(request)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(tokens, lane)
+            start = time.perf_counter()
+            try:
+                response = await self._transport.handle_async_request(request)
+                await response.aread()
+            except BaseException:
+                self.limiter.release(None, time.perf_counter() - start, tokens, attempt)
+                raise
+            delay = self.limiter.release(response, time.perf_counter() - start, tokens, attempt)
+            if delay is None:
+                return response
+            await response.aclose()
+            logger.warning(f"Model call answered {response.status_code}, retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+model_rate_limiter = ModelRateLimiter()
+
+
+def rate_limited_http_client(limiter: ModelRateLimiter = model_rate_limiter) -> httpx.Client:
+    return DefaultHttpxClient(transport=RateLimitedTransport(limiter, cassette_transport() or httpx.HTTPTransport()))
+
+
+def rate_limited_async_http_client(limiter: ModelRateLimiter = model_rate_limiter) -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(transport=AsyncRateLimitedTransport(limiter, async_cassette_transport() or httpx.AsyncHTTPTransport()))
+
+
+def model_http_client() -> Optional[httpx.Client]:
+    """HTTP client for a sync OpenAI client: cassettes if on, under the shared limiter if enabled; None for the SDK default"""
+    return rate_limited_http_client() if model_rate_limiter.enabled else cassette_http_client()
+
+
+def model_async_http_client() -> Optional[httpx.AsyncClient]:
+    """HTTP client for an async OpenAI client: cassettes if on, under the shared limiter if enabled; None for the SDK default"""
+    return rate_limited_async_http_client() if model_rate_limiter.enabled else cassette_async_http_client()
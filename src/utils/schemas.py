@@ -1,3 +1,4 @@
+from datetime import datetime
 from enum import Enum
 from typing import List, Optional
 
@@ -9,9 +10,54 @@ class ClaimDecision(str, Enum):
     APPROVE = "APPROVE"
     DENY = "DENY"
 
+class ClaimStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+class JobStatus(str, Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    DEAD = "DEAD"
+
 class ClaimDecisionResponse(BaseModel):
     decision : ClaimDecision
     explanation : Optional[str] = None
 
+class ClaimStatusResponse(BaseModel):
+    claim_id : str
+    status : ClaimStatus
+    decision : Optional[ClaimDecision] = None
+    explanation : Optional[str] = None
+    error : Optional[str] = None
+    created_at : Optional[datetime] = None
+    started_at : Optional[datetime] = None
+    completed_at : Optional[datetime] = None
+
 class ClaimsListResponse(BaseModel):
     claims : List[str]
+    next_cursor : Optional[str] = None
+
+class TokenUsage(BaseModel):
+    kind : Optional[str] = None
+    model : Optional[str] = None
+    calls : int = 0
+    input_tokens : int = 0
+    cached_tokens : int = 0
+    output_tokens : int = 0
+    reasoning_tokens : int = 0
+    image_tokens : int = 0
+    cost_usd : float = 0.0
+
+class ClaimUsageResponse(BaseModel):
+    claim_id : str
+    total : TokenUsage
+    by_kind : List[TokenUsage]
+
+class UsageSummaryResponse(BaseModel):
+    claims : int
+    total : TokenUsage
+    per_claim : TokenUsage
+    by_kind : List[TokenUsage]
@@ -0,0 +1,69 @@
+import threading
+
+
+class TimingStats:
+    """Running count / average / max of durations in seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg_seconds": round(self.total / self.count, 4) if self.count else None,
+                "max_seconds": round(self.max, 4),
+            }
+
+
+# Prometheus-style latency buckets in seconds, from cache hits to full ReAct loops
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, as exposed by Prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self):
+        """(cumulative counts per bucket bound, count, sum)"""
+        with self._lock:
+            cumulative = []
+            total = 0
+            for bound, count in zip(self.buckets, self.counts):
+                total += count
+                cumulative.append((bound, total))
+            return cumulative, self.count, self.sum
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-quantile, None without observations"""
+        cumulative, count, _ = self.snapshot()
+        if not count:
+            return None
+        for bound, total in cumulative:
+            if total >= q * count:
+                return bound
+        return float("inf")
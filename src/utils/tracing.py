@@ -0,0 +1,189 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+from .cache import LRUCache
+from .timing import Histogram
+
+logger = logging.getLogger("src.utils.tracing")
+
+TRACE_MAX_CLAIMS = int(os.getenv("TRACE_MAX_CLAIMS", 1000))
+TRACE_TTL_SECONDS = float(os.getenv("TRACE_TTL_SECONDS", 3600))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 500))
+
+
+class ClaimTrace:
+    """Timing spans recorded while one claim was submitted and processed"""
+
+    def __init__(self, claim_id: str):
+        self.claim_id = claim_id
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, stage: str, start: float, seconds: float, error: Optional[str] = None):
+        span = {
+            "stage": stage,
+            "offset_ms": round((start - self._start) * 1e3, 2),
+            "duration_ms": round(seconds * 1e3, 2),
+        }
+        if error:
+            span["error"] = error
+        with self._lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+            else:
+                self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["offset_ms"])
+            totals = defaultdict(float)
+            for span in spans:
+                totals[span["stage"]] += span["duration_ms"]
+            return {
+                "claim_id": self.claim_id,
+                "started_at": self.started_at,
+                "spans": spans,
+                "dropped_spans": self.dropped,
+                "total_ms_by_stage": {stage: round(ms, 2) for stage, ms in totals.items()},
+            }
+
+
+class StageMetrics:
+    """Per-stage duration histograms and error counts, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.errors = defaultdict(int)
+
+    def observe(self, metric: str, labels: tuple, seconds: float, error: bool = False):
+        key = (metric, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+        if error:
+            with self._lock:
+                self.errors[key] += 1
+
+    def summary(self) -> dict:
+        summary = {}
+        for (metric, labels), histogram in list(self.histograms.items()):
+            _, count, total = histogram.snapshot()
+            name = ",".join(f"{k}={v}" for k, v in labels)
+            summary.setdefault(metric, {})[name] = {
+                "count": count,
+                "avg_seconds": round(total / count, 4) if count else None,
+                "p50_le_seconds": histogram.quantile(0.5),
+                "p95_le_seconds": histogram.quantile(0.95),
+                "p99_le_seconds": histogram.quantile(0.99),
+                "errors": self.errors.get((metric, labels), 0),
+            }
+        return summary
+
+    def render_prometheus(self) -> str:
+        # Every series carries the pid of the process, as forked API workers each keep their own
+        worker = ("worker", str(os.getpid()))
+        by_metric = defaultdict(list)
+        for (metric, labels), histogram in list(self.histograms.items()):
+            by_metric[metric].append((labels, histogram))
+
+        lines = []
+        for metric in sorted(by_metric):
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in sorted(by_metric[metric], key=lambda item: item[0]):
+                label_text = ",".join(f'{k}="{v}"' for k, v in (*labels, worker))
+                prefix = f"{label_text}," if label_text else ""
+                cumulative, count, total = histogram.snapshot()
+                for bound, bucket_count in cumulative:
+                    lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+                lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {count}')
+                lines.append(f"{metric}_count{{{label_text}}} {count}")
+                lines.append(f"{metric}_sum{{{label_text}}} {total:.6f}")
+
+            errors = [(labels, self.errors[(m, labels)]) for (m, labels) in list(self.errors) if m == metric]
+            if errors:
+                lines.append(f"# TYPE {metric}_errors_total counter")
+                for labels, count in sorted(errors):
+                    label_text = ",".join(f'{k}="{v}"' for k, v in (*labels, worker))
+                    lines.append(f"{metric}_errors_total{{{label_text}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+claim_traces = LRUCache(max_entries=TRACE_MAX_CLAIMS, ttl_seconds=TRACE_TTL_SECONDS)
+_current_trace = contextvars.ContextVar("claim_trace", default=None)
+
+
+@contextmanager
+def claim_trace(claim_id: str):
+    """Attach the spans recorded in this context (and the tasks it starts) to the claim's trace"""
+    trace = claim_traces.get(claim_id)
+    if trace is None:
+        trace = ClaimTrace(claim_id)
+        claim_traces.set(claim_id, trace)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def get_claim_trace(claim_id: str) -> Optional[dict]:
+    trace = claim_traces.get(claim_id)
+    return trace.to_dict() if trace is not None else None
+
+
+def record_span(stage: str, start: float, error: Optional[str] = None, seconds: Optional[float] = None):
+    """Record a stage that started at perf_counter() value start and ends now, or lasted seconds"""
+    if seconds is None:
+        seconds = time.perf_counter() - start
+    stage_metrics.observe("stage_duration_seconds", (("stage", stage),), seconds, error=error is not None)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, start, seconds, error)
+    logger.debug(f"span stage={stage} duration_ms={seconds * 1e3:.2f} claim_id={trace.claim_id if trace else None} error={error}")
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into the stage_duration_seconds histogram and the current claim trace"""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record_span(stage, start, error)
+
+
+def timed(stage: str):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,104 @@
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("src.utils.usage")
+
+# USD per million tokens (gpt-5-mini list prices); image tokens are billed as input tokens
+TOKEN_PRICE_INPUT_PER_M = float(os.getenv("TOKEN_PRICE_INPUT_PER_M", 0.25))
+TOKEN_PRICE_CACHED_PER_M = float(os.getenv("TOKEN_PRICE_CACHED_PER_M", 0.025))
+TOKEN_PRICE_OUTPUT_PER_M = float(os.getenv("TOKEN_PRICE_OUTPUT_PER_M", 2.0))
+
+
+class TokenCounts(NamedTuple):
+    calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    reasoning_tokens: int = 0
+    image_tokens: int = 0
+
+    def __add__(self, other: "TokenCounts") -> "TokenCounts":
+        return TokenCounts(*(a + b for a, b in zip(self, other)))
+
+    @property
+    def cost_usd(self) -> float:
+        # Cached input tokens are part of input_tokens and billed at the cached rate
+        uncached = max(0, self.input_tokens - self.cached_tokens)
+        return (
+            uncached * TOKEN_PRICE_INPUT_PER_M
+            + self.cached_tokens * TOKEN_PRICE_CACHED_PER_M
+            + self.output_tokens * TOKEN_PRICE_OUTPUT_PER_M
+        ) / 1_000_000
+
+
+class ClaimUsage:
+    """Token counts of one claim, summed per (kind, model), e.g. ("agent", "gpt-5-mini")"""
+
+    def __init__(self, claim_id: str):
+        self.claim_id = claim_id
+        self._lock = threading.Lock()
+        self.rows: Dict[Tuple[str, str], TokenCounts] = {}
+
+    def add(self, kind: str, model: str, counts: TokenCounts):
+        with self._lock:
+            self.rows[(kind, model)] = self.rows.get((kind, model), TokenCounts()) + counts
+
+    def total(self) -> TokenCounts:
+        with self._lock:
+            return sum(self.rows.values(), TokenCounts())
+
+
+_current_usage = contextvars.ContextVar("claim_usage", default=None)
+
+
+@contextmanager
+def claim_usage(claim_id: str):
+    """Collect the token usage recorded in this context (and the tasks it starts) for a claim"""
+    usage = ClaimUsage(claim_id)
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def record_usage(kind: str, model: str, counts: TokenCounts):
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.add(kind, model, counts)
+    logger.debug(f"usage kind={kind} model={model} claim_id={usage.claim_id if usage else None} {counts._asdict()}")
+
+
+def counts_from_response_usage(usage, image_tokens: int = 0) -> TokenCounts:
+    """TokenCounts from the usage of an OpenAI Responses API response (None counts the call only)"""
+    if usage is None:
+        return TokenCounts(calls=1, image_tokens=image_tokens)
+    input_details = getattr(usage, "input_tokens_details", None)
+    output_details = getattr(usage, "output_tokens_details", None)
+    return TokenCounts(
+        calls=1,
+        input_tokens=usage.input_tokens or 0,
+        cached_tokens=getattr(input_details, "cached_tokens", 0) or 0,
+        output_tokens=usage.output_tokens or 0,
+        reasoning_tokens=getattr(output_details, "reasoning_tokens", 0) or 0,
+        image_tokens=image_tokens,
+    )
+
+
+def counts_from_usage_metadata(usage_metadata: Optional[dict]) -> TokenCounts:
+    """TokenCounts from the usage_metadata LangChain attaches to an AIMessage"""
+    if not usage_metadata:
+        return TokenCounts(calls=1)
+    input_details = usage_metadata.get("input_token_details") or {}
+    output_details = usage_metadata.get("output_token_details") or {}
+    return TokenCounts(
+        calls=1,
+        input_tokens=usage_metadata.get("input_tokens", 0) or 0,
+        cached_tokens=input_details.get("cache_read", 0) or 0,
+        output_tokens=usage_metadata.get("output_tokens", 0) or 0,
+        reasoning_tokens=output_details.get("reasoning", 0) or 0,
+    )
@@ -1,8 +1,38 @@
+import asyncio
 import base64
+import functools
+import logging
+from io import BytesIO
+from typing import Tuple, Union
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from PIL import Image
+
+from src.minio.imaging import estimate_image_tokens
+
+from .cassette import cassette
+from .rate_limiter import (model_async_http_client, model_http_client,
+                           model_rate_limiter)
+from .tracing import span
+from .usage import counts_from_response_usage, record_usage
+from .vision_cache import vision_cache
+
+logger = logging.getLogger("src.utils.vision_analyzer")
+
+# Base64 characters decoded to read the image dimensions (48 KB of image data, a multiple of 4)
+IMAGE_HEADER_BASE64_CHARS = 65536
+
+
+# Clients are built on first use, after API workers have forked
+@functools.lru_cache(maxsize=None)
+def get_client() -> OpenAI:
+    return OpenAI(http_client=model_http_client(), max_retries=model_rate_limiter.client_max_retries)
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(http_client=model_async_http_client(), max_retries=model_rate_limiter.client_max_retries)
 
-client = OpenAI()
 
 SYSTEM_PROMPT_OCR = """
 You are a document information extraction assistant. Your sole purpose is to extract and report textual information from documents.
@@ -29,29 +59,109 @@ Do not evaluate authenticity - only extract information objectively.
 def encode_image(image_bytes: bytes) -> str:
     return base64.b64encode(image_bytes).decode("utf-8")
 
-def query_image_ocr(image: bytes, query: str):
 
-    image_b64 = encode_image(image)
-    
-    response = client.responses.create(
+def image_data_url(image_bytes: bytes) -> str:
+    return f"data:image/webp;base64,{encode_image(image_bytes)}"
+
+
+# `image` is either the raw WebP bytes or an already encoded data URL
+def _build_request(instructions: str, image: Union[bytes, str], query: str) -> dict:
+    image_url = image if isinstance(image, str) else image_data_url(image)
+    return dict(
         model="gpt-5-mini",
-        instructions=SYSTEM_PROMPT_OCR,
+        instructions=instructions,
         input=[{
                 "role": "user",
                 "content": [
                     {"type": "input_text", "text": query},
                     {
                         "type": "input_image",
-                        "image_url": f"data:image/webp;base64,{image_b64}",
+                        "image_url": image_url,
                     },
                 ],
             }],
         reasoning={ "effort": "low" },
         text={ "verbosity": "low" },
     )
+
+
+def _image_size(data: str) -> Tuple[int, int]:
+    with Image.open(BytesIO(base64.b64decode(data))) as image:
+        return image.size
+
+
+def _estimated_image_tokens(image_url: str) -> int:
+    # The API doesn't report image tokens separately. Only the start of the payload is decoded,
+    # which holds the header with the dimensions; the whole image only if the header lies further in
+    data = image_url.split(",", 1)[1]
+    try:
+        try:
+            size = _image_size(data[:IMAGE_HEADER_BASE64_CHARS])
+        except Exception:
+            if len(data) <= IMAGE_HEADER_BASE64_CHARS:
+                raise
+            size = _image_size(data)
+        return estimate_image_tokens(*size)
+    except Exception as e:
+        logger.debug(f"Could not estimate image tokens: {e}")
+        return 0
+
+
+def _record_usage(stage: str, request: dict, response):
+    image_url = request["input"][0]["content"][1]["image_url"]
+    record_usage(stage, request["model"], counts_from_response_usage(response.usage, _estimated_image_tokens(image_url)))
+
+
+def _cache_key(request: dict) -> str:
+    content = request["input"][0]["content"]
+    return vision_cache.make_key(request["model"], request["instructions"], content[1]["image_url"], content[0]["text"])
+
+
+# Answers are served from the content-addressed cache when the same image,
+# query and system prompt were already sent to the model. While recording
+# cassettes the cache is skipped so that every call reaches the model and is recorded.
+def _cached(key: str):
+    return None if cassette.recording else vision_cache.get(key)
+
+
+async def _acached(key: str):
+    return None if cassette.recording else await vision_cache.aget(key)
+
+
+def _query(instructions: str, image: Union[bytes, str], query: str, stage: str = "vision.model_call") -> str:
+    request = _build_request(instructions, image, query)
+    key = _cache_key(request)
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+    with span(stage):
+        response = get_client().responses.create(**request)
+    _record_usage(stage, request, response)
+    vision_cache.set(key, response.output_text)
     return response.output_text
 
 
+async def _aquery(instructions: str, image: Union[bytes, str], query: str, stage: str = "vision.model_call") -> str:
+    request = _build_request(instructions, image, query)
+    key = _cache_key(request)
+    cached = await _acached(key)
+    if cached is not None:
+        return cached
+    with span(stage):
+        response = await get_async_client().responses.create(**request)
+    _record_usage(stage, request, response)
+    await vision_cache.aset(key, response.output_text)
+    return response.output_text
+
+
+def query_image_ocr(image: Union[bytes, str], query: str):
+    return _query(SYSTEM_PROMPT_OCR, image, query, stage="vision.ocr")
+
+
+async def aquery_image_ocr(image: Union[bytes, str], query: str):
+    return await _aquery(SYSTEM_PROMPT_OCR, image, query, stage="vision.ocr")
+
+
 SYSTEM_PROMPT_FORGERY = """
 You are a document forensics specialist focused on detecting fraudulent or altered medical documents in insurance claims.
 
@@ -109,24 +219,23 @@ Be conservative - err on the side of LEGITIMATE unless you see CLEAR fraud indic
 """
 
 
-def query_image_forgery(image: bytes, query: str):
+def query_image_forgery(image: Union[bytes, str], query: str):
+    return _query(SYSTEM_PROMPT_FORGERY, image, query, stage="vision.forgery")
 
-    image_b64 = encode_image(image)
-    
-    response = client.responses.create(
-        model="gpt-5-mini",
-        instructions=SYSTEM_PROMPT_FORGERY,
-        input=[{
-                "role": "user",
-                "content": [
-                    {"type": "input_text", "text": query},
-                    {
-                        "type": "input_image",
-                        "image_url": f"data:image/webp;base64,{image_b64}",
-                    },
-                ],
-            }],
-        reasoning={ "effort": "low" },
-        text={ "verbosity": "low" },
-    )
-    return response.output_text
+
+async def aquery_image_forgery(image: Union[bytes, str], query: str):
+    return await _aquery(SYSTEM_PROMPT_FORGERY, image, query, stage="vision.forgery")
+
+
+async def aquery_document_analysis(image: Union[bytes, str], forgery_query: str, ocr_query: str) -> Tuple:
+    """
+    Run the forensic and the extraction queries on the same image concurrently.
+    Each element of the returned (forgery, ocr) pair is either the model answer or the exception raised.
+    """
+    if isinstance(image, bytes):
+        image = image_data_url(image)
+    return tuple(await asyncio.gather(
+        aquery_image_forgery(image, forgery_query),
+        aquery_image_ocr(image, ocr_query),
+        return_exceptions=True
+    ))
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger("src.utils.vision_cache")
+
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "True").lower() == "true"
+VISION_CACHE_DIR = os.getenv("VISION_CACHE_DIR", os.path.join(".cache", "vision"))
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+# The directory can be shared by several processes (API workers, queue workers), so the size counted
+# from this process's writes is corrected by re-scanning the directory at least this often
+VISION_CACHE_RESCAN_SECONDS = float(os.getenv("VISION_CACHE_RESCAN_SECONDS", 30))
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class VisionResultCache:
+    """
+    Content-addressed, on-disk cache of vision model answers.
+
+    Entries are keyed by model, system prompt hash, image content hash and normalized query,
+    stored one JSON file per key, and evicted least recently used first once the directory
+    grows past max_bytes (file mtime is bumped on every hit). The size is re-scanned every
+    rescan_seconds and always before evicting, so writes of other processes sharing the
+    directory count too. Async callers use aget/aset, which do the file I/O in a thread.
+    """
+
+    def __init__(
+        self,
+        directory: str = VISION_CACHE_DIR,
+        max_bytes: int = VISION_CACHE_MAX_BYTES,
+        enabled: bool = VISION_CACHE_ENABLED,
+        rescan_seconds: float = VISION_CACHE_RESCAN_SECONDS,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.rescan_seconds = rescan_seconds
+        self._lock = threading.Lock()
+        self._bytes = None  # computed lazily by scanning the directory
+        self._scanned_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, instructions: str, image_url: str, query: str) -> str:
+        return _sha256("\n".join([model, _sha256(instructions), _sha256(image_url), normalize_query(query)]))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _rescan(self) -> list:
+        entries = self._scan()
+        self._bytes = sum(size for _, size, _ in entries)
+        self._scanned_at = time.monotonic()
+        return entries
+
+    def _ensure_size(self):
+        if self._bytes is None or time.monotonic() - self._scanned_at > self.rescan_seconds:
+            self._rescan()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["output_text"]
+
+    def set(self, key: str, output_text: str) -> None:
+        if not self.enabled:
+            return
+        path = self._path(key)
+        data = json.dumps({"output_text": output_text, "created_at": time.time()})
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write vision cache entry {key}: {e}")
+            return
+        with self._lock:
+            if self._bytes is None or time.monotonic() - self._scanned_at > self.rescan_seconds:
+                self._rescan()
+            else:
+                self._bytes += len(data.encode("utf-8")) - previous
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    async def aget(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, output_text: str) -> None:
+        if self.enabled:
+            await asyncio.to_thread(self.set, key, output_text)
+
+    def _evict(self):
+        # The directory's actual size decides, not this process's count; drop the least
+        # recently used entries until the cache is back under 90% of its budget
+        entries = self._rescan()
+        if self._bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.enabled:
+                self._ensure_size()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "bytes": self._bytes or 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+vision_cache = VisionResultCache()